@@ -1,55 +1,310 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, send_from_directory, Response, g, abort
+from werkzeug.utils import safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import base64
+import contextlib
+import asyncio
 import os
 import tempfile
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 import time
 import re
+import threading
+import atexit
+import signal
+import sys
+import shutil
 from datetime import datetime
-from urllib.parse import urlparse
+from urllib.parse import urlsplit, urljoin, quote, unquote
+from urllib.request import url2pathname
 import json
+import uuid
+import contextvars
+import unicodedata
+import gzip
+import mimetypes
+from functools import wraps, lru_cache, partial
+from enum import IntEnum
 import zipfile
 import io
-from PIL import Image
+from PIL import Image, features as pil_features
 import io as image_io
 
 # Import Playwright for web scraping and screenshot capture
 try:
-    from playwright.sync_api import sync_playwright
+    from playwright.async_api import async_playwright
     PLAYWRIGHT_AVAILABLE = True
 except ImportError:
     PLAYWRIGHT_AVAILABLE = False
     print("Warning: Playwright not installed. Install with: pip install playwright")
 
-# Setup file logging
-def log_to_file(message):
-    """Write log message to file with timestamp"""
-    with open('debug.log', 'a', encoding='utf-8') as f:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        f.write(f"[{timestamp}] {message}\n")
-        f.flush()
+# orjson parses and serializes several times faster than the stdlib json module; used for
+# request and response bodies when installed (large /download-zip payloads benefit most)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# JPEG encoding is the CPU hot spot; official Pillow wheels link SIMD libjpeg-turbo, some distro builds don't
+if not pil_features.check_feature('libjpeg_turbo'):
+    print("Warning: Pillow is built without libjpeg-turbo; JPEG encodes will be slower. Install the Pillow wheel with: pip install --force-reinstall Pillow")
+
+# Setup file logging: debug.log lines are queued and written by a listener thread, so callers never wait on disk I/O
+_debug_log_queue = queue.SimpleQueue()
+_debug_logger = logging.getLogger('debug_log')
+_debug_logger.setLevel(logging.DEBUG)
+_debug_logger.propagate = False
+_debug_logger.addHandler(QueueHandler(_debug_log_queue))
+_debug_log_lock = threading.Lock()
+_debug_log_pid = None
+
+def _start_debug_log_listener():
+    """Start this process's debug.log writer; started lazily because threads don't survive gunicorn's fork"""
+    global _debug_log_pid
+    with _debug_log_lock:
+        if _debug_log_pid == os.getpid():
+            return
+        file_handler = logging.FileHandler('debug.log', encoding='utf-8', delay=True)
+        file_handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+        listener = QueueListener(_debug_log_queue, file_handler)
+        listener.start()
+        # Drain whatever is still queued before the process exits
+        atexit.register(listener.stop)
+        _debug_log_pid = os.getpid()
+
+# Bytes of each POST body echoed to the request log; batch and ZIP bodies carry whole base64 images
+_LOG_BODY_PREVIEW_BYTES = 512
+# Only JSON bodies up to this size are read for the preview; larger ones and uploads are logged by size
+# alone, so the hook never buffers a big body ahead of the handler
+_LOG_BODY_MAX_BYTES = 64 * 1024
+
+def log_to_file(message, echo=False):
+    """Queue a timestamped message for debug.log, and with echo also log it at INFO for the console"""
+    if _debug_log_pid != os.getpid():
+        _start_debug_log_listener()
+    _debug_logger.debug(message)
+    if echo:
+        logger.info("%s", message)
+
+# Request id of the HTTP request being served; contextvars follow it into run_async() coroutines
+_request_id = contextvars.ContextVar('request_id', default='-')
 
-# Setup logging to both file and console
+class RequestIdFilter(logging.Filter):
+    """Stamp every log record with the current request id"""
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line so log aggregators can index the fields"""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+# Setup logging to both file and console (LOG_FORMAT=json for structured output)
 log_file = 'banner_utility.log'
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+log_handlers = [
+    logging.FileHandler(log_file),
+    logging.StreamHandler()
+]
+for log_handler in log_handlers:
+    log_handler.addFilter(RequestIdFilter())
+    if os.environ.get('LOG_FORMAT') == 'json':
+        log_handler.setFormatter(JsonLogFormatter())
+    else:
+        log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=log_handlers)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='.')
 CORS(app)
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+if ORJSON_AVAILABLE:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson, keeping the default provider's sorted keys"""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default,
+                                option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode()
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+    
+    # request.get_json() and jsonify() both go through app.json
+    app.json = OrjsonProvider(app)
+
+# Per-request access lines are noise next to our own request logging
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+# Maximum number of captures driving Chromium at the same time in one process
+MAX_CONCURRENT_CAPTURES = int(os.environ.get('MAX_CONCURRENT_CAPTURES', 6))
+
+# Captures allowed to wait for a slot before new ones are shed with 429
+MAX_QUEUED = int(os.environ.get('MAX_QUEUED', 24))
+
+# Browser-bound requests per client per minute; 0 disables the limit
+RATE_LIMIT_PER_MINUTE = int(os.environ.get('RATE_LIMIT_PER_MINUTE', 120))
+
+# Reverse proxies in front of the app (e.g. 1 for the nginx in DEPLOYMENT.md). When set, the client
+# address is taken from that many X-Forwarded-For hops, so rate limits stay per client instead of
+# counting every request against the proxy's address. Leave at 0 when clients connect directly,
+# otherwise they could spoof the header
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# Format Chromium hands back from page.screenshot(); requesting it skips the JPEG re-encode
+NATIVE_SCREENSHOT_FORMAT = 'png'
+
+# PNG output re-encoding: 0 = as captured, 1 = optimize + lossless palette for flat
+# banners (<=256 colours), 2 = also quantize richer captures to 256 colours (lossy)
+PNG_QUALITY_LEVEL = int(os.environ.get('PNG_QUALITY_LEVEL', 1))
+# At level 1, captures already this small (KB) are sent as captured: the lossless re-encode
+# needs a full decode and optimize pass and saves little on them. Level 2 always quantizes
+PNG_OPTIMIZE_MIN_KB = int(os.environ.get('PNG_OPTIMIZE_MIN_KB', 39))
+
+# Browsers kept warm per process, and how many requests each serves before a relaunch
+BROWSER_POOL_SIZE = int(os.environ.get('POOL_SIZE', 4))
+MAX_USES_PER_INSTANCE = int(os.environ.get('MAX_USES_PER_INSTANCE', 50))
+# Requests served by each browser's long-lived context before it is replaced, bounding leaks
+MAX_PAGES_PER_CONTEXT = int(os.environ.get('MAX_PAGES_PER_CONTEXT', 20))
+# Seconds an idle browser keeps its context before the reaper closes it to release memory
+CONTEXT_IDLE_TIMEOUT = int(os.environ.get('CONTEXT_IDLE_TIMEOUT', 300))
+# Iframe URLs loaded at once when a banner's hoxton data has to be read from its iframes
+MAX_IFRAME_PROBES = int(os.environ.get('MAX_IFRAME_PROBES', 3))
+# page.goto budget in ms; navigation waits for the load event, so a banner's images, fonts and frames are in
+NAVIGATION_TIMEOUT_MS = int(os.environ.get('NAVIGATION_TIMEOUT_MS', 15000))
+# Further ms allowed for the network to go quiet and web fonts to finish after load; pages with
+# long-poll telemetry never go idle, so this caps what networkidle alone would wait for
+NETWORK_IDLE_GRACE_MS = int(os.environ.get('NETWORK_IDLE_GRACE_MS', 3000))
+
+# When set (e.g. http://127.0.0.1:9222), workers attach to a shared Chromium sidecar
+# (see start_browser_sidecar.sh) instead of launching their own browsers
+CDP_ENDPOINT = os.environ.get('CDP_ENDPOINT')
+
+# Seconds a worker may spend warming its browser pool at boot before /ready reports it unhealthy
+WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT', 60))
+# Seconds a request thread waits on its Playwright work before giving up and cancelling it
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 120))
+
+# Seconds a remote URL's capture with identical settings is answered from cache; 0 disables caching
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 128))
+
+# gzip JSON/text bodies at least this large; images and ZIP streams go out untouched
+COMPRESS_MIN_SIZE = 256
+_COMPRESS_MIMETYPES = frozenset({'application/json', 'text/plain', 'text/html'})
+
+# Behind nginx, set to an internal location aliased to the app directory (e.g. /_static/) and
+# static files are handed to nginx's sendfile via X-Accel-Redirect instead of a worker thread
+STATIC_ACCEL_PREFIX = os.environ.get('STATIC_ACCEL_PREFIX')
+
+# Request validation limits, built once instead of per request
+_ALLOWED_FORMATS = frozenset({'png', 'jpg', 'jpeg', 'webp'})
+_MIN_DIM, _MAX_DIM = 100, 3000
+_MIN_WAIT, _MAX_WAIT = 1, 30
+# A scheme followed by a non-empty host, i.e. what urlsplit() reports as scheme and netloc
+_URL_WITH_HOST_RE = re.compile(r'[a-z][a-z0-9+.-]*://[^/?#]', re.I)
+
+# Analytics/tracking hosts aborted on every pooled context: they never change what a banner
+# looks like, but their beacons and polling hold off networkidle. Matched inside the Playwright
+# driver, so other requests are not routed through Python at all
+_TRACKER_URL_PATTERN = re.compile(
+    r'^https?://([^/?#]*\.)?('
+    r'google-analytics\.com|analytics\.google\.com|googletagmanager\.com|connect\.facebook\.net|'
+    r'hotjar\.com|clarity\.ms|segment\.io|cdn\.segment\.com|mixpanel\.com|nr-data\.net|'
+    r'scorecardresearch\.com|quantserve\.com'
+    r')(:\d+)?[/?#]'
+)
+
+async def _abort_route(route):
+    await route.abort()
+
+# Site storage wiped for every origin a pooled context's pages visited before the context serves the next
+# request; cookies are cleared separately and sessionStorage goes with the closed pages
+_CLEARED_STORAGE_TYPES = 'local_storage,indexeddb,cache_storage,service_workers,websql,file_systems'
 
-def optimize_image_to_jpg(image_data, max_size_kb=39, min_quality=60, max_quality=95):
+def _track_storage_origins(page, origins):
+    """Record the http(s) origin of every document page or its frames load into origins"""
+    def on_frame_navigated(frame):
+        parts = urlsplit(frame.url)
+        if parts.scheme in ('http', 'https'):
+            origins.add(f'{parts.scheme}://{parts.netloc}')
+    page.on('framenavigated', on_frame_navigated)
+
+# Resource types /debug-dimensions does not download on its first pass: they don't size the container divs
+_LAYOUT_ONLY_BLOCKED_TYPES = frozenset({'image', 'media', 'font'})
+
+async def _layout_only_route(route):
+    if route.request.resource_type in _LAYOUT_ONLY_BLOCKED_TYPES:
+        await route.abort()
+    else:
+        # Hand everything else to the context's routes (tracker blocking)
+        await route.fallback()
+
+# All Playwright work runs on a single background event loop so the synchronous
+# Flask handlers can share it and batch requests can fan out with asyncio.gather
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+def get_event_loop():
+    """Return the background event loop that drives Playwright, starting it on first use"""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name='playwright-loop', daemon=True).start()
+    return _event_loop
+
+def run_async(coro, timeout=None):
+    """Run a coroutine on the Playwright event loop and block until it finishes or timeout (default REQUEST_TIMEOUT) passes"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        return future.result(REQUEST_TIMEOUT if timeout is None else timeout)
+    except TimeoutError:
+        # Cancel the coroutine too, so its finally blocks hand back the slot and browser it holds
+        future.cancel()
+        raise
+
+# Rough JPEG bytes per pixel by quality, to seed the quality search; debug.log records
+# estimate vs actual so the table can be recalibrated
+_JPEG_BYTES_PER_PIXEL = ((30, 0.05), (50, 0.10), (70, 0.18), (85, 0.35), (95, 0.7))
+
+def _estimate_jpeg_size(pixels, quality):
+    """Predicted JPEG size in bytes, interpolating _JPEG_BYTES_PER_PIXEL"""
+    points = _JPEG_BYTES_PER_PIXEL
+    if quality <= points[0][0]:
+        return pixels * points[0][1]
+    for (q0, b0), (q1, b1) in zip(points, points[1:]):
+        if quality <= q1:
+            return pixels * (b0 + (b1 - b0) * (quality - q0) / (q1 - q0))
+    return pixels * points[-1][1]
+
+def _composite_on_white(image):
+    """Convert to RGB for JPG, flattening any transparency onto a white background"""
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA'):
+        # An RGBA/LA mask is read through its alpha band directly, so nothing is split out
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image)
+        image = background
+    return image
+
+def optimize_image_to_jpg(image_data, max_size_kb=39, min_quality=60, max_quality=95, image=None, allow_resize=True,
+                          out_buf=None):
     """
     Convert image data to JPG format and optimize to stay under size limit
     Enhanced to preserve text quality better
@@ -59,46 +314,77 @@ def optimize_image_to_jpg(image_data, max_size_kb=39, min_quality=60, max_qualit
         max_size_kb: Maximum file size in KB (default: 39)
         min_quality: Minimum JPG quality to try (default: 60 - better for text)
         max_quality: Maximum JPG quality to start with (default: 95)
+        image: Already decoded PIL Image for image_data, skips a second decode (optional)
+        allow_resize: Downscale when even min_quality cannot reach the size limit (default: True)
+        out_buf: BytesIO to encode into; the JPEG is then returned as a memoryview over it
+            instead of a bytes copy. Must not have a live getbuffer() view (optional)
 
     Returns:
         tuple: (optimized_jpg_data, final_quality, final_size_kb)
     """
     try:
-        # Convert image data to PIL Image
-        image = Image.open(image_io.BytesIO(image_data))
-        
-        # Convert to RGB if necessary (for JPG compatibility)
-        if image.mode in ('RGBA', 'LA', 'P'):
-            # Create white background for transparency
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-            image = background
-        
-        # Try different quality levels to find optimal size
-        max_size_bytes = max_size_kb * 1024
-        best_quality = max_quality
-        best_data = None
+        # Decode and flatten onto white unless the caller already decoded it
+        if image is None:
+            image = _composite_on_white(Image.open(image_io.BytesIO(image_data)))
+        else:
+            image = _composite_on_white(image)
         
-        for quality in range(max_quality, min_quality - 1, -5):
-            output = image_io.BytesIO()
-            # Use subsampling=0 to preserve text sharpness
-            image.save(output, format='JPEG', quality=quality, optimize=True, subsampling=0)
-            jpg_data = output.getvalue()
-
-            if len(jpg_data) <= max_size_bytes:
-                best_quality = quality
-                best_data = jpg_data
-                break
+        max_size_bytes = max_size_kb * 1024
         
-        # If still too large, try with minimum quality
-        if best_data is None:
-            output = image_io.BytesIO()
-            # Use subsampling=0 to preserve text sharpness even at minimum quality
-            image.save(output, format='JPEG', quality=min_quality, optimize=True, subsampling=0)
-            best_data = output.getvalue()
-            best_quality = min_quality
+        # One buffer serves every trial encode; sizes come from tell() so nothing is copied
+        # until the winning quality is known, and not at all when the caller supplies the buffer
+        with image_io.BytesIO() if out_buf is None else contextlib.nullcontext(out_buf) as output:
+            def encode(quality, optimize=False):
+                output.seek(0)
+                output.truncate(0)
+                # Use subsampling=0 to preserve text sharpness
+                image.save(output, format='JPEG', quality=quality, optimize=optimize, subsampling=0)
+                return output.tell()
+            
+            # Most banners fit at full quality, so try that with the final settings first
+            best_quality = max_quality
+            if encode(max_quality, optimize=True) > max_size_bytes:
+                # File size grows with quality: binary search the usual 5-point steps for the
+                # highest quality that fits, ~3 encodes instead of walking down one step at a time.
+                # Trials skip the Huffman-optimization pass, which roughly doubles encode time;
+                # it only ever shrinks the file, so a quality that fits here still fits after the final encode
+                best_quality = None
+                qualities = list(range(max_quality, min_quality - 1, -5))
+                lo, hi = 1, len(qualities) - 1
+                # Seed the first probe with the highest quality predicted to fit
+                pixels = image.width * image.height
+                seed = mid = next((i for i in range(lo, hi + 1)
+                                   if _estimate_jpeg_size(pixels, qualities[i]) <= max_size_bytes), hi)
+                while lo <= hi:
+                    size = encode(qualities[mid])
+                    if mid == seed:
+                        estimate_kb = _estimate_jpeg_size(pixels, qualities[mid]) / 1024
+                        log_to_file(f"JPEG size estimate at {qualities[mid]}%: {estimate_kb:.1f}KB, actual {size / 1024:.1f}KB")
+                    if size <= max_size_bytes:
+                        best_quality = qualities[mid]
+                        hi = mid - 1
+                        # Within 2.5% of the limit, the next step up won't fit; stop searching
+                        if size >= max_size_bytes * 0.975:
+                            break
+                    else:
+                        lo = mid + 1
+                    mid = (lo + hi) // 2
+                
+                # If still too large, settle for minimum quality
+                if best_quality is None:
+                    best_quality = min_quality
+                    # Too many pixels for the limit: the last trial was min_quality, so its size
+                    # gives the area reduction needed. Fewer pixels at a decent quality look far
+                    # better than crushed full-size JPEG; don't go below 50% size for text
+                    if allow_resize:
+                        scale = max(0.5, (max_size_bytes / size) ** 0.5 * 0.95)
+                        new_size = (int(image.width * scale), int(image.height * scale))
+                        log_to_file(f"Target unreachable at {min_quality}% ({size / 1024:.1f}KB), downscaling to {new_size[0]}x{new_size[1]}")
+                        return optimize_image_to_jpg(None, max_size_kb, min_quality, max_quality,
+                                                     image=image.resize(new_size, Image.Resampling.LANCZOS),
+                                                     allow_resize=False, out_buf=out_buf)
+                encode(best_quality, optimize=True)
+            best_data = output.getvalue() if out_buf is None else out_buf.getbuffer()
         
         final_size_kb = len(best_data) / 1024
         
@@ -120,13 +406,7 @@ def ensure_size_limit(image_data, max_size_kb=39):
     
     # Apply extreme compression as last resort
     try:
-        image = Image.open(image_io.BytesIO(image_data))
-        if image.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
-            image = background
+        image = _composite_on_white(Image.open(image_io.BytesIO(image_data)))
         
         # Emergency compression - avoid going below 50% quality to preserve text
         # Try progressively lower quality until under limit, but not too low for text
@@ -156,119 +436,61 @@ def ensure_size_limit(image_data, max_size_kb=39):
         log_to_file(f"Emergency compression failed: {str(e)}")
         return image_data
 
-class BrowserPool:
-    """Manages a pool of browser instances for better performance"""
-    def __init__(self, pool_size=3):
-        self.pool_size = pool_size
-        self.available_browsers = []
-        self.in_use_browsers = []
-        self.playwright_instances = []
-        
-    def get_browser_context(self):
-        """Get or create a browser context from the pool"""
-        if not PLAYWRIGHT_AVAILABLE:
-            raise Exception("Playwright is not installed. Please install it with: pip install playwright")
-        
-            # Try to reuse an existing browser
-            if self.available_browsers:
-                browser_info = self.available_browsers.pop()
-                self.in_use_browsers.append(browser_info)
-
-                # Create new context on existing browser
-                context = browser_info['browser'].new_context(
-                    viewport={'width': 1920, 'height': 1080},
-                    device_scale_factor=2,  # 2x scaling for crisp text rendering
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
-                )
-                return browser_info['playwright'], browser_info['browser'], context        # Create new browser if pool not full
-        if len(self.in_use_browsers) < self.pool_size:
-            playwright = sync_playwright().start()
-            browser = playwright.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu',
-                    '--disable-extensions',
-                    '--disable-background-timer-throttling',
-                    '--disable-renderer-backgrounding',
-                    '--disable-backgrounding-occluded-windows',
-                    '--disable-features=TranslateUI',
-                    '--disable-ipc-flooding-protection',
-                    '--disable-web-security',  # Faster loading
-                    '--disable-features=VizDisplayCompositor'  # Reduce overhead
-                ]
-            )
-            
-            browser_info = {'playwright': playwright, 'browser': browser}
-            self.in_use_browsers.append(browser_info)
+def optimize_png(image, level=PNG_QUALITY_LEVEL):
+    """
+    Encode a captured screenshot as a compact PNG
 
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                device_scale_factor=2,  # 2x scaling for crisp text rendering
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
-            )
+    Args:
+        image: Decoded PIL Image of the screenshot
+        level: PNG_QUALITY_LEVEL setting (0, 1 or 2)
 
-            return playwright, browser, context
-        
-        # If pool is full, create temporary browser (fallback)
-        return self._create_temporary_browser()
+    Returns:
+        bytes: PNG data
+    """
+    output = image_io.BytesIO()
+    if level <= 0:
+        image.save(output, format='PNG')
+        return output.getvalue()
     
-    def return_browser(self, playwright, browser):
-        """Return a browser to the pool for reuse"""
-        browser_info = {'playwright': playwright, 'browser': browser}
-        
-        if browser_info in self.in_use_browsers:
-            self.in_use_browsers.remove(browser_info)
-            self.available_browsers.append(browser_info)
+    # Screenshots are opaque; drop a fully solid alpha channel so the image can be palettized
+    if image.mode == 'RGBA' and image.getchannel('A').getextrema() == (255, 255):
+        image = image.convert('RGB')
     
-    def _create_temporary_browser(self):
-        """Create a temporary browser (not pooled)"""
-        playwright = sync_playwright().start()
-        browser = playwright.chromium.launch(headless=True)
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            device_scale_factor=2,  # 2x scaling for crisp text rendering
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
-        )
-        return playwright, browser, context
+    if image.mode == 'RGB' and (level >= 2 or image.getcolors(maxcolors=256) is not None):
+        # Exact for flat banners with 256 colours or fewer, lossy beyond that
+        image = image.quantize(colors=256)
     
-    def cleanup(self):
-        """Clean up all browsers in the pool"""
-        for browser_info in self.available_browsers + self.in_use_browsers:
-            try:
-                browser_info['browser'].close()
-                browser_info['playwright'].stop()
-            except:
-                pass
-        self.available_browsers.clear()
-        self.in_use_browsers.clear()
+    image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
 
-# Global browser pool instance
-browser_pool = BrowserPool(pool_size=4)
+class ServerBusyError(Exception):
+    """Raised when the capture queue is full and new work should be shed"""
+    pass
 
-class ScreenshotService:
-    def __init__(self):
-        self.use_pool = True  # Enable browser pooling for better performance
-        
-    def get_browser_context(self):
-        """Get a browser context (using pool if enabled)"""
-        if self.use_pool:
-            return browser_pool.get_browser_context()
-        else:
-            # Fallback to old method
-            return self._create_fresh_browser_context()
-    
-    def _create_fresh_browser_context(self):
-        """Create a fresh browser context (legacy method)"""
-        if not PLAYWRIGHT_AVAILABLE:
-            raise Exception("Playwright is not installed. Please install it with: pip install playwright")
-            
-        # Create a fresh playwright instance for each request
-        playwright = sync_playwright().start()
-        
-        # Launch browser with optimized settings
-        browser = playwright.chromium.launch(
+class BrowserPool:
+    """Manages a pool of browser instances shared across requests"""
+    def __init__(self, pool_size=3, max_uses=50, cdp_endpoint=None, max_context_uses=20, context_idle_timeout=300):
+        self.pool_size = pool_size
+        self.max_uses = max_uses  # Relaunch a browser after this many requests
+        self.max_context_uses = max_context_uses  # Replace a browser's context after this many requests
+        self.context_idle_timeout = context_idle_timeout  # Close contexts left idle this many seconds
+        self._reaper = None
+        self.cdp_endpoint = cdp_endpoint  # Shared sidecar browser instead of local launches
+        self.available_browsers = asyncio.Queue()
+        self.in_use_browsers = {}  # id(browser) -> browser_info, for O(1) hand-back
+        self.playwright = None  # One Playwright driver serves every pooled browser
+        self.launched = 0
+        
+    async def _launch_browser(self):
+        """Launch a new pooled browser, starting the Playwright driver on first use"""
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+            if self.context_idle_timeout > 0:
+                self._reaper = asyncio.ensure_future(self._reap_idle_contexts())
+        if self.cdp_endpoint:
+            browser = await self._connect_over_cdp()
+            return {'playwright': self.playwright, 'browser': browser, 'uses': 0, 'context': None, 'context_uses': 0}
+        browser = await self.playwright.chromium.launch(
             headless=True,
             args=[
                 '--no-sandbox',
@@ -279,1956 +501,2092 @@ class ScreenshotService:
                 '--disable-renderer-backgrounding',
                 '--disable-backgrounding-occluded-windows',
                 '--disable-features=TranslateUI',
-                '--disable-ipc-flooding-protection'
+                '--disable-ipc-flooding-protection',
+                '--disable-web-security',  # Faster loading
+                '--disable-features=VizDisplayCompositor'  # Reduce overhead
             ]
         )
+        logger.info(f"🧭 Launched pooled browser ({self.launched}/{self.pool_size})")
+        return {'playwright': self.playwright, 'browser': browser, 'uses': 0, 'context': None, 'context_uses': 0}
+    
+    async def _connect_over_cdp(self, attempts=5):
+        """Attach to the shared Chromium sidecar, backing off while it starts up"""
+        delay = 0.5
+        for attempt in range(1, attempts + 1):
+            try:
+                browser = await self.playwright.chromium.connect_over_cdp(self.cdp_endpoint)
+                logger.info(f"🔌 Connected to shared browser at {self.cdp_endpoint}")
+                return browser
+            except Exception as e:
+                if attempt == attempts:
+                    raise Exception(f"Could not connect to browser at {self.cdp_endpoint}: {str(e)}")
+                logger.warning(f"CDP connection attempt {attempt} failed, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay *= 2
+    
+    async def acquire(self):
+        """Take a browser from the pool, launching one if the pool is not full yet"""
+        if self.available_browsers.empty() and self.launched < self.pool_size:
+            self.launched += 1
+            try:
+                browser_info = await self._launch_browser()
+            except Exception:
+                self.launched -= 1
+                raise
+        else:
+            # Pool is full - wait for another request to hand a browser back
+            browser_info = await self.available_browsers.get()
         
-        # Create a new context with optimized settings
-        context = browser.new_context(
+        # Recycle browsers that have served their quota or crashed
+        if browser_info['uses'] >= self.max_uses or not browser_info['browser'].is_connected():
+            logger.info(f"♻️ Recycling pooled browser after {browser_info['uses']} uses")
+            try:
+                await browser_info['browser'].close()
+            except Exception:
+                pass
+            try:
+                browser_info = await self._launch_browser()
+            except Exception:
+                self.launched -= 1
+                raise
+        
+        browser_info['uses'] += 1
+        self.in_use_browsers[id(browser_info['browser'])] = browser_info
+        return browser_info
+        
+    async def warm_up(self):
+        """Launch every pool member and render a blank page so the first real capture skips cold-start costs"""
+        while self.launched < self.pool_size:
+            self.launched += 1
+            try:
+                browser_info = await self._launch_browser()
+            except Exception:
+                self.launched -= 1
+                raise
+            try:
+                await self._replace_context(browser_info)
+                page = await browser_info['context'].new_page()
+                try:
+                    await page.goto('about:blank')
+                    await page.goto('data:text/html,<html><body></body></html>')
+                    await page.screenshot(type='png')
+                finally:
+                    await page.close()
+            finally:
+                # Hand the browser to the pool even if warming it failed; acquire() recycles dead ones
+                self.available_browsers.put_nowait(browser_info)
+    
+    async def _replace_context(self, browser_info):
+        """Give a pooled browser a new long-lived context, closing the old one"""
+        if browser_info['context'] is not None:
+            try:
+                await browser_info['context'].close()
+            except Exception:
+                pass
+            browser_info['context'] = None
+        browser_info['context'] = await browser_info['browser'].new_context(
             viewport={'width': 1920, 'height': 1080},
             device_scale_factor=2,  # 2x scaling for crisp text rendering
             user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
         )
+        await browser_info['context'].route(_TRACKER_URL_PATTERN, _abort_route)
+        await browser_info['context'].add_init_script(_PAGE_HELPERS_JS)
+        # Origins whose storage release_context() must clear before the context is reused
+        origins = browser_info['storage_origins'] = set()
+        browser_info['context'].on('page', partial(_track_storage_origins, origins=origins))
+        browser_info['context_uses'] = 0
+        browser_info['context_idle_since'] = time.monotonic()
+    
+    async def _reap_idle_contexts(self):
+        """Periodically close the contexts of browsers that have sat in the pool unused"""
+        while True:
+            await asyncio.sleep(max(self.context_idle_timeout / 4, 1))
+            now = time.monotonic()
+            idle = []
+            stale = []
+            while not self.available_browsers.empty():
+                idle.append(self.available_browsers.get_nowait())
+            for browser_info in idle:
+                if (browser_info['context'] is not None and
+                        now - browser_info.get('context_idle_since', now) > self.context_idle_timeout):
+                    stale.append(browser_info['context'])
+                    browser_info['context'] = None  # Recreated on the browser's next use
+                self.available_browsers.put_nowait(browser_info)
+            for context in stale:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            if stale:
+                logger.info(f"🧹 Closed {len(stale)} idle browser contexts")
+    
+    async def get_browser_context(self, pages=1):
+        """Get a pooled browser and its context; the caller has both to itself until release_context()"""
+        if not PLAYWRIGHT_AVAILABLE:
+            raise Exception("Playwright is not installed. Please install it with: pip install playwright")
         
-        return playwright, browser, context
-        
-    def capture_screenshot(self, url, width=None, height=None, format='png', wait_time=3):
-        """Capture screenshot of the given URL"""
-        playwright = None
-        browser = None
-        context = None
-        page = None
-        
+        browser_info = await self.acquire()
         try:
-            # Get fresh browser context for this request
-            playwright, browser, context = self.get_browser_context()
-            
-            # Create a new page
-            page = context.new_page()
-            
-            # Navigate to the URL first to get actual dimensions
-            logger.info(f"Navigating to: {url}")
-            page.goto(url, wait_until='networkidle', timeout=30000)
-            
-            # Wait for page to fully load including dynamic content
-            time.sleep(2)
-            
-            # First, let's do a simple check for Hoxton elements
-            hoxton_debug = page.evaluate("""
-                () => {
-                    const debug = {};
-                    
-                    // Check for any hoxton elements
-                    const hoxtonElements = document.querySelectorAll('hoxton');
-                    debug.hoxtonElementsFound = hoxtonElements.length;
-                    
-                    // Check for elements with data attributes
-                    const dataElements = document.querySelectorAll('[data]');
-                    debug.dataElementsFound = dataElements.length;
-                    
-                    // Check page source for 'hoxton' keyword
-                    debug.pageHasHoxtonText = document.documentElement.outerHTML.includes('hoxton');
-                    debug.pageHasReportingLabel = document.documentElement.outerHTML.includes('reportingLabel');
-                    
-                    // Get a sample of elements with data attributes
-                    debug.sampleDataElements = [];
-                    for (let i = 0; i < Math.min(5, dataElements.length); i++) {
-                        const el = dataElements[i];
-                        debug.sampleDataElements.push({
-                            tagName: el.tagName,
-                            className: el.className,
-                            id: el.id,
-                            dataAttrLength: el.getAttribute('data')?.length || 0
+            # Contexts are reused across requests and replaced every max_context_uses
+            if browser_info['context'] is None or browser_info['context_uses'] >= self.max_context_uses:
+                await self._replace_context(browser_info)
+        except Exception:
+            self.return_browser(browser_info['playwright'], browser_info['browser'])
+            raise
+        # A batch counts every page it will open, so max_context_uses still bounds pages per context
+        browser_info['context_uses'] += pages
+        return browser_info['playwright'], browser_info['browser'], browser_info['context']
+    
+    async def release_context(self, browser, context):
+        """Reset a request's context for the next request and return its browser to the pool"""
+        browser_info = self.in_use_browsers.get(id(browser))
+        try:
+            # Clear the site storage (localStorage, IndexedDB, ...) of every origin the request loaded, so
+            # state such as frequency caps can't change how the next capture renders
+            origins = browser_info.get('storage_origins') if browser_info is not None else None
+            if origins:
+                page = context.pages[0] if context.pages else await context.new_page()
+                cdp = await context.new_cdp_session(page)
+                try:
+                    for origin in origins:
+                        await cdp.send('Storage.clearDataForOrigin',
+                                       {'origin': origin, 'storageTypes': _CLEARED_STORAGE_TYPES})
+                finally:
+                    await cdp.detach()
+                origins.clear()
+            # Close the request's pages and drop its cookies; the context itself stays open
+            for page in list(context.pages):
+                await page.close()
+            await context.clear_cookies()
+            if browser_info is not None:
+                browser_info['context_idle_since'] = time.monotonic()
+        except Exception:
+            # Broken context - the next request on this browser gets a new one
+            if browser_info is not None:
+                browser_info['context'] = None
+            try:
+                await context.close()
+            except Exception:
+                pass
+        finally:
+            self.return_browser(None, browser)
+    
+    def return_browser(self, playwright, browser):
+        """Return a browser to the pool for reuse"""
+        browser_info = self.in_use_browsers.pop(id(browser), None)
+        if browser_info is not None:
+            self.available_browsers.put_nowait(browser_info)
+    
+    async def cleanup(self):
+        """Close every pooled browser and stop the Playwright driver"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        browsers = list(self.in_use_browsers.values())
+        while not self.available_browsers.empty():
+            browsers.append(self.available_browsers.get_nowait())
+        # Contexts must be closed explicitly on a shared sidecar browser, which outlives this worker
+        for browser_info in browsers:
+            if browser_info['context'] is not None:
+                try:
+                    await browser_info['context'].close()
+                except:
+                    pass
+        # A shared sidecar browser outlives this worker; stopping the driver just disconnects
+        if not self.cdp_endpoint:
+            for browser_info in browsers:
+                try:
+                    await browser_info['browser'].close()
+                except:
+                    pass
+        self.in_use_browsers.clear()
+        self.launched = 0
+        if self.playwright:
+            try:
+                await self.playwright.stop()
+            except:
+                pass
+            self.playwright = None
+
+# Global browser pool instance
+browser_pool = BrowserPool(pool_size=BROWSER_POOL_SIZE, max_uses=MAX_USES_PER_INSTANCE, cdp_endpoint=CDP_ENDPOINT,
+                           max_context_uses=MAX_PAGES_PER_CONTEXT, context_idle_timeout=CONTEXT_IDLE_TIMEOUT)
+
+# Page-info scripts for capture_screenshot, sent to the browser together in one evaluate round-trip
+_HOXTON_DEBUG_JS = """
+() => {
+    const debug = {};
+
+    // Check for any hoxton elements
+    const hoxtonElements = document.querySelectorAll('hoxton');
+    debug.hoxtonElementsFound = hoxtonElements.length;
+
+    // Check for elements with data attributes
+    const dataElements = document.querySelectorAll('[data]');
+    debug.dataElementsFound = dataElements.length;
+
+    // Look for hoxton markup and reportingLabel data in the DOM rather than serializing the whole page
+    debug.pageHasHoxton = !!document.querySelector('hoxton, HOXTON');
+    debug.reportingLabelElements = 0;
+    for (const el of dataElements) {
+        if (el.getAttribute('data').includes('reportingLabel') && ++debug.reportingLabelElements >= 5) break;
+    }
+    debug.pageHasReportingLabel = debug.reportingLabelElements > 0;
+
+    // Get a sample of elements with data attributes
+    debug.sampleDataElements = [];
+    for (let i = 0; i < Math.min(5, dataElements.length); i++) {
+        const el = dataElements[i];
+        debug.sampleDataElements.push({
+            tagName: el.tagName,
+            className: el.className,
+            id: el.id,
+            dataAttrLength: el.getAttribute('data')?.length || 0
+        });
+    }
+
+    return debug;
+}
+"""
+
+_PAGE_SOURCE_SAMPLE_JS = """
+() => {
+    const html = document.documentElement.outerHTML;
+    const hoxtonIndex = html.search(/hoxton/i);
+    if (hoxtonIndex !== -1) {
+        return html.substring(Math.max(0, hoxtonIndex - 100), hoxtonIndex + 500);
+    }
+    return 'No hoxton text found in page source';
+}
+"""
+
+_BANNER_INFO_JS = r"""
+() => {
+    // Try to find the banner container or body dimensions
+    const body = document.body;
+    const html = document.documentElement;
+    // Queried once; the hoxton scan, the name extraction and the size fallback all use it
+    const iframes = document.querySelectorAll('iframe');
+
+    // Raw hoxton data attributes, main document first then same-origin iframes;
+    // they are URL-decoded and parsed server-side
+    function collectHoxtonData() {
+        const items = [];
+        const addFrom = (doc, source) => {
+            for (const el of doc.querySelectorAll('hoxton[data]')) {
+                items.push({ source: source, data: el.getAttribute('data') });
+            }
+        };
+        addFrom(document, 'main-doc');
+        for (let i = 0; i < iframes.length; i++) {
+            try {
+                const iframeDoc = iframes[i].contentDocument || iframes[i].contentWindow?.document;
+                if (iframeDoc) addFrom(iframeDoc, `iframe-${i}`);
+            } catch (e) {
+                // Cross-origin iframes are fetched server-side from their URLs
+            }
+        }
+        return items;
+    }
+
+    // Banner name from non-hoxton sources; hoxton names take priority server-side
+    function extractBannerName() {
+        const debug = { attempts: [], found: null };
+
+        // Iframe URLs for server-side processing
+        debug.attempts.push(`Found ${iframes.length} iframes to check`);
+
+        const iframeUrls = [];
+        for (let i = 0; i < iframes.length; i++) {
+            if (iframes[i].src) {
+                iframeUrls.push(iframes[i].src);
+                debug.attempts.push(`Iframe ${i} src: ${iframes[i].src}`);
+            }
+        }
+        if (iframeUrls.length > 0) {
+            debug.iframeUrls = iframeUrls;
+        }
+
+        // Try other data attributes in main document
+        const dataBannerName = document.querySelector('[data-banner-name]')?.getAttribute('data-banner-name');
+        if (dataBannerName) {
+            debug.found = `data-banner-name: ${dataBannerName}`;
+            return { result: dataBannerName, debug };
+        }
+
+        const dataCreativeName = document.querySelector('[data-creative-name]')?.getAttribute('data-creative-name');
+        if (dataCreativeName) {
+            debug.found = `data-creative-name: ${dataCreativeName}`;
+            return { result: dataCreativeName, debug };
+        }
+
+        const dataName = document.querySelector('[data-name]')?.getAttribute('data-name');
+        if (dataName) {
+            debug.found = `data-name: ${dataName}`;
+            return { result: dataName, debug };
+        }
+
+        // Try page title (cleaned)
+        const title = document.title;
+        if (title && title !== 'Untitled' && title !== 'Banner' && title !== 'Preview' && title !== 'Share' && title.length > 3) {
+            debug.found = `page title: ${title}`;
+            return { result: title, debug };
+        }
+
+        debug.found = 'nothing found';
+        return { result: '', debug };
+    }
+
+    // Metadata from standard data attributes; hoxton metadata is merged in server-side
+    function extractMetadata() {
+        const meta = {};
+
+        // Try to get dimensions from standard data attributes
+        const dataWidth = document.querySelector('[data-width]')?.getAttribute('data-width');
+        const dataHeight = document.querySelector('[data-height]')?.getAttribute('data-height');
+        if (dataWidth && dataHeight) {
+            meta.dataWidth = parseInt(dataWidth);
+            meta.dataHeight = parseInt(dataHeight);
+        }
+
+        // Try to get format info
+        const format = document.querySelector('[data-format]')?.getAttribute('data-format') ||
+                     document.querySelector('[data-type]')?.getAttribute('data-type');
+        if (format) {
+            meta.format = format;
+        }
+
+        // Try to get campaign or client info
+        const campaign = document.querySelector('[data-campaign]')?.getAttribute('data-campaign');
+        const client = document.querySelector('[data-client]')?.getAttribute('data-client');
+        if (campaign) meta.campaign = campaign;
+        if (client) meta.client = client;
+
+        return meta;
+    }
+
+    // Look for common banner container selectors in order of priority
+    const containers = [
+        '#mainHolder', '#container', '#main', '#banner-container',
+        // Hoxton-specific selectors
+        '.creative-container', '.banner-frame', '.ad-frame', 
+        '[data-creative]', '[data-banner]', '.hoxton-banner',
+        // General selectors
+        'canvas', '.banner', '#banner', '.ad', '#ad', 
+        '.creative', '#creative', '.container', 'main',
+        'div[style*="width"]', 'div[style*="height"]',
+        '.banner-wrap', '.ad-wrap', '.creative-wrap',
+        // Frame/iframe content
+        'body > div:first-child', 'body > *:first-child'
+    ];
+
+    let bannerWidth = 0;
+    let bannerHeight = 0;
+    let detectionMethod = 'fallback';
+    let matchedSelector = null;
+
+    // Extract banner name and metadata
+    const bannerNameResult = extractBannerName();
+    const bannerName = bannerNameResult.result || bannerNameResult || '';
+    const bannerNameDebug = bannerNameResult.debug || null;
+    const metadata = extractMetadata();
+
+    // Special handling for Hoxton or other banner sharing platforms
+    const isHoxtonOrSimilar = window.location.hostname.includes('hoxton') || 
+                            document.querySelector('.creative-container, .banner-frame, [data-creative]');
+
+    const isBannerSized = (rect) => rect.width >= 120 && rect.height >= 120 && rect.width < 2000 && rect.height < 2000;
+
+    // Detection label for a candidate element and its pre-read rect, or null when it doesn't qualify
+    function classifyContainer(element, rect, isPriority) {
+        if (rect.width <= 0 || rect.height <= 0) return null;
+
+        // Banner-specific containers win outright; on sharing platforms only at a plausible banner size
+        if (isPriority && (!isHoxtonOrSimilar || isBannerSized(rect))) {
+            return { rect, method: isHoxtonOrSimilar ? 'banner platform priority' : 'banner container priority' };
+        }
+        if (!isBannerSized(rect)) return null;
+
+        // Computed style only picks the label, so it is read for the winning element alone
+        // rather than for every candidate
+        const computedStyle = window.getComputedStyle(element);
+        const cssWidth = computedStyle.width;
+        const cssHeight = computedStyle.height;
+        const hasCssDimensions = (cssWidth && cssWidth !== 'auto' && !cssWidth.includes('%')) ||
+                                 (cssHeight && cssHeight !== 'auto' && !cssHeight.includes('%'));
+        return { rect, method: hasCssDimensions ? 'CSS dimensions' : 'computed size' };
+    }
+
+    // One DOM traversal for every selector: group the matches by selector with matches(),
+    // keeping document order within each group, then try the groups in priority order
+    const candidates = Array.from(document.querySelectorAll(containers.join(',')));
+    const matchesBySelector = containers.map(() => []);
+    candidates.forEach((element, index) => {
+        containers.forEach((selector, i) => {
+            if (element.matches(selector)) matchesBySelector[i].push(index);
+        });
+    });
+
+    // Nothing here writes to the DOM, so layout is computed once; cache each candidate's rect
+    // so an element matching several selectors is measured only once too
+    const rects = new Array(candidates.length);
+    const rectOf = (index) => rects[index] || (rects[index] = candidates[index].getBoundingClientRect());
+
+    // Try to find a container with explicit dimensions
+    for (const [i, selector] of containers.entries()) {
+        const isPriority = /mainHolder|container|banner|creative|ad|hoxton/.test(selector);
+        let match = null;
+        for (const index of matchesBySelector[i]) {
+            match = classifyContainer(candidates[index], rectOf(index), isPriority);
+            if (match) break;
+        }
+        if (match) {
+            bannerWidth = Math.ceil(match.rect.width);
+            bannerHeight = Math.ceil(match.rect.height);
+            detectionMethod = `${selector} (${match.method})`;
+            matchedSelector = selector;
+            break;
+        }
+    }
+
+    // Special case: Look for the actual creative content on banner platforms
+    if ((bannerWidth === 0 || bannerHeight === 0) && isHoxtonOrSimilar) {
+        // Try to find iframe content or embedded content
+        const iframe = iframes[0];
+        if (iframe) {
+            const iframeRect = iframe.getBoundingClientRect();
+            if (iframeRect.width > 0 && iframeRect.height > 0 && 
+                iframeRect.width < 2000 && iframeRect.height < 2000) {
+                bannerWidth = Math.ceil(iframeRect.width);
+                bannerHeight = Math.ceil(iframeRect.height);
+                detectionMethod = 'iframe content';
+            }
+        }
+
+        // Look for content with explicit pixel dimensions in style
+        if (bannerWidth === 0 || bannerHeight === 0) {
+            // The browser has already parsed inline styles, so read el.style instead of regex-matching the attribute
+            const elementsWithStyle = document.querySelectorAll('[style*="width"][style*="height"]');
+            for (const el of elementsWithStyle) {
+                const { width, height } = el.style;
+                if (!width.endsWith('px') || !height.endsWith('px')) continue;
+
+                const w = parseInt(width);
+                const h = parseInt(height);
+                if (Number.isFinite(w) && Number.isFinite(h) && w >= 120 && h >= 120 && w < 2000 && h < 2000) {
+                    bannerWidth = w;
+                    bannerHeight = h;
+                    detectionMethod = 'inline style dimensions';
+                    break;
+                }
+            }
+        }
+    }
+
+    // Measured once; both the fallback and the returned body size use it
+    const bodyRect = body.getBoundingClientRect();
+
+    // Fallback to body/viewport dimensions if no container found
+    if (bannerWidth === 0 || bannerHeight === 0) {
+        const viewportWidth = window.innerWidth;
+        const viewportHeight = window.innerHeight;
+        const htmlRect = html.getBoundingClientRect();
+
+        // Use the smallest reasonable dimensions
+        bannerWidth = Math.min(viewportWidth, bodyRect.width || viewportWidth, htmlRect.width || viewportWidth);
+        bannerHeight = Math.min(viewportHeight, bodyRect.height || viewportHeight, htmlRect.height || viewportHeight);
+
+        // Clamp to reasonable banner sizes
+        bannerWidth = Math.max(120, Math.min(bannerWidth, 2000));
+        bannerHeight = Math.max(120, Math.min(bannerHeight, 2000));
+
+        detectionMethod = 'viewport/body fallback';
+    }
+
+    return {
+        width: bannerWidth,
+        height: bannerHeight,
+        detectionMethod: detectionMethod,
+        viewportWidth: window.innerWidth,
+        viewportHeight: window.innerHeight,
+        bodyWidth: bodyRect.width,
+        bodyHeight: bodyRect.height,
+        isHoxtonOrSimilar: isHoxtonOrSimilar,
+        hostname: window.location.hostname,
+        bannerName: bannerName,
+        bannerNameDebug: bannerNameDebug,
+        metadata: metadata,
+        // Hoxton adSize (applied server-side) is exact and wins over all but the top-priority container
+        primaryContainerDetected: matchedSelector === containers[0],
+        hoxtonData: collectHoxtonData()
+    };
+}
+"""
+
+# The page source is only serialized for the sample when includeSource is set (debug logging)
+_CAPTURE_PAGE_INFO_JS = (
+    "(includeSource) => ({ hoxtonDebug: (" + _HOXTON_DEBUG_JS + ")(), "
+    "pageSourceSample: includeSource ? (" + _PAGE_SOURCE_SAMPLE_JS + ")() : null, "
+    "bannerInfo: (" + _BANNER_INFO_JS + ")() })"
+)
+
+# Animation detection for capture_screenshot: GSAP timelines (including same-origin iframes), then CSS and video
+_ANIMATION_INFO_JS = """
+() => {
+    let maxDuration = 0;
+    let animationCount = 0;
+    let gsapInfo = { found: false, timelines: [], totalDuration: 0, source: 'none' };
+
+    // Function to check GSAP in a document (main or iframe)
+    function checkGsapInDocument(doc, sourceName) {
+        const results = { timelines: [], maxDuration: 0 };
+
+        // Check if GSAP and Creative exist in this document context
+        const gsapLib = doc.defaultView?.gsap;
+        const Creative = doc.defaultView?.Creative;
+
+        if (!gsapLib && !Creative) return results;
+
+        // PRIORITY 1: Check Creative.tl pattern (common in banner frameworks)
+        if (Creative && Creative.tl) {
+            if (typeof Creative.tl.duration === 'function') {
+                try {
+                    const duration = Creative.tl.duration();
+                    const progress = Creative.tl.progress ? Creative.tl.progress() : 0;
+                    if (duration && duration > 0) {
+                        results.timelines.push({ 
+                            type: 'Creative.tl', 
+                            duration, 
+                            progress,
+                            source: sourceName,
+                            isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
                         });
+                        results.maxDuration = Math.max(results.maxDuration, duration);
                     }
-                    
-                    return debug;
+                } catch (e) {
+                    console.log(`Error accessing Creative.tl.duration in ${sourceName}:`, e);
                 }
-            """)
-            
-            logger.info(f"Hoxton debug info: {hoxton_debug}")
-            
-            # Also check the page source for hoxton content
-            page_source_sample = page.evaluate("""
-                () => {
-                    const html = document.documentElement.outerHTML;
-                    const hoxtonIndex = html.toLowerCase().indexOf('hoxton');
-                    if (hoxtonIndex !== -1) {
-                        return html.substring(Math.max(0, hoxtonIndex - 100), hoxtonIndex + 500);
+            }
+            if (typeof Creative.tl.totalDuration === 'function') {
+                try {
+                    const totalDuration = Creative.tl.totalDuration();
+                    const progress = Creative.tl.progress ? Creative.tl.progress() : 0;
+                    if (totalDuration && totalDuration > 0) {
+                        results.timelines.push({ 
+                            type: 'Creative.tl.totalDuration', 
+                            duration: totalDuration, 
+                            progress,
+                            source: sourceName,
+                            isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
+                        });
+                        results.maxDuration = Math.max(results.maxDuration, totalDuration);
                     }
-                    return 'No hoxton text found in page source';
+                } catch (e) {
+                    console.log(`Error accessing Creative.tl.totalDuration in ${sourceName}:`, e);
                 }
-            """)
-            logger.info(f"Page source sample around 'hoxton': {page_source_sample}")
-            
-            # Get the actual dimensions of the banner content and metadata
-            banner_info = page.evaluate(r"""
-                () => {
-                    // Try to find the banner container or body dimensions
-                    const body = document.body;
-                    const html = document.documentElement;
-                    
-                    // Function to extract banner name from various sources
-                    function extractBannerName() {
-                        const debug = { attempts: [], found: null };
-                        
-                        // Function to extract hoxton data from a document (main or iframe)
-                        function extractFromDocument(doc, source) {
-                            const hoxtonElements = doc.querySelectorAll('hoxton');
-                            debug.attempts.push(`[${source}] Found ${hoxtonElements.length} hoxton elements`);
-                            
-                            for (const hoxtonEl of hoxtonElements) {
-                                const dataAttr = hoxtonEl.getAttribute('data');
-                                if (dataAttr) {
-                                    debug.attempts.push(`[${source}] Found hoxton with data attr, length: ${dataAttr.length}`);
-                                    try {
-                                        // Handle double URL encoding
-                                        let decoded = dataAttr;
-                                        
-                                        // First decode
-                                        decoded = decodeURIComponent(decoded);
-                                        debug.attempts.push(`[${source}] First decode: ${decoded.substring(0, 100)}...`);
-                                        
-                                        // Check if still encoded (contains %)
-                                        if (decoded.includes('%')) {
-                                            decoded = decodeURIComponent(decoded);
-                                            debug.attempts.push(`[${source}] Second decode: ${decoded.substring(0, 100)}...`);
-                                        }
-                                        
-                                        const jsonData = JSON.parse(decoded);
-                                        debug.attempts.push(`[${source}] Parsed JSON, keys: ${Object.keys(jsonData).join(', ')}`);
-                                        
-                                        // Priority 1: Use reportingLabel if it exists and is NOT a placeholder
-                                        if (jsonData.reportingLabel && 
-                                            jsonData.reportingLabel.trim() !== '' && 
-                                            !jsonData.reportingLabel.includes('{') && 
-                                            !jsonData.reportingLabel.includes('}')) {
-                                            debug.found = `[${source}] reportingLabel: ${jsonData.reportingLabel}`;
-                                            return jsonData.reportingLabel;
-                                        }
-                                        
-                                        // Priority 2: Fall back to name if reportingLabel is placeholder/blank
-                                        if (jsonData.name) {
-                                            debug.found = `[${source}] name (reportingLabel was placeholder/blank): ${jsonData.name}`;
-                                            return jsonData.name;
-                                        }
-                                        
-                                        // Priority 3: Use reportingLabel even if it's a placeholder (last resort)
-                                        if (jsonData.reportingLabel) {
-                                            debug.found = `[${source}] reportingLabel (using placeholder): ${jsonData.reportingLabel}`;
-                                            return jsonData.reportingLabel;
-                                        }
-                                        
-                                    } catch (e) {
-                                        debug.attempts.push(`[${source}] JSON parse error: ${e.message}`);
-                                    }
-                                }
-                            }
-                            return null;
-                        }
-                        
-                        // FIRST: Check main document for hoxton elements
-                        const mainResult = extractFromDocument(document, 'main-doc');
-                        if (mainResult) {
-                            return { result: mainResult, debug };
-                        }
-                        
-                        // SECOND: Try to find iframe URLs for later processing
-                        const iframes = document.querySelectorAll('iframe');
-                        debug.attempts.push(`Found ${iframes.length} iframes to check`);
-                        
-                        const iframeUrls = [];
-                        for (let i = 0; i < iframes.length; i++) {
-                            const iframe = iframes[i];
-                            if (iframe.src) {
-                                iframeUrls.push(iframe.src);
-                                debug.attempts.push(`Iframe ${i} src: ${iframe.src}`);
-                            }
-                            
-                            try {
-                                const iframeDoc = iframe.contentDocument || iframe.contentWindow?.document;
-                                if (iframeDoc) {
-                                    debug.attempts.push(`Successfully accessed iframe ${i}`);
-                                    const iframeResult = extractFromDocument(iframeDoc, `iframe-${i}`);
-                                    if (iframeResult) {
-                                        return { result: iframeResult, debug };
-                                    }
-                                } else {
-                                    debug.attempts.push(`Cannot access iframe ${i} (cross-origin or not loaded)`);
-                                }
-                            } catch (e) {
-                                debug.attempts.push(`Error accessing iframe ${i}: ${e.message}`);
-                            }
-                        }
-                        
-                        // Store iframe URLs for server-side processing
-                        if (iframeUrls.length > 0) {
-                            debug.iframeUrls = iframeUrls;
-                            debug.attempts.push(`Found ${iframeUrls.length} iframe URLs for server processing`);
-                        }
-                        
-                        // THIRD: Try other data attributes in main document
-                        const dataBannerName = document.querySelector('[data-banner-name]')?.getAttribute('data-banner-name');
-                        if (dataBannerName) {
-                            debug.found = `data-banner-name: ${dataBannerName}`;
-                            return { result: dataBannerName, debug };
-                        }
-                        
-                        const dataCreativeName = document.querySelector('[data-creative-name]')?.getAttribute('data-creative-name');
-                        if (dataCreativeName) {
-                            debug.found = `data-creative-name: ${dataCreativeName}`;
-                            return { result: dataCreativeName, debug };
-                        }
-                        
-                        const dataName = document.querySelector('[data-name]')?.getAttribute('data-name');
-                        if (dataName) {
-                            debug.found = `data-name: ${dataName}`;
-                            return { result: dataName, debug };
-                        }
-                        
-                        // FOURTH: Try page title (cleaned)
-                        const title = document.title;
-                        if (title && title !== 'Untitled' && title !== 'Banner' && title !== 'Preview' && title !== 'Share' && title.length > 3) {
-                            debug.found = `page title: ${title}`;
-                            return { result: title, debug };
-                        }
-                        
-                        // Store iframe URLs for server-side processing even if no name found
-                        if (iframeUrls.length > 0) {
-                            debug.iframeUrls = iframeUrls;
-                        }
-                        
-                        debug.found = 'nothing found';
-                        return { result: '', debug };
-                    }
-                    
-                    // Function to extract additional metadata
-                    function extractMetadata() {
-                        const meta = {};
-                        
-                        // Function to extract hoxton metadata from a document
-                        function extractHoxtonFromDoc(doc, source) {
-                            const hoxtonElement = doc.querySelector('hoxton[data]');
-                            if (hoxtonElement) {
-                                try {
-                                    const encodedData = hoxtonElement.getAttribute('data');
-                                    const decodedData = decodeURIComponent(encodedData);
-                                    const jsonData = JSON.parse(decodedData);
-                                    
-                                    return {
-                                        source: source,
-                                        hoxtonData: {
-                                            name: jsonData.name,
-                                            reportingLabel: jsonData.reportingLabel,
-                                            adType: jsonData.adType,
-                                            adSize: jsonData.adSize,
-                                            platform: jsonData.platform
-                                        },
-                                        dataWidth: jsonData.adSize ? parseInt(jsonData.adSize.width) : null,
-                                        dataHeight: jsonData.adSize ? parseInt(jsonData.adSize.height) : null,
-                                        format: jsonData.adType ? jsonData.adType.toLowerCase() : null,
-                                        platform: jsonData.platform
-                                    };
-                                } catch (e) {
-                                    console.log(`Error parsing Hoxton metadata from ${source}:`, e);
-                                }
-                            }
-                            return null;
-                        }
-                        
-                        // Extract rich Hoxton metadata - PRIORITY #1: Main document
-                        let hoxtonMeta = extractHoxtonFromDoc(document, 'main-doc');
-                        
-                        // If not found in main document, check iframes
-                        if (!hoxtonMeta) {
-                            const iframes = document.querySelectorAll('iframe');
-                            for (let i = 0; i < iframes.length; i++) {
-                                try {
-                                    const iframeDoc = iframes[i].contentDocument || iframes[i].contentWindow?.document;
-                                    if (iframeDoc) {
-                                        hoxtonMeta = extractHoxtonFromDoc(iframeDoc, `iframe-${i}`);
-                                        if (hoxtonMeta) break;
-                                    }
-                                } catch (e) {
-                                    // Ignore iframe access errors
-                                }
-                            }
-                        }
-                        
-                        // Apply hoxton metadata if found
-                        if (hoxtonMeta) {
-                            Object.assign(meta, hoxtonMeta);
-                        }
-                        
-                        // Try to get dimensions from standard data attributes (if not from Hoxton)
-                        if (!meta.dataWidth || !meta.dataHeight) {
-                            const dataWidth = document.querySelector('[data-width]')?.getAttribute('data-width');
-                            const dataHeight = document.querySelector('[data-height]')?.getAttribute('data-height');
-                            if (dataWidth && dataHeight) {
-                                meta.dataWidth = parseInt(dataWidth);
-                                meta.dataHeight = parseInt(dataHeight);
-                            }
-                        }
-                        
-                        // Try to get format info (if not from Hoxton)
-                        if (!meta.format) {
-                            const format = document.querySelector('[data-format]')?.getAttribute('data-format') ||
-                                         document.querySelector('[data-type]')?.getAttribute('data-type');
-                            if (format) {
-                                meta.format = format;
-                            }
-                        }
-                        
-                        // Try to get campaign or client info
-                        const campaign = document.querySelector('[data-campaign]')?.getAttribute('data-campaign');
-                        const client = document.querySelector('[data-client]')?.getAttribute('data-client');
-                        if (campaign) meta.campaign = campaign;
-                        if (client) meta.client = client;
-                        
-                        return meta;
-                    }
-                    
-                    // Look for common banner container selectors in order of priority
-                    const containers = [
-                        '#mainHolder', '#container', '#main', '#banner-container',
-                        // Hoxton-specific selectors
-                        '.creative-container', '.banner-frame', '.ad-frame', 
-                        '[data-creative]', '[data-banner]', '.hoxton-banner',
-                        // General selectors
-                        'canvas', '.banner', '#banner', '.ad', '#ad', 
-                        '.creative', '#creative', '.container', 'main',
-                        'div[style*="width"]', 'div[style*="height"]',
-                        '.banner-wrap', '.ad-wrap', '.creative-wrap',
-                        // Frame/iframe content
-                        'body > div:first-child', 'body > *:first-child'
-                    ];
-                    
-                    let bannerWidth = 0;
-                    let bannerHeight = 0;
-                    let detectionMethod = 'fallback';
-                    
-                    // Extract banner name and metadata
-                    const bannerNameResult = extractBannerName();
-                    const bannerName = bannerNameResult.result || bannerNameResult || '';
-                    const bannerNameDebug = bannerNameResult.debug || null;
-                    const metadata = extractMetadata();
-                    
-                    // Use Hoxton dimensions if available and reliable
-                    if (metadata.hoxtonData && metadata.dataWidth && metadata.dataHeight) {
-                        bannerWidth = metadata.dataWidth;
-                        bannerHeight = metadata.dataHeight;
-                        detectionMethod = 'Hoxton adSize data (exact)';
-                    }
-                    
-                    // Special handling for Hoxton or other banner sharing platforms
-                    const isHoxtonOrSimilar = window.location.hostname.includes('hoxton') || 
-                                            document.querySelector('.creative-container, .banner-frame, [data-creative]');
-                    
-                    // Try to find a container with explicit dimensions
-                    for (const selector of containers) {
-                        const elements = document.querySelectorAll(selector);
-                        for (const element of elements) {
-                            const rect = element.getBoundingClientRect();
-                            const computedStyle = window.getComputedStyle(element);
-                            
-                            // Check if element has explicit width/height
-                            if (rect.width > 0 && rect.height > 0) {
-                                // For banner-specific containers, prioritize them highly
-                                if (selector.includes('mainHolder') || selector.includes('container') || 
-                                    selector.includes('banner') || selector.includes('creative') || 
-                                    selector.includes('ad') || selector.includes('hoxton')) {
-                                    
-                                    // For sharing platforms, look for reasonably sized content
-                                    if (isHoxtonOrSimilar && rect.width < 2000 && rect.height < 2000 && 
-                                        rect.width >= 120 && rect.height >= 120) {
-                                        bannerWidth = Math.ceil(rect.width);
-                                        bannerHeight = Math.ceil(rect.height);
-                                        detectionMethod = `${selector} (banner platform priority)`;
-                                        break;
-                                    } else if (!isHoxtonOrSimilar) {
-                                        bannerWidth = Math.ceil(rect.width);
-                                        bannerHeight = Math.ceil(rect.height);
-                                        detectionMethod = `${selector} (banner container priority)`;
-                                        break;
-                                    }
-                                }
-                                
-                                // Prefer elements with explicit CSS dimensions
-                                const cssWidth = computedStyle.width;
-                                const cssHeight = computedStyle.height;
-                                
-                                if ((cssWidth && cssWidth !== 'auto' && !cssWidth.includes('%')) || 
-                                    (cssHeight && cssHeight !== 'auto' && !cssHeight.includes('%'))) {
-                                    
-                                    // Ensure reasonable banner dimensions
-                                    if (rect.width < 2000 && rect.height < 2000 && 
-                                        rect.width >= 120 && rect.height >= 120) {
-                                        bannerWidth = Math.ceil(rect.width);
-                                        bannerHeight = Math.ceil(rect.height);
-                                        detectionMethod = `${selector} (CSS dimensions)`;
-                                        break;
-                                    }
-                                }
-                                
-                                // If no CSS dimensions but has reasonable banner size, use it
-                                if (rect.width < 2000 && rect.height < 2000 && 
-                                    rect.width >= 120 && rect.height >= 120) {
-                                    bannerWidth = Math.ceil(rect.width);
-                                    bannerHeight = Math.ceil(rect.height);
-                                    detectionMethod = `${selector} (computed size)`;
-                                    break;
-                                }
-                            }
-                        }
-                        if (bannerWidth > 0 && bannerHeight > 0) break;
-                    }
-                    
-                    // Special case: Look for the actual creative content on banner platforms
-                    if ((bannerWidth === 0 || bannerHeight === 0) && isHoxtonOrSimilar) {
-                        // Try to find iframe content or embedded content
-                        const iframe = document.querySelector('iframe');
-                        if (iframe) {
-                            const iframeRect = iframe.getBoundingClientRect();
-                            if (iframeRect.width > 0 && iframeRect.height > 0 && 
-                                iframeRect.width < 2000 && iframeRect.height < 2000) {
-                                bannerWidth = Math.ceil(iframeRect.width);
-                                bannerHeight = Math.ceil(iframeRect.height);
-                                detectionMethod = 'iframe content';
-                            }
-                        }
-                        
-                        // Look for content with explicit pixel dimensions in style
-                        if (bannerWidth === 0 || bannerHeight === 0) {
-                            const elementsWithStyle = document.querySelectorAll('[style*="px"]');
-                            for (const el of elementsWithStyle) {
-                                const style = el.getAttribute('style');
-                                const widthMatch = style.match(/width:\\s*(\\d+)px/);
-                                const heightMatch = style.match(/height:\\s*(\\d+)px/);
-                                
-                                if (widthMatch && heightMatch) {
-                                    const w = parseInt(widthMatch[1]);
-                                    const h = parseInt(heightMatch[1]);
-                                    if (w >= 120 && h >= 120 && w < 2000 && h < 2000) {
-                                        bannerWidth = w;
-                                        bannerHeight = h;
-                                        detectionMethod = 'inline style dimensions';
-                                        break;
-                                    }
-                                }
-                            }
-                        }
-                    }
-                    
-                    // Fallback to body/viewport dimensions if no container found
-                    if (bannerWidth === 0 || bannerHeight === 0) {
-                        const viewportWidth = window.innerWidth;
-                        const viewportHeight = window.innerHeight;
-                        const bodyRect = body.getBoundingClientRect();
-                        const htmlRect = html.getBoundingClientRect();
-                        
-                        // Use the smallest reasonable dimensions
-                        bannerWidth = Math.min(viewportWidth, bodyRect.width || viewportWidth, htmlRect.width || viewportWidth);
-                        bannerHeight = Math.min(viewportHeight, bodyRect.height || viewportHeight, htmlRect.height || viewportHeight);
-                        
-                        // Clamp to reasonable banner sizes
-                        bannerWidth = Math.max(120, Math.min(bannerWidth, 2000));
-                        bannerHeight = Math.max(120, Math.min(bannerHeight, 2000));
-                        
-                        detectionMethod = 'viewport/body fallback';
-                    }
-                    
-                    return {
-                        width: bannerWidth,
-                        height: bannerHeight,
-                        detectionMethod: detectionMethod,
-                        viewportWidth: window.innerWidth,
-                        viewportHeight: window.innerHeight,
-                        bodyWidth: body.getBoundingClientRect().width,
-                        bodyHeight: body.getBoundingClientRect().height,
-                        isHoxtonOrSimilar: isHoxtonOrSimilar,
-                        hostname: window.location.hostname,
-                        bannerName: bannerName,
-                        bannerNameDebug: bannerNameDebug,
-                        metadata: metadata
-                    };
-                }
-            """)
-
-            # Apply the SAME successful hoxton detection logic as the test endpoint
-            logger.info("Applying enhanced hoxton detection...")
-            
-            enhanced_hoxton_result = page.evaluate("""
-                () => {
-                    // Function to extract hoxton data from an element
-                    function extractHoxtonData(el, source) {
-                        const dataAttr = el.getAttribute('data');
-                        let decodedData = null;
-                        let parsedData = null;
-                        
-                        if (dataAttr) {
-                            try {
-                                decodedData = decodeURIComponent(dataAttr);
-                                parsedData = JSON.parse(decodedData);
-                            } catch (e) {
-                                // ignore parsing errors for now
-                            }
-                        }
-                        
-                        return {
-                            source: source,
-                            hasDataAttr: el.hasAttribute('data'),
-                            dataLength: dataAttr?.length || 0,
-                            parsedName: parsedData?.name || null,
-                            parsedReportingLabel: parsedData?.reportingLabel || null,
-                            rawParsedData: parsedData
-                        };
-                    }
-                    
-                    const result = {
-                        foundHoxtonElements: [],
-                        totalHoxtonFound: 0
-                    };
-                    
-                    // Check main document for hoxton elements
-                    const mainHoxtonEls = document.querySelectorAll('hoxton, HOXTON');
-                    for (const el of mainHoxtonEls) {
-                        result.foundHoxtonElements.push(extractHoxtonData(el, 'main-document'));
-                    }
-                    
-                    // Check all iframes for hoxton elements  
-                    const iframes = document.querySelectorAll('iframe');
-                    for (let i = 0; i < iframes.length; i++) {
-                        const iframe = iframes[i];
-                        try {
-                            const iframeDoc = iframe.contentDocument || iframe.contentWindow?.document;
-                            if (iframeDoc) {
-                                const iframeHoxtonEls = iframeDoc.querySelectorAll('hoxton, HOXTON');
-                                for (const el of iframeHoxtonEls) {
-                                    result.foundHoxtonElements.push(extractHoxtonData(el, `iframe-${i}`));
-                                }
-                            }
-                        } catch (e) {
-                            // Cross-origin iframe, skip
-                        }
-                    }
-                    
-                    result.totalHoxtonFound = result.foundHoxtonElements.length;
-                    return result;
-                }
-            """)
-            
-            logger.info(f"Enhanced hoxton detection found: {enhanced_hoxton_result['totalHoxtonFound']} hoxton elements")
-            
-            # Process enhanced hoxton results to update banner info
-            if enhanced_hoxton_result['totalHoxtonFound'] > 0:
-                for hoxton_el in enhanced_hoxton_result['foundHoxtonElements']:
-                    logger.info(f"Found hoxton element from {hoxton_el['source']}")
-                    logger.info(f"  - Has data: {hoxton_el['hasDataAttr']}")
-                    logger.info(f"  - Data length: {hoxton_el['dataLength']}")
-                    logger.info(f"  - Parsed name: {hoxton_el.get('parsedName')}")
-                    logger.info(f"  - Parsed reportingLabel: {hoxton_el.get('parsedReportingLabel')}")
-                    
-                    # Update banner_info with hoxton data
-                    if (hoxton_el.get('parsedReportingLabel') and 
-                        hoxton_el['parsedReportingLabel'] != '{versionName}'):
-                        banner_info['bannerName'] = hoxton_el['parsedReportingLabel']
-                        banner_info['hoxtonData'] = hoxton_el.get('rawParsedData')
-                        logger.info(f"✅ Updated banner name from reportingLabel: {banner_info['bannerName']}")
-                        break
-                    elif hoxton_el.get('parsedName'):
-                        banner_info['bannerName'] = hoxton_el['parsedName']
-                        banner_info['hoxtonData'] = hoxton_el.get('rawParsedData')
-                        logger.info(f"✅ Updated banner name from name: {banner_info['bannerName']}")
-                        break
-            else:
-                logger.warning("❌ Enhanced hoxton detection found no elements")
-
-            # Check if we need to extract Hoxton data from iframes (if not found in main document)
-            banner_name_debug = banner_info.get('bannerNameDebug', {})
-            iframe_urls = banner_name_debug.get('iframeUrls', [])
-            
-            logger.info(f"Banner name from JavaScript: '{banner_info.get('bannerName', '')}'")
-            logger.info(f"Banner name debug found: '{banner_name_debug.get('found', 'Not available')}'")
-            logger.info(f"Iframe URLs detected: {iframe_urls}")
-            
-            # Skip iframe URL processing if we already found hoxton data
-            if banner_info.get('bannerName') and banner_info.get('hoxtonData'):
-                logger.info("✅ Already found hoxton data, skipping iframe URL processing")
-            elif (not banner_info.get('bannerName') or banner_info.get('bannerName') == '') and iframe_urls:
-                logger.info(f"No banner name found in main document, trying {len(iframe_urls)} iframe URLs")
-                
-                for i, iframe_url in enumerate(iframe_urls):
-                    try:
-                        # Convert relative URLs to absolute
-                        from urllib.parse import urljoin
-                        absolute_iframe_url = urljoin(url, iframe_url)
-                        
-                        logger.info(f"Trying to extract Hoxton data from iframe {i}: {absolute_iframe_url}")
-                        
-                        # Create new browser context for iframe
-                        iframe_context = browser.new_context()
-                        iframe_page = iframe_context.new_page()
-                        
-                        # Navigate to iframe URL
-                        iframe_page.goto(absolute_iframe_url, wait_until='networkidle', timeout=30000)
-                        time.sleep(3)  # Wait for content
-                        
-                        # Try to extract hoxton data from iframe
-                        iframe_hoxton_data = iframe_page.evaluate("""
-                            () => {
-                                const hoxtonElement = document.querySelector('hoxton[data]');
-                                if (hoxtonElement) {
-                                    try {
-                                        const encodedData = hoxtonElement.getAttribute('data');
-                                        const decodedData = decodeURIComponent(encodedData);
-                                        const jsonData = JSON.parse(decodedData);
-                                        
-                                        return {
-                                            success: true,
-                                            name: jsonData.name,
-                                            reportingLabel: jsonData.reportingLabel,
-                                            adType: jsonData.adType,
-                                            adSize: jsonData.adSize,
-                                            platform: jsonData.platform
-                                        };
-                                    } catch (e) {
-                                        return { success: false, error: e.message };
-                                    }
-                                }
-                                return { success: false, error: 'No hoxton element found' };
-                            }
-                        """)
-                        
-                        iframe_context.close()
-                        
-                        if iframe_hoxton_data.get('success'):
-                            logger.info(f"Successfully extracted Hoxton data from iframe: {iframe_hoxton_data}")
-                            
-                            # Update banner_info with iframe data
-                            if iframe_hoxton_data.get('reportingLabel') and iframe_hoxton_data['reportingLabel'] != '{versionName}':
-                                banner_info['bannerName'] = iframe_hoxton_data['reportingLabel']
-                                logger.info(f"Updated banner name from iframe reportingLabel: {banner_info['bannerName']}")
-                            elif iframe_hoxton_data.get('name'):
-                                banner_info['bannerName'] = iframe_hoxton_data['name']
-                                logger.info(f"Updated banner name from iframe name: {banner_info['bannerName']}")
-                            
-                            # Add hoxton metadata to banner_info
-                            banner_info['hoxtonData'] = iframe_hoxton_data
-                            break  # Found data, stop trying other iframes
-                        else:
-                            logger.warning(f"Failed to extract from iframe {i}: {iframe_hoxton_data.get('error')}")
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing iframe {i} ({iframe_url}): {str(e)}")
-                        continue
-            else:
-                logger.info(f"Skipping iframe processing - banner name: '{banner_info.get('bannerName')}', iframe URLs: {len(iframe_urls)}")
-
-            # Use auto-detected dimensions if not specified
-            if width is None:
-                width = banner_info['width']
-            if height is None:
-                height = banner_info['height']
-                
-            logger.info(f"Detection method: {banner_info['detectionMethod']}")
-            logger.info(f"Detected dimensions: {banner_info['width']}x{banner_info['height']}")
-            logger.info(f"Viewport: {banner_info['viewportWidth']}x{banner_info['viewportHeight']}")
-            logger.info(f"Body: {banner_info['bodyWidth']}x{banner_info['bodyHeight']}")
-            logger.info(f"Banner name: {banner_info.get('bannerName', 'Not detected')}")
-            
-            # Log banner name debug info
-            banner_name_debug = banner_info.get('bannerNameDebug')
-            if banner_name_debug:
-                logger.info(f"Banner name debug - Found: {banner_name_debug.get('found', 'nothing')}")
-                for attempt in banner_name_debug.get('attempts', []):
-                    logger.info(f"  - {attempt}")
-            
-            logger.info(f"Final dimensions to use: {width}x{height}")
-
-            # Set viewport to exact banner dimensions for pixel-perfect rendering
-            page.set_viewport_size({'width': width, 'height': height})
-
-            # Add font rendering optimizations for crisp text
-            page.add_init_script("""
-                // Force font smoothing for better text rendering
-                document.documentElement.style.webkitFontSmoothing = 'antialiased';
-                document.documentElement.style.mozOsxFontSmoothing = 'grayscale';
-                document.documentElement.style.fontSmooth = 'always';
-                document.documentElement.style.textRendering = 'optimizeLegibility';
-            """)
-
-            # Wait for animations and dynamic content to complete
-            # Wait for initial load
-            time.sleep(2)            # Advanced animation detection with GSAP support (including iframes)
-            logger.info("Detecting animations (GSAP in iframes, CSS, Video)...")
-            
-            # Enhanced animation detection with iframe GSAP Timeline support
-            animation_info = page.evaluate("""
-                () => {
-                    let maxDuration = 0;
-                    let animationCount = 0;
-                    let gsapInfo = { found: false, timelines: [], totalDuration: 0, source: 'none' };
-                    
-                    // Function to check GSAP in a document (main or iframe)
-                    function checkGsapInDocument(doc, sourceName) {
-                        const results = { timelines: [], maxDuration: 0 };
-                        
-                        // Check if GSAP and Creative exist in this document context
-                        const gsapLib = doc.defaultView?.gsap;
-                        const Creative = doc.defaultView?.Creative;
-                        
-                        if (!gsapLib && !Creative) return results;
-                        
-                        // PRIORITY 1: Check Creative.tl pattern (common in banner frameworks)
-                        if (Creative && Creative.tl) {
-                            if (typeof Creative.tl.duration === 'function') {
-                                try {
-                                    const duration = Creative.tl.duration();
-                                    const progress = Creative.tl.progress ? Creative.tl.progress() : 0;
-                                    if (duration && duration > 0) {
-                                        results.timelines.push({ 
-                                            type: 'Creative.tl', 
-                                            duration, 
-                                            progress,
-                                            source: sourceName,
-                                            isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
-                                        });
-                                        results.maxDuration = Math.max(results.maxDuration, duration);
-                                    }
-                                } catch (e) {
-                                    console.log(`Error accessing Creative.tl.duration in ${sourceName}:`, e);
-                                }
-                            }
-                            if (typeof Creative.tl.totalDuration === 'function') {
-                                try {
-                                    const totalDuration = Creative.tl.totalDuration();
-                                    const progress = Creative.tl.progress ? Creative.tl.progress() : 0;
-                                    if (totalDuration && totalDuration > 0) {
-                                        results.timelines.push({ 
-                                            type: 'Creative.tl.totalDuration', 
-                                            duration: totalDuration, 
-                                            progress,
-                                            source: sourceName,
-                                            isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
-                                        });
-                                        results.maxDuration = Math.max(results.maxDuration, totalDuration);
-                                    }
-                                } catch (e) {
-                                    console.log(`Error accessing Creative.tl.totalDuration in ${sourceName}:`, e);
-                                }
-                            }
-                        }
-                        
-                        // Check GSAP global timeline
-                        if (gsapLib && gsapLib.globalTimeline) {
-                            try {
-                                const duration = gsapLib.globalTimeline.totalDuration();
-                                const progress = gsapLib.globalTimeline.progress();
-                                if (duration && duration > 0) {
-                                    results.timelines.push({ 
-                                        type: 'global', 
-                                        duration, 
-                                        progress,
-                                        source: sourceName,
-                                        isActive: gsapLib.globalTimeline.isActive()
-                                    });
-                                    results.maxDuration = Math.max(results.maxDuration, duration);
-                                }
-                            } catch (e) {
-                                console.log(`Error accessing gsap.globalTimeline in ${sourceName}:`, e);
-                            }
-                        }
-                        
-                        // Check named timelines in window scope
-                        const possibleNames = ['tl', 'timeline', 'mainTimeline', 'masterTimeline', 'bannerTimeline'];
-                        for (const name of possibleNames) {
-                            try {
-                                const timeline = doc.defaultView[name];
-                                if (timeline && typeof timeline.totalDuration === 'function') {
-                                    const duration = timeline.totalDuration();
-                                    const progress = timeline.progress ? timeline.progress() : 0;
-                                    if (duration && duration > 0) {
-                                        results.timelines.push({ 
-                                            type: name, 
-                                            duration, 
-                                            progress,
-                                            source: sourceName,
-                                            isActive: timeline.isActive ? timeline.isActive() : false
-                                        });
-                                        results.maxDuration = Math.max(results.maxDuration, duration);
-                                    }
-                                }
-                            } catch (e) {
-                                console.log(`Error accessing ${name} in ${sourceName}:`, e);
-                            }
-                        }
-                        
-                        return results;
-                    }
-                    
-                    // FIRST: Check main document
-                    const mainResults = checkGsapInDocument(document, 'main-document');
-                    if (mainResults.timelines.length > 0) {
-                        gsapInfo.found = true;
-                        gsapInfo.timelines = mainResults.timelines;
-                        gsapInfo.totalDuration = mainResults.maxDuration;
-                        gsapInfo.source = 'main-document';
-                        maxDuration = Math.max(maxDuration, mainResults.maxDuration);
-                        animationCount += mainResults.timelines.length;
-                    }
-                    
-                    // SECOND: Check all iframes (where Creative.tl likely resides)
-                    const iframes = document.querySelectorAll('iframe');
-                    console.log(`Found ${iframes.length} iframes to check for GSAP`);
-                    
-                    for (let i = 0; i < iframes.length; i++) {
-                        try {
-                            const iframe = iframes[i];
-                            const iframeDoc = iframe.contentDocument || iframe.contentWindow?.document;
-                            
-                            if (iframeDoc) {
-                                console.log(`Checking iframe ${i} for GSAP timelines...`);
-                                const iframeResults = checkGsapInDocument(iframeDoc, `iframe-${i}`);
-                                if (iframeResults.timelines.length > 0) {
-                                    console.log(`Found ${iframeResults.timelines.length} GSAP timelines in iframe ${i}`);
-                                    gsapInfo.found = true;
-                                    gsapInfo.timelines.push(...iframeResults.timelines);
-                                    gsapInfo.totalDuration = Math.max(gsapInfo.totalDuration, iframeResults.maxDuration);
-                                    gsapInfo.source = `iframe-${i}`;
-                                    maxDuration = Math.max(maxDuration, iframeResults.maxDuration);
-                                    animationCount += iframeResults.timelines.length;
-                                }
-                            } else {
-                                console.log(`Cannot access iframe ${i} document`);
-                            }
-                        } catch (e) {
-                            console.log(`Cannot access iframe ${i}:`, e.message);
-                        }
-                    }
-                    
-                    // THIRD: CSS Animations (fallback if no GSAP found)
-                    if (!gsapInfo.found) {
-                        const elements = document.querySelectorAll('*');
-                        for (let el of elements) {
-                            const style = window.getComputedStyle(el);
-                            
-                            // Check CSS animations
-                            const animationName = style.getPropertyValue('animation-name');
-                            const animationDuration = style.getPropertyValue('animation-duration');
-                            const animationIterationCount = style.getPropertyValue('animation-iteration-count');
-                            
-                            if (animationName !== 'none' && animationDuration !== '0s') {
-                                animationCount++;
-                                const duration = parseFloat(animationDuration.replace('s', ''));
-                                const iterations = animationIterationCount === 'infinite' ? 1 : 
-                                                 (parseFloat(animationIterationCount) || 1);
-                                const totalDuration = duration * iterations;
-                                maxDuration = Math.max(maxDuration, totalDuration);
-                            }
-                            
-                            // Check CSS transitions
-                            const transitionDuration = style.getPropertyValue('transition-duration');
-                            if (transitionDuration !== '0s') {
-                                const duration = parseFloat(transitionDuration.replace('s', ''));
-                                maxDuration = Math.max(maxDuration, duration);
-                            }
-                        }
-                    }
-                    
-                    // FOURTH: Video elements
-                    const videos = document.querySelectorAll('video');
-                    for (let video of videos) {
-                        if (video.duration && !isNaN(video.duration)) {
-                            maxDuration = Math.max(maxDuration, video.duration);
-                        }
-                    }
-                    
-                    return {
-                        maxDuration: maxDuration,
-                        animationCount: animationCount,
-                        hasCanvas: document.querySelectorAll('canvas').length > 0,
-                        hasVideo: videos.length > 0,
-                        gsap: gsapInfo
-                    };
-                }
-            """)
-            
-            logger.info(f"Animation detection: {animation_info}")
-            
-            # Extract animation information
-            detected_duration = animation_info.get('maxDuration', 0)
-            has_animations = animation_info.get('animationCount', 0) > 0
-            has_canvas = animation_info.get('hasCanvas', False)
-            has_video = animation_info.get('hasVideo', False)
-            gsap_info = animation_info.get('gsap', {})
-            
-            # GSAP-specific handling for precise end-frame capture
-            if gsap_info.get('found') and gsap_info.get('totalDuration', 0) > 0:
-                gsap_duration = gsap_info['totalDuration']
-                timeline_count = len(gsap_info.get('timelines', []))
-                
-                logger.info(f"🎬 GSAP detected: {timeline_count} timelines, total duration: {gsap_duration}s")
-                
-                # Use the specialized GSAP handler
-                gsap_handled = self._handle_gsap_timeline(page, max_timeout=30)
-                
-                if gsap_handled:
-                    logger.info("✅ GSAP timeline handled successfully - positioned at end frame")
-                else:
-                    logger.warning("⚠️ GSAP handler failed, using fallback wait")
-                    time.sleep(min(gsap_duration, 30))
-                    
-            # Fallback to other animation types if no GSAP
-            elif detected_duration > 0:
-                # We detected CSS animation duration - wait for full cycle plus buffer
-                optimal_wait = min(detected_duration + 1, 30)  # Cap at 30 seconds
-                logger.info(f"🎨 CSS animation duration: {detected_duration}s, waiting {optimal_wait}s")
-                time.sleep(optimal_wait)
-            elif has_canvas or has_video:
-                # Canvas/video content - use frame stability check
-                logger.info("🎥 Canvas/video content detected - using frame stability detection")
-                self._wait_for_frame_stability(page, timeout=wait_time*1000)
-            elif has_animations:
-                # Has animations but couldn't detect duration - use dynamic checking
-                logger.info("🔄 Animations detected but duration unknown - using dynamic detection")
-                self._wait_for_animation_completion(page, timeout=wait_time*1000)
-            else:
-                # No animations detected - use standard wait
-                logger.info(f"⏱️ No animations detected - using standard wait of {wait_time}s")
-                time.sleep(wait_time)
-            
-            # Final frame stability check to ensure we capture the end frame
-            self._ensure_end_frame(page, wait_time)            # Take screenshot with proper format
-            logger.info(f"Taking screenshot with dimensions: {width}x{height}, format: {format}")
-            
-            # Ensure we're using the correct format
-            screenshot_format = 'png' if format.lower() in ['png'] else 'jpeg'
-            
-            screenshot_bytes = page.screenshot(
-                type='png',  # Always capture as PNG first for quality
-                full_page=False,  # Only capture viewport
-                clip={'x': 0, 'y': 0, 'width': width, 'height': height}
-            )
-
-            # Always convert to JPG with size optimization for compliance
-            try:
-                # Check if we need to resize due to device_scale_factor
-                from PIL import Image
-                import io as image_io
-                
-                # Open the captured image to check its actual dimensions
-                temp_image = Image.open(image_io.BytesIO(screenshot_bytes))
-                actual_width, actual_height = temp_image.size
-                
-                # If image is 2x larger due to device_scale_factor, resize it back to target dimensions
-                if actual_width == width * 2 and actual_height == height * 2:
-                    logger.info(f"🔄 Resizing high-DPI capture from {actual_width}x{actual_height} back to {width}x{height}")
-                    # Resize back to target dimensions using high-quality resampling
-                    resized_image = temp_image.resize((width, height), Image.Resampling.LANCZOS)
-                    
-                    # Convert back to bytes
-                    output = image_io.BytesIO()
-                    resized_image.save(output, format='PNG')
-                    screenshot_bytes = output.getvalue()
-                
-                temp_image.close()
-                
-                optimized_jpg_data, final_quality, final_size_kb = optimize_image_to_jpg(screenshot_bytes)
-
-                # Final safety check: Ensure file is absolutely under 39KB
-                optimized_jpg_data = ensure_size_limit(optimized_jpg_data, max_size_kb=39)
-                final_size_kb = len(optimized_jpg_data) / 1024
-                
-                screenshot_base64 = base64.b64encode(optimized_jpg_data).decode('utf-8')
-                actual_format = 'jpeg'
-
-                logger.info(f"📷 Image optimized: {final_size_kb:.1f}KB at {final_quality}% quality")                # Add optimization info to banner_info for reporting
-                banner_info['optimization'] = {
-                    'original_format': 'png',
-                    'final_format': 'jpeg',
-                    'final_quality': final_quality,
-                    'final_size_kb': round(final_size_kb, 1),
-                    'size_limit_kb': 49
-                }
-                
-            except Exception as e:
-                logger.error(f"Failed to optimize image: {str(e)}")
-                # Fallback to original PNG if optimization fails
-                screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                actual_format = 'png'
-            
-            # Convert to base64
-            # screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-            
-            # Debug: Log final banner_info before returning
-            logger.info(f"🔍 Final banner_info before return:")
-            logger.info(f"  - bannerName: '{banner_info.get('bannerName', 'NOT SET')}'")
-            logger.info(f"  - hoxtonData present: {bool(banner_info.get('hoxtonData'))}")
-            logger.info(f"  - width: {banner_info.get('width')}")
-            logger.info(f"  - height: {banner_info.get('height')}")
-            
-            return {
-                'success': True,
-                'imageData': screenshot_base64,
-                'format': actual_format,
-                'dimensions': {'width': width, 'height': height},
-                'detectedDimensions': banner_info,
-                'url': url
-            }
-            
-        except Exception as e:
-            logger.error(f"Screenshot capture failed for {url}: {str(e)}")
-            raise Exception(f"Failed to capture screenshot: {str(e)}")
-            
-        finally:
-            # Clean up resources for this request
-            if page:
-                page.close()
-            if context:
-                context.close()
-            if browser:
-                browser.close()
-            if playwright:
-                playwright.stop()
-    
-    def _handle_gsap_timeline(self, page, max_timeout=30):
-        """Handle GSAP timeline with precise end-frame positioning (including iframes)"""
-        try:
-            # First detect GSAP timelines in main document and iframes
-            gsap_result = page.evaluate("""
-                () => {
-                    const results = { success: false, timelines: [], totalDuration: 0, contexts: [] };
-                    
-                    // Function to get GSAP info from a document
-                    function getGsapInfo(doc, contextName) {
-                        const contextResults = { timelines: [], maxDuration: 0, context: contextName };
-                        
-                        const gsapLib = doc.defaultView?.gsap;
-                        const Creative = doc.defaultView?.Creative;
-                        
-                        // Check Creative.tl pattern (priority)
-                        if (Creative && Creative.tl) {
-                            if (typeof Creative.tl.duration === 'function') {
-                                try {
-                                    const duration = Creative.tl.duration();
-                                    const progress = Creative.tl.progress ? Creative.tl.progress() : 0;
-                                    contextResults.timelines.push({ 
-                                        type: 'Creative.tl', 
-                                        duration, 
-                                        progress,
-                                        context: contextName,
-                                        isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
-                                    });
-                                    contextResults.maxDuration = Math.max(contextResults.maxDuration, duration);
-                                } catch (e) {
-                                    console.log(`Error accessing Creative.tl in ${contextName}:`, e);
-                                }
-                            }
-                        }
-                        
-                        // Check GSAP global timeline
-                        if (gsapLib && gsapLib.globalTimeline) {
-                            try {
-                                const duration = gsapLib.globalTimeline.totalDuration();
-                                const progress = gsapLib.globalTimeline.progress();
-                                contextResults.timelines.push({ 
-                                    type: 'global', 
-                                    duration, 
-                                    progress,
-                                    context: contextName,
-                                    isActive: gsapLib.globalTimeline.isActive()
-                                });
-                                contextResults.maxDuration = Math.max(contextResults.maxDuration, duration);
-                            } catch (e) {
-                                console.log(`Error accessing globalTimeline in ${contextName}:`, e);
-                            }
-                        }
-                        
-                        // Check named timelines
-                        const possibleNames = ['tl', 'timeline', 'mainTimeline', 'masterTimeline', 'bannerTimeline'];
-                        for (const name of possibleNames) {
-                            try {
-                                if (doc.defaultView[name] && typeof doc.defaultView[name].totalDuration === 'function') {
-                                    const duration = doc.defaultView[name].totalDuration();
-                                    const progress = doc.defaultView[name].progress();
-                                    contextResults.timelines.push({ 
-                                        type: name, 
-                                        duration, 
-                                        progress,
-                                        context: contextName,
-                                        isActive: doc.defaultView[name].isActive ? doc.defaultView[name].isActive() : false
-                                    });
-                                    contextResults.maxDuration = Math.max(contextResults.maxDuration, duration);
-                                }
-                            } catch (e) {
-                                console.log(`Error accessing ${name} in ${contextName}:`, e);
-                            }
-                        }
-                        
-                        return contextResults;
-                    }
-                    
-                    // Check main document
-                    const mainContext = getGsapInfo(document, 'main');
-                    if (mainContext.timelines.length > 0) {
-                        results.success = true;
-                        results.timelines.push(...mainContext.timelines);
-                        results.totalDuration = Math.max(results.totalDuration, mainContext.maxDuration);
-                        results.contexts.push(mainContext);
-                    }
-                    
-                    // Check iframes
-                    const iframes = document.querySelectorAll('iframe');
-                    for (let i = 0; i < iframes.length; i++) {
-                        try {
-                            const iframeDoc = iframes[i].contentDocument || iframes[i].contentWindow?.document;
-                            if (iframeDoc) {
-                                const iframeContext = getGsapInfo(iframeDoc, `iframe-${i}`);
-                                if (iframeContext.timelines.length > 0) {
-                                    results.success = true;
-                                    results.timelines.push(...iframeContext.timelines);
-                                    results.totalDuration = Math.max(results.totalDuration, iframeContext.maxDuration);
-                                    results.contexts.push(iframeContext);
-                                }
-                            }
-                        } catch (e) {
-                            console.log(`Cannot access iframe ${i}:`, e.message);
-                        }
-                    }
-                    
-                    return results;
-                }
-            """)
-            
-            if not gsap_result.get('success') or not gsap_result.get('timelines'):
-                logger.warning("No GSAP timelines found in main document or iframes")
-                return False
-                
-            total_duration = gsap_result.get('totalDuration', 0)
-            timelines = gsap_result.get('timelines', [])
-            contexts = gsap_result.get('contexts', [])
-            
-            logger.info(f"🎬 GSAP detected across {len(contexts)} contexts: {len(timelines)} timelines, max duration: {total_duration}s")
-            
-            # Log details about each timeline found
-            for timeline in timelines:
-                logger.info(f"   - {timeline['type']} in {timeline['context']}: {timeline['duration']}s (progress: {timeline.get('progress', 0):.2f})")
-            
-            # Calculate the maximum remaining time across all timelines
-            max_remaining_time = 0
-            current_progress = 1.0  # Start with assumption we're at the end
-            
-            for timeline in timelines:
-                timeline_progress = timeline.get('progress', 0)
-                timeline_remaining = timeline['duration'] * (1 - timeline_progress)
-                if timeline_remaining > max_remaining_time:
-                    max_remaining_time = timeline_remaining
-                    current_progress = timeline_progress
-            
-            logger.info(f"📊 Animation state: progress={current_progress:.2f}, remaining={max_remaining_time:.2f}s")
-            
-            # Enhanced waiting strategy with proper end-frame buffer
-            end_frame_buffer = 1.3  # 1.3 seconds for iframe content settling
-            
-            if max_remaining_time > 0.1:  # Animation still running
-                total_wait_time = max_remaining_time + end_frame_buffer
-                logger.info(f"⏳ Waiting for iframe GSAP completion: {max_remaining_time:.2f}s + {end_frame_buffer}s buffer = {total_wait_time:.2f}s")
-                time.sleep(min(total_wait_time, max_timeout))
-            else:
-                # Animation complete or nearly complete
-                logger.info(f"🎯 GSAP timeline(s) complete, adding {end_frame_buffer}s iframe settling buffer")
-                time.sleep(end_frame_buffer)
-            
-            # Final verification of timeline states
-            final_verification = page.evaluate("""
-                () => {
-                    const finalStates = [];
-                    
-                    function checkFinalState(doc, contextName) {
-                        const Creative = doc.defaultView?.Creative;
-                        const gsapLib = doc.defaultView?.gsap;
-                        
-                        if (Creative && Creative.tl && typeof Creative.tl.progress === 'function') {
-                            try {
-                                finalStates.push({
-                                    type: 'Creative.tl',
-                                    context: contextName,
-                                    progress: Creative.tl.progress(),
-                                    isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
-                                });
-                            } catch (e) {
-                                console.log(`Error checking final state in ${contextName}:`, e);
-                            }
-                        }
-                        
-                        if (gsapLib && gsapLib.globalTimeline) {
-                            try {
-                                finalStates.push({
-                                    type: 'global',
-                                    context: contextName,
-                                    progress: gsapLib.globalTimeline.progress(),
-                                    isActive: gsapLib.globalTimeline.isActive()
-                                });
-                            } catch (e) {
-                                console.log(`Error checking global timeline in ${contextName}:`, e);
-                            }
-                        }
-                    }
-                    
-                    // Check main document
-                    checkFinalState(document, 'main');
-                    
-                    // Check iframes
-                    const iframes = document.querySelectorAll('iframe');
-                    for (let i = 0; i < iframes.length; i++) {
-                        try {
-                            const iframeDoc = iframes[i].contentDocument || iframes[i].contentWindow?.document;
-                            if (iframeDoc) {
-                                checkFinalState(iframeDoc, `iframe-${i}`);
-                            }
-                        } catch (e) {
-                            console.log(`Cannot verify iframe ${i}:`, e.message);
-                        }
-                    }
-                    
-                    return finalStates;
+            }
+        }
+
+        // Check GSAP global timeline
+        if (gsapLib && gsapLib.globalTimeline) {
+            try {
+                const duration = gsapLib.globalTimeline.totalDuration();
+                const progress = gsapLib.globalTimeline.progress();
+                if (duration && duration > 0) {
+                    results.timelines.push({ 
+                        type: 'global', 
+                        duration, 
+                        progress,
+                        source: sourceName,
+                        isActive: gsapLib.globalTimeline.isActive()
+                    });
+                    results.maxDuration = Math.max(results.maxDuration, duration);
                 }
-            """)
-            
-            logger.info(f"✅ Final iframe GSAP states: {final_verification}")
-            return True
-                
-        except Exception as e:
-            logger.error(f"Error handling iframe GSAP timeline: {e}")
-            return False
+            } catch (e) {
+                console.log(`Error accessing gsap.globalTimeline in ${sourceName}:`, e);
+            }
+        }
 
-    def _wait_for_frame_stability(self, page, timeout=5000, stability_time=500):
-        """Wait for frames to be stable (no changes for a certain period)"""
-        import time
-        
-        try:
-            # Take initial screenshot hash
-            initial_screenshot = page.screenshot()
-            initial_hash = hash(initial_screenshot)
-            
-            last_change_time = time.time()
-            start_time = time.time()
-            
-            while (time.time() - start_time) * 1000 < timeout:
-                time.sleep(0.1)  # Check every 100ms
-                
-                # Take new screenshot and compare
-                current_screenshot = page.screenshot()
-                current_hash = hash(current_screenshot)
-                
-                if current_hash != initial_hash:
-                    # Frame changed, reset timer
-                    last_change_time = time.time()
-                    initial_hash = current_hash
-                else:
-                    # Frame hasn't changed
-                    if (time.time() - last_change_time) * 1000 >= stability_time:
-                        logger.info(f"Frame stability achieved after {(time.time() - start_time) * 1000:.0f}ms")
-                        return True
-            
-            logger.warning(f"Frame stability timeout after {timeout}ms")
-            return False
-        except Exception as e:
-            logger.warning(f"Error checking frame stability: {e}")
-            return False
-    
-    def _wait_for_animation_completion(self, page, timeout=30000):
-        """Wait for CSS animations and transitions to complete"""
-        try:
-            # Get initial animation state
-            initial_state = page.evaluate("""
-                () => {
-                    const allElements = document.querySelectorAll('*');
-                    let activeAnimations = 0;
-                    let maxDuration = 0;
-                    
-                    for (const el of allElements) {
-                        const computedStyle = window.getComputedStyle(el);
-                        
-                        // Check for CSS animations
-                        const animationDuration = computedStyle.animationDuration;
-                        if (animationDuration && animationDuration !== '0s') {
-                            activeAnimations++;
-                            const duration = parseFloat(animationDuration) * 1000;
-                            maxDuration = Math.max(maxDuration, duration);
-                        }
-                        
-                        // Check for CSS transitions
-                        const transitionDuration = computedStyle.transitionDuration;
-                        if (transitionDuration && transitionDuration !== '0s') {
-                            activeAnimations++;
-                            const duration = parseFloat(transitionDuration) * 1000;
-                            maxDuration = Math.max(maxDuration, duration);
-                        }
+        // Check named timelines in window scope
+        const possibleNames = ['tl', 'timeline', 'mainTimeline', 'masterTimeline', 'bannerTimeline'];
+        for (const name of possibleNames) {
+            try {
+                const timeline = doc.defaultView[name];
+                if (timeline && typeof timeline.totalDuration === 'function') {
+                    const duration = timeline.totalDuration();
+                    const progress = timeline.progress ? timeline.progress() : 0;
+                    if (duration && duration > 0) {
+                        results.timelines.push({ 
+                            type: name, 
+                            duration, 
+                            progress,
+                            source: sourceName,
+                            isActive: timeline.isActive ? timeline.isActive() : false
+                        });
+                        results.maxDuration = Math.max(results.maxDuration, duration);
                     }
-                    
-                    return { activeAnimations, maxDuration };
                 }
-            """)
-            
-            if initial_state['activeAnimations'] == 0:
-                logger.info("No animations detected")
-                return True
-            
-            animation_timeout = min(initial_state['maxDuration'] + 2000, timeout)
-            logger.info(f"Detected {initial_state['activeAnimations']} animations, max duration: {initial_state['maxDuration']}ms, waiting {animation_timeout}ms")
-            
-            # Wait for the calculated time
-            time.sleep(animation_timeout / 1000)
-            
-            # Verify animations are actually complete
-            final_state = page.evaluate("""
-                () => {
-                    const allElements = document.querySelectorAll('*');
-                    let stillAnimating = 0;
-                    
-                    for (const el of allElements) {
-                        const computedStyle = window.getComputedStyle(el);
-                        
-                        // Check if animations are still running
-                        const animationPlayState = computedStyle.animationPlayState;
-                        if (animationPlayState === 'running') {
-                            stillAnimating++;
-                        }
-                    }
-                    
-                    return { stillAnimating };
+            } catch (e) {
+                console.log(`Error accessing ${name} in ${sourceName}:`, e);
+            }
+        }
+
+        return results;
+    }
+
+    // FIRST: Check main document
+    const mainResults = checkGsapInDocument(document, 'main-document');
+    if (mainResults.timelines.length > 0) {
+        gsapInfo.found = true;
+        gsapInfo.timelines = mainResults.timelines;
+        gsapInfo.totalDuration = mainResults.maxDuration;
+        gsapInfo.source = 'main-document';
+        maxDuration = Math.max(maxDuration, mainResults.maxDuration);
+        animationCount += mainResults.timelines.length;
+    }
+
+    // SECOND: Check all iframes (where Creative.tl likely resides)
+    const iframes = document.querySelectorAll('iframe');
+    console.log(`Found ${iframes.length} iframes to check for GSAP`);
+
+    for (let i = 0; i < iframes.length; i++) {
+        try {
+            const iframe = iframes[i];
+            const iframeDoc = iframe.contentDocument || iframe.contentWindow?.document;
+
+            if (iframeDoc) {
+                console.log(`Checking iframe ${i} for GSAP timelines...`);
+                const iframeResults = checkGsapInDocument(iframeDoc, `iframe-${i}`);
+                if (iframeResults.timelines.length > 0) {
+                    console.log(`Found ${iframeResults.timelines.length} GSAP timelines in iframe ${i}`);
+                    gsapInfo.found = true;
+                    gsapInfo.timelines.push(...iframeResults.timelines);
+                    gsapInfo.totalDuration = Math.max(gsapInfo.totalDuration, iframeResults.maxDuration);
+                    gsapInfo.source = `iframe-${i}`;
+                    maxDuration = Math.max(maxDuration, iframeResults.maxDuration);
+                    animationCount += iframeResults.timelines.length;
                 }
-            """)
-            
-            if final_state['stillAnimating'] > 0:
-                logger.warning(f"Still {final_state['stillAnimating']} animations running after timeout")
-            else:
-                logger.info("All animations completed successfully")
-            
-            return True
-            
-        except Exception as e:
-            logger.warning(f"Error waiting for animation completion: {e}")
-            return False
-    
-    def _ensure_end_frame(self, page, wait_time=3):
-        """Ensure we capture the end frame of any animation with proper settling"""
-        import time
-        
-        try:
-            # Step 1: Check for animations and wait for them
-            animation_completed = self._wait_for_animation_completion(page)
-            
-            # Step 2: Wait for frame stability 
-            frame_stable = self._wait_for_frame_stability(page)
-            
-            # Step 3: Enhanced buffer time for end-frame settling (1-1.5 seconds)
-            end_frame_buffer = max(wait_time, 1.2)  # Minimum 1.2 seconds buffer
-            logger.info(f"⏱️ Adding {end_frame_buffer:.1f}s end-frame settling buffer")
-            time.sleep(end_frame_buffer)
-            
-            # Step 4: Final frame stability verification
-            final_stable = self._wait_for_frame_stability(page, timeout=2000, stability_time=300)
-            
-            success = animation_completed and frame_stable and final_stable
-            logger.info(f"🎯 End frame capture ready: animations={animation_completed}, stable={frame_stable}, final_check={final_stable}")
-            
-            return success
-            
-        except Exception as e:
-            logger.error(f"Error ensuring end frame: {e}")
-            # Fall back to conservative wait time
-            conservative_wait = max(wait_time, 1.5)
-            logger.info(f"🛡️ Fallback: using {conservative_wait}s conservative wait")
-            time.sleep(conservative_wait)
-            return False
+            } else {
+                console.log(`Cannot access iframe ${i} document`);
+            }
+        } catch (e) {
+            console.log(`Cannot access iframe ${i}:`, e.message);
+        }
+    }
 
-    def cleanup(self):
-        """Clean up browser resources - no longer needed as we use fresh contexts"""
-        pass
+    // THIRD: CSS Animations (fallback if no GSAP found). getAnimations() lists only
+    // the animations in effect, instead of resolving the style of every element
+    if (!gsapInfo.found) {
+        for (const animation of document.getAnimations()) {
+            const timing = animation.effect ? animation.effect.getTiming() : {};
+            const duration = (typeof timing.duration === 'number' ? timing.duration : 0) / 1000;
+            if (duration <= 0) continue;
 
-# Global screenshot service instance
-screenshot_service = ScreenshotService()
+            if (animation instanceof CSSTransition) {
+                // Check CSS transitions
+                maxDuration = Math.max(maxDuration, duration);
+            } else {
+                // CSS (and Web Animations API) animations
+                animationCount++;
+                const iterations = timing.iterations === Infinity ? 1 : (timing.iterations || 1);
+                maxDuration = Math.max(maxDuration, duration * iterations);
+            }
+        }
+    }
 
-async def extract_hoxton_from_iframe_url(iframe_url, playwright_instance, browser_instance):
-    """Extract Hoxton metadata directly from iframe URL"""
-    try:
-        logger.info(f"Attempting to extract Hoxton data from iframe: {iframe_url}")
-        
-        # Create a new page for the iframe
-        context = await browser_instance.new_context()
-        page = await context.new_page()
-        
-        # Navigate directly to the iframe URL
-        await page.goto(iframe_url, wait_until='networkidle', timeout=30000)
-        await page.wait_for_timeout(3000)  # Wait for content to load
-        
-        # Extract hoxton data from the iframe page
-        hoxton_data = await page.evaluate("""
-            () => {
-                // Look for hoxton element with data
-                const hoxtonElement = document.querySelector('hoxton[data]');
-                if (hoxtonElement) {
-                    try {
-                        const encodedData = hoxtonElement.getAttribute('data');
-                        const decodedData = decodeURIComponent(encodedData);
-                        const jsonData = JSON.parse(decodedData);
-                        
-                        return {
-                            success: true,
-                            name: jsonData.name,
-                            reportingLabel: jsonData.reportingLabel,
-                            adType: jsonData.adType,
-                            adSize: jsonData.adSize,
-                            platform: jsonData.platform,
-                            rawData: decodedData
-                        };
-                    } catch (e) {
-                        return { success: false, error: e.message };
+    // FOURTH: Video elements
+    const videos = document.querySelectorAll('video');
+    for (let video of videos) {
+        if (video.duration && !isNaN(video.duration)) {
+            maxDuration = Math.max(maxDuration, video.duration);
+        }
+    }
+
+    return {
+        maxDuration: maxDuration,
+        animationCount: animationCount,
+        hasCanvas: document.querySelectorAll('canvas').length > 0,
+        hasVideo: videos.length > 0,
+        gsap: gsapInfo
+    };
+}
+"""
+
+# Hoxton data of an iframe URL loaded as its own page, for banners whose iframe is cross-origin
+_IFRAME_HOXTON_JS = """
+() => {
+    // The raw data attribute is decoded and parsed server-side (_iframe_hoxton_data)
+    const hoxtonElement = document.querySelector('hoxton[data]');
+    if (hoxtonElement) {
+        return { success: true, data: hoxtonElement.getAttribute('data') };
+    }
+    return { success: false, error: 'No hoxton element found' };
+}
+"""
+
+# Everything /scan-preview treats as a possible banner: iframes, banner containers, preview thumbnails and banner links
+_PREVIEW_CANDIDATES_SELECTOR = (
+    'iframe, [data-banner-url], [data-src], .banner-container, .ad-container, '
+    '[data-preview-url], .preview-item, .banner-preview, '
+    'a[href*="banner"], a[href*="creative"], a[href*="ad"], a[href*=".html"]'
+)
+
+# Banner candidates on a /scan-preview page, called with _PREVIEW_CANDIDATES_SELECTOR
+_SCAN_PREVIEW_JS = """
+(candidateSelector) => {
+    const MAX_BANNERS = 100;
+    const banners = [];
+    const seen = new Set();
+    const counts = { iframe: 0, container: 0, preview: 0, link: 0 };
+
+    function addBanner(banner) {
+        // Skip duplicates - anchor-heavy pages often repeat the same URL
+        if (!banner.url || seen.has(banner.url)) return;
+        seen.add(banner.url);
+        banner.index = banners.length + 1;
+        banners.push(banner);
+    }
+
+    // One sweep over every candidate type instead of a querySelectorAll per type
+    const candidates = document.querySelectorAll(candidateSelector);
+
+    for (const el of candidates) {
+        if (banners.length >= MAX_BANNERS) break;
+
+        // Iframes (common in preview pages)
+        if (el.tagName === 'IFRAME') {
+            const n = ++counts.iframe;
+            const rect = el.getBoundingClientRect();
+            if (el.src && rect.width > 0 && rect.height > 0) {
+                addBanner({
+                    type: 'iframe',
+                    url: el.src,
+                    width: Math.ceil(rect.width),
+                    height: Math.ceil(rect.height),
+                    title: el.title || `Banner ${n}`,
+                    id: el.id || `iframe-${n}`
+                });
+            }
+            continue;
+        }
+
+        // Embedded banner containers
+        if (el.matches('[data-banner-url], [data-src], .banner-container, .ad-container')) {
+            const n = ++counts.container;
+            const bannerUrl = el.getAttribute('data-banner-url') || 
+                            el.getAttribute('data-src') ||
+                            el.querySelector('a')?.href;
+            const rect = el.getBoundingClientRect();
+            if (bannerUrl && rect.width > 0 && rect.height > 0) {
+                addBanner({
+                    type: 'container',
+                    url: bannerUrl,
+                    width: Math.ceil(rect.width),
+                    height: Math.ceil(rect.height),
+                    title: el.getAttribute('title') || `Container Banner ${n}`,
+                    id: el.id || `container-${n}`
+                });
+            }
+            continue;
+        }
+
+        // Preview thumbnails with data attributes
+        if (el.matches('[data-preview-url], .preview-item, .banner-preview')) {
+            const n = ++counts.preview;
+            const previewUrl = el.getAttribute('data-preview-url') ||
+                             el.querySelector('a')?.href;
+            if (previewUrl) {
+                const rect = el.getBoundingClientRect();
+                addBanner({
+                    type: 'preview',
+                    url: previewUrl,
+                    width: Math.ceil(rect.width) || 0,
+                    height: Math.ceil(rect.height) || 0,
+                    title: el.getAttribute('alt') || el.textContent?.trim() || `Preview ${n}`,
+                    id: el.id || `preview-${n}`
+                });
+            }
+            continue;
+        }
+
+        // Links that might point to banners
+        if (el.tagName === 'A') {
+            const n = ++counts.link;
+            const href = el.href;
+            const text = el.textContent.trim();
+
+            // Only include if it looks like a banner link
+            if (href && (href.includes('banner') || href.includes('creative') || href.includes('ad') || text.toLowerCase().includes('banner'))) {
+                addBanner({
+                    type: 'link',
+                    url: href,
+                    width: 0, // Unknown, will auto-detect
+                    height: 0, // Unknown, will auto-detect
+                    title: text || `Link Banner ${n}`,
+                    id: el.id || `link-${n}`
+                });
+            }
+        }
+    }
+
+    return {
+        totalFound: banners.length,
+        banners: banners,
+        pageTitle: document.title,
+        pageUrl: window.location.href
+    };
+}
+"""
+
+# /debug-dimensions: the container detection with every element it considered
+_DEBUG_DIMENSIONS_JS = """
+() => {
+    // Try to find the banner container or body dimensions
+    const body = document.body;
+    const html = document.documentElement;
+
+    // Look for common banner container selectors in order of priority
+    const containers = [
+        '#mainHolder', '#container', '#main', '#banner-container',
+        // Hoxton-specific selectors
+        '.creative-container', '.banner-frame', '.ad-frame', 
+        '[data-creative]', '[data-banner]', '.hoxton-banner',
+        // General selectors
+        'canvas', '.banner', '#banner', '.ad', '#ad', 
+        '.creative', '#creative', '.container', 'main',
+        'div[style*="width"]', 'div[style*="height"]',
+        '.banner-wrap', '.ad-wrap', '.creative-wrap',
+        // Frame/iframe content
+        'body > div:first-child', 'body > *:first-child'
+    ];
+
+    let bannerWidth = 0;
+    let bannerHeight = 0;
+    let detectionMethod = 'fallback';
+    let foundElements = [];
+
+    // Special handling for Hoxton or other banner sharing platforms
+    const isHoxtonOrSimilar = window.location.hostname.includes('hoxton') || 
+                            document.querySelector('.creative-container, .banner-frame, [data-creative]');
+
+    // One DOM traversal for every selector, grouped by selector in document order
+    // as the capture's container detection does
+    const candidates = Array.from(document.querySelectorAll(containers.join(',')));
+    const matchesBySelector = containers.map(() => []);
+    candidates.forEach((element, index) => {
+        containers.forEach((selector, i) => {
+            if (element.matches(selector)) matchesBySelector[i].push(index);
+        });
+    });
+
+    // Try to find a container with explicit dimensions
+    for (const [i, selector] of containers.entries()) {
+        for (const index of matchesBySelector[i]) {
+            const element = candidates[index];
+            const rect = element.getBoundingClientRect();
+            const computedStyle = window.getComputedStyle(element);
+
+            foundElements.push({
+                selector: selector,
+                width: rect.width,
+                height: rect.height,
+                cssWidth: computedStyle.width,
+                cssHeight: computedStyle.height,
+                tagName: element.tagName,
+                id: element.id || 'no-id',
+                className: element.className || 'no-class'
+            });
+
+            // Check if element has explicit width/height
+            if (rect.width > 0 && rect.height > 0) {
+                // For banner-specific containers, prioritize them highly
+                if (selector.includes('mainHolder') || selector.includes('container') || 
+                    selector.includes('banner') || selector.includes('creative') || 
+                    selector.includes('ad')) {
+                    bannerWidth = Math.ceil(rect.width);
+                    bannerHeight = Math.ceil(rect.height);
+                    detectionMethod = `${selector} (banner container priority)`;
+                    break;
+                }
+
+                // Prefer elements with explicit CSS dimensions
+                const cssWidth = computedStyle.width;
+                const cssHeight = computedStyle.height;
+
+                if ((cssWidth && cssWidth !== 'auto') || (cssHeight && cssHeight !== 'auto')) {
+                    bannerWidth = Math.ceil(rect.width);
+                    bannerHeight = Math.ceil(rect.height);
+                    detectionMethod = `${selector} (CSS dimensions)`;
+                    break;
+                }
+
+                // If no CSS dimensions but has reasonable banner size, use it
+                if (rect.width < 2000 && rect.height < 2000 && 
+                    rect.width > 50 && rect.height > 50) {
+                    bannerWidth = Math.ceil(rect.width);
+                    bannerHeight = Math.ceil(rect.height);
+                    detectionMethod = `${selector} (computed size)`;
+                    break;
+                }
+            }
+        }
+        if (bannerWidth > 0 && bannerHeight > 0) break;
+    }
+
+    // Fallback to body/viewport dimensions if no container found
+    if (bannerWidth === 0 || bannerHeight === 0) {
+        const viewportWidth = window.innerWidth;
+        const viewportHeight = window.innerHeight;
+        const bodyRect = body.getBoundingClientRect();
+        const htmlRect = html.getBoundingClientRect();
+
+        // Use the smallest reasonable dimensions
+        bannerWidth = Math.min(viewportWidth, bodyRect.width || viewportWidth, htmlRect.width || viewportWidth);
+        bannerHeight = Math.min(viewportHeight, bodyRect.height || viewportHeight, htmlRect.height || viewportHeight);
+
+        // Clamp to reasonable banner sizes
+        bannerWidth = Math.max(100, Math.min(bannerWidth, 2000));
+        bannerHeight = Math.max(100, Math.min(bannerHeight, 2000));
+
+        detectionMethod = 'viewport/body fallback';
+    }
+
+    return {
+        width: bannerWidth,
+        height: bannerHeight,
+        detectionMethod: detectionMethod,
+        viewportWidth: window.innerWidth,
+        viewportHeight: window.innerHeight,
+        bodyWidth: body.getBoundingClientRect().width,
+        bodyHeight: body.getBoundingClientRect().height,
+        foundElements: foundElements
+    };
+}
+"""
+
+# The page scripts above, installed once per browser context with add_init_script so each capture or scan
+# evaluates a ~60-byte call instead of sending and re-parsing its full source per page
+_PAGE_HELPER_SOURCES = {
+    'pageInfo': _CAPTURE_PAGE_INFO_JS,
+    'animationInfo': _ANIMATION_INFO_JS,
+    'iframeHoxton': _IFRAME_HOXTON_JS,
+    'scanPreview': _SCAN_PREVIEW_JS,
+    'debugDimensions': _DEBUG_DIMENSIONS_JS,
+}
+_PAGE_HELPERS_JS = "window.__bannerCapture = {" + ", ".join(
+    f"{name}: ({source})" for name, source in _PAGE_HELPER_SOURCES.items()
+) + "};"
+
+# True once a hoxton element exists in the page or one of its same-origin iframes
+_HOXTON_PRESENT_JS = """
+() => !!document.querySelector('hoxton') || Array.from(document.querySelectorAll('iframe')).some(iframe => {
+    try {
+        return !!iframe.contentDocument?.querySelector('hoxton');
+    } catch (e) {
+        return false;
+    }
+})
+"""
+
+# Hoxton diagnostics for /test-hoxton: every hoxton element in the page and its same-origin iframes,
+# plus raw HTML matches and body structure for pages where none is found
+_HOXTON_INSPECT_JS = """
+() => {
+    // Serialized once; the contains checks and raw searches below all read this copy
+    const fullHTML = document.documentElement.outerHTML;
+
+    // First few matches only, so the scan stops instead of collecting every match in the page
+    function firstMatches(regex, limit) {
+        const matches = [];
+        let match;
+        while (matches.length < limit && (match = regex.exec(fullHTML))) {
+            matches.push(match[0]);
+        }
+        return matches;
+    }
+
+    const result = {
+        pageTitle: document.title,
+        hoxtonElements: [],
+        pageContainsHoxton: fullHTML.includes('hoxton'),
+        pageContainsReportingLabel: fullHTML.includes('reportingLabel'),
+        allElementsWithData: [],
+        bodyStructure: [],
+        customElements: [],
+        iframeAnalysis: [],
+        rawHTMLSearch: {
+            // Search for hoxton tags and reportingLabel in raw HTML
+            hoxtonMatches: firstMatches(/<hoxton[^>]*>/gi, 5),
+            reportingLabelMatches: firstMatches(/reportingLabel[^}]{0,100}/gi, 5)
+        }
+    };
+
+    // Function to extract hoxton data from an element
+    // The raw data attribute is decoded and parsed server-side (_describe_hoxton_element)
+    function extractHoxtonData(el, source) {
+        const dataAttr = el.getAttribute('data');
+        return {
+            source: source,
+            tagName: el.tagName,
+            hasDataAttr: el.hasAttribute('data'),
+            dataLength: dataAttr?.length || 0,
+            dataPreview: dataAttr?.substring(0, 300) || 'no data',
+            dataAttr: dataAttr,
+            outerHTMLPreview: el.outerHTML.substring(0, 500)
+        };
+    }
+
+    // Check main document for hoxton elements
+    const mainHoxtonEls = document.querySelectorAll('hoxton, HOXTON');
+    for (const el of mainHoxtonEls) {
+        result.hoxtonElements.push(extractHoxtonData(el, 'main-document'));
+    }
+
+    // Check all iframes for hoxton elements
+    const iframes = document.querySelectorAll('iframe');
+    for (let i = 0; i < iframes.length; i++) {
+        const iframe = iframes[i];
+        const iframeInfo = {
+            index: i,
+            src: iframe.src,
+            id: iframe.id,
+            className: iframe.className,
+            accessible: false,
+            hoxtonElementsFound: 0,
+            hoxtonElements: [],
+            bodyStructure: []
+        };
+
+        try {
+            // Try to access iframe content
+            const iframeDoc = iframe.contentDocument || iframe.contentWindow?.document;
+            if (iframeDoc) {
+                iframeInfo.accessible = true;
+
+                // Look for hoxton elements in iframe
+                const iframeHoxtonEls = iframeDoc.querySelectorAll('hoxton, HOXTON');
+                iframeInfo.hoxtonElementsFound = iframeHoxtonEls.length;
+
+                for (const el of iframeHoxtonEls) {
+                    const hoxtonData = extractHoxtonData(el, `iframe-${i}`);
+                    result.hoxtonElements.push(hoxtonData);
+                    iframeInfo.hoxtonElements.push(hoxtonData);
+                }
+
+                // Get iframe body structure
+                if (iframeDoc.body) {
+                    const iframeBodyChildren = Array.from(iframeDoc.body.children);
+                    for (let j = 0; j < Math.min(10, iframeBodyChildren.length); j++) {
+                        const el = iframeBodyChildren[j];
+                        iframeInfo.bodyStructure.push({
+                            index: j,
+                            tagName: el.tagName,
+                            className: el.className,
+                            id: el.id,
+                            hasDataAttr: el.hasAttribute('data'),
+                            dataLength: el.getAttribute('data')?.length || 0,
+                            isHoxton: el.tagName && el.tagName.toLowerCase() === 'hoxton'
+                        });
                     }
                 }
-                return { success: false, error: 'No hoxton element found' };
             }
-        """)
-        
-        await context.close()
-        
-        if hoxton_data.get('success'):
-            logger.info(f"Successfully extracted Hoxton data: {hoxton_data}")
-            return hoxton_data
-        else:
-            logger.warning(f"Failed to extract Hoxton data: {hoxton_data.get('error')}")
+        } catch (e) {
+            iframeInfo.error = e.message;
+        }
+
+        result.iframeAnalysis.push(iframeInfo);
+    }
+
+    // Get main document body structure
+    const bodyChildren = Array.from(document.body.children);
+    for (let i = 0; i < Math.min(15, bodyChildren.length); i++) {
+        const el = bodyChildren[i];
+        result.bodyStructure.push({
+            index: i,
+            tagName: el.tagName,
+            className: el.className,
+            id: el.id,
+            hasDataAttr: el.hasAttribute('data'),
+            dataLength: el.getAttribute('data')?.length || 0,
+            outerHTMLPreview: el.outerHTML.substring(0, 300),
+            isHoxton: el.tagName && el.tagName.toLowerCase() === 'hoxton',
+            isIframe: el.tagName && el.tagName.toLowerCase() === 'iframe'
+        });
+    }
+
+    return result;
+}
+"""
+
+# Unfilled template placeholders such as {versionName} in a hoxton reportingLabel
+_PLACEHOLDER_RE = re.compile(r'[{}]')
+_LEADING_INT_RE = re.compile(r'\s*([+-]?\d+)')
+
+def _parse_hoxton_data(raw):
+    """Decode a hoxton data attribute (URL-encoded JSON, sometimes encoded twice) into a dict, or None"""
+    decoded = unquote(raw)
+    try:
+        data = json.loads(decoded)
+    except ValueError:
+        if '%' not in decoded:
             return None
-            
-    except Exception as e:
-        logger.error(f"Error extracting from iframe {iframe_url}: {str(e)}")
-        return None
+        try:
+            data = json.loads(unquote(decoded))
+        except ValueError:
+            return None
+    return data if isinstance(data, dict) else None
 
-def generate_banner_filename(banner_info, url, format='png', index=None):
-    """Generate a descriptive filename based on banner metadata"""
-    import re
-    
-    # Debug logging
-    logger.info(f"🎯 FILENAME GENERATION DEBUG:")
-    logger.info(f"  - banner_info keys: {list(banner_info.keys()) if banner_info else 'None'}")
-    logger.info(f"  - bannerName: '{banner_info.get('bannerName', 'NOT SET')}'")
-    logger.info(f"  - hoxtonData: {banner_info.get('hoxtonData', 'NOT SET')}")
-    
-    # Extract Hoxton metadata if available
-    hoxton_data = banner_info.get('hoxtonData', {})
-    logger.info(f"  - hoxton_data extracted: {hoxton_data}")
-    
-    # Priority order for naming:
-    # 1. Hoxton reportingLabel (if not a placeholder)
-    # 2. Hoxton name 
-    # 3. Regular bannerName
-    # 4. Fallback to generic name
+def _iframe_hoxton_data(result):
+    """Turn the iframeHoxton page helper's raw data attribute into the hoxton fields the capture uses"""
+    if not result.get('success'):
+        return result
+    data = _parse_hoxton_data(result['data'])
+    if data is None:
+        return {'success': False, 'error': 'Hoxton data is not valid URL-encoded JSON'}
+    hoxton_data = {'success': True}
+    for key in ('name', 'reportingLabel', 'adType', 'adSize', 'platform'):
+        if key in data:
+            hoxton_data[key] = data[key]
+    return hoxton_data
+
+def _describe_hoxton_element(element):
+    """Replace a /test-hoxton element's raw data attribute with its decoded preview and parsed fields"""
+    if 'dataAttr' not in element:
+        return  # already described; the same element is listed under its iframe too
+    raw = element.pop('dataAttr')
+    parsed = _parse_hoxton_data(raw) if raw else None
+    element['decodedPreview'] = unquote(raw)[:300] if raw else 'no decoded data'
+    element['parsedName'] = (parsed or {}).get('name') or 'no parsed name'
+    element['parsedReportingLabel'] = (parsed or {}).get('reportingLabel') or 'no parsed reportingLabel'
+    element['rawParsedData'] = parsed
+
+def _leading_int(value):
+    """Integer at the start of value, like JavaScript's parseInt, or None"""
+    match = _LEADING_INT_RE.match(str(value)) if value is not None else None
+    return int(match.group(1)) if match else None
+
+def _apply_hoxton_data(banner_info):
+    """Fold the raw hoxton data attributes returned by _BANNER_INFO_JS into banner_info's name, metadata and size"""
+    debug = banner_info.get('bannerNameDebug') or {'attempts': [], 'found': None}
+    parsed = []
+    for item in banner_info.pop('hoxtonData', None) or []:
+        if not item.get('data'):
+            continue
+        data = _parse_hoxton_data(item['data'])
+        if data is None:
+            debug['attempts'].append(f"[{item.get('source')}] JSON parse error")
+        else:
+            debug['attempts'].append(f"[{item.get('source')}] Parsed JSON, keys: {', '.join(data)}")
+            parsed.append((item.get('source'), data))
     
-    banner_name = ''
-    name_source = ''
+    # Name: a real reportingLabel, then name, then a placeholder reportingLabel as a last resort
+    for source, data in parsed:
+        label = data.get('reportingLabel')
+        if isinstance(label, str) and label.strip() and not _PLACEHOLDER_RE.search(label):
+            name, found = label, 'reportingLabel'
+        elif data.get('name'):
+            name, found = data['name'], 'name (reportingLabel was placeholder/blank)'
+        elif label:
+            name, found = label, 'reportingLabel (using placeholder)'
+        else:
+            continue
+        banner_info['bannerName'] = name
+        banner_info['hoxtonData'] = data
+        debug['found'] = f"[{source}] {found}: {name}"
+        break
     
-    # Check Hoxton reportingLabel first
-    reporting_label = hoxton_data.get('reportingLabel', '')
-    if reporting_label and reporting_label != '{versionName}' and reporting_label.strip():
-        banner_name = reporting_label.strip()
-        name_source = 'hoxton_reportingLabel'
-        logger.info(f"Using Hoxton reportingLabel: '{banner_name}'")
+    if not parsed:
+        return
     
-    # Check Hoxton name if no reportingLabel
-    elif hoxton_data.get('name', '').strip():
-        banner_name = hoxton_data.get('name', '').strip()
-        name_source = 'hoxton_name'
-        logger.info(f"Using Hoxton name: '{banner_name}'")
+    # Metadata from the first hoxton element; page data attributes fill what it lacks
+    source, data = parsed[0]
+    ad_size = data.get('adSize') if isinstance(data.get('adSize'), dict) else {}
+    ad_type = data.get('adType')
+    page_meta = banner_info.get('metadata') or {}
+    metadata = {
+        'source': source,
+        'hoxtonData': {key: data.get(key) for key in ('name', 'reportingLabel', 'adType', 'adSize', 'platform')},
+        'dataWidth': _leading_int(ad_size.get('width')),
+        'dataHeight': _leading_int(ad_size.get('height')),
+        'format': ad_type.lower() if isinstance(ad_type, str) else None,
+        'platform': data.get('platform')
+    }
+    if not (metadata['dataWidth'] and metadata['dataHeight']) and 'dataWidth' in page_meta:
+        metadata['dataWidth'], metadata['dataHeight'] = page_meta['dataWidth'], page_meta['dataHeight']
+    if not metadata['format'] and page_meta.get('format'):
+        metadata['format'] = page_meta['format']
+    for key in ('campaign', 'client'):
+        if key in page_meta:
+            metadata[key] = page_meta[key]
+    banner_info['metadata'] = metadata
     
-    # Fallback to regular banner name
-    elif banner_info.get('bannerName', '').strip():
-        banner_name = banner_info.get('bannerName', '').strip()
-        name_source = 'banner_name'
-        logger.info(f"Using extracted banner name: '{banner_name}'")
+    # The hoxton adSize is exact; only the top-priority container on the page overrides it
+    width, height = metadata['dataWidth'], metadata['dataHeight']
+    if width and height and not banner_info.get('primaryContainerDetected'):
+        banner_info['width'], banner_info['height'] = width, height
+        banner_info['detectionMethod'] = 'Hoxton adSize data (exact)'
+
+class ScreenshotService:
+    def __init__(self):
+        self.use_pool = True  # Enable browser pooling for better performance
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_CAPTURES)  # Bound concurrent Chromium work
+        self.active = 0  # Captures holding a semaphore slot
+        self.queued = 0  # Captures waiting for one
+        self.warm = False  # Set once the boot-time pool warm-up finishes within WARMUP_TIMEOUT
+        self.warmup_error = None
     
-    # Clean banner name for filename use
-    if banner_name:
-        # Remove file extensions if present
-        banner_name = re.sub(r'\.(png|jpg|jpeg|gif|svg|webp)$', '', banner_name, flags=re.IGNORECASE)
-        
-        # Remove zero-width spaces and other invisible Unicode characters
-        clean_name = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', banner_name)  # Remove zero-width chars
-        clean_name = re.sub(r'[^\x00-\x7F]', '', clean_name)  # Remove non-ASCII chars
+    def has_capacity(self, count=1):
+        """Whether count more captures can start or queue without exceeding MAX_QUEUED"""
+        free_slots = MAX_CONCURRENT_CAPTURES - self.active
+        return count <= free_slots + MAX_QUEUED - self.queued
         
-        # Clean special characters and normalize
-        clean_name = re.sub(r'[<>:"/\\|?*]', '_', clean_name)
-        clean_name = re.sub(r'\s+', '_', clean_name)
-        clean_name = re.sub(r'_+', '_', clean_name)  # Remove multiple underscores
-        clean_name = clean_name.strip('_')  # Remove leading/trailing underscores
-        clean_name = clean_name[:60]  # Limit length but allow longer for descriptive names
-        logger.info(f"Cleaned banner name: '{clean_name}' (from {name_source})")
-    else:
-        clean_name = ''
-        logger.info("No banner name found, using fallback naming")
-    
-    # Get additional metadata for filename enrichment
-    width = banner_info.get('width', 0)
-    height = banner_info.get('height', 0)
-    
-    # Extract platform/format info from Hoxton if available
-    platform = hoxton_data.get('platform', '')
-    ad_type = hoxton_data.get('adType', '')
-    
-    # Get domain/platform info
-    hostname = banner_info.get('hostname', '')
-    if hostname:
-        domain = hostname.replace('www.', '').split('.')[0]
-    else:
-        domain = 'banner'
-    
-    # Build filename parts intelligently
-    parts = []
-    
-    # Always start with the main name if we have one
-    if clean_name:
-        parts.append(clean_name)
-    
-    # Add dimensions if reasonable and not already in name
-    if width > 0 and height > 0:
-        dimension_str = f'{width}x{height}'
-        if not clean_name or dimension_str not in clean_name:
-            parts.append(dimension_str)
-    
-    # Add platform info if meaningful and not redundant
-    if platform and platform not in ['web', 'html5'] and (not clean_name or platform.lower() not in clean_name.lower()):
-        parts.append(platform.lower())
-    
-    # Add ad type if meaningful and not redundant
-    if ad_type and ad_type not in ['banner', 'display'] and (not clean_name or ad_type.lower() not in clean_name.lower()):
-        parts.append(ad_type.lower())
-    
-    # Add domain if it's helpful and not already included
-    if domain and domain != 'banner' and domain != 'hoxton' and (not clean_name or domain.lower() not in clean_name.lower()):
-        parts.append(domain)
-    
-    # Add index if provided (for batch processing)
-    if index is not None:
-        parts.append(f'{index+1:02d}')
-    
-    # Don't add timestamp - use clean names only
-    # This gives us readable filenames like: 123_Payworld_Display_Think_IAB_market_300x600.png
-    
-    # Combine parts
-    if parts:
-        filename_base = '_'.join(parts)
-    else:
-        # Fallback only if we have no name at all
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename_base = f'banner_{timestamp}'
+    async def get_browser_context(self, pages=1):
+        """Get a browser context (using pool if enabled) for up to pages captures"""
+        if self.use_pool:
+            return await browser_pool.get_browser_context(pages)
+        else:
+            # Fallback to old method
+            return await self._create_fresh_browser_context()
     
-    # Final cleanup
-    filename_base = re.sub(r'_+', '_', filename_base)  # Remove multiple underscores
-    filename_base = filename_base.strip('_')  # Remove leading/trailing underscores
+    async def _create_fresh_browser_context(self):
+        """Create a fresh browser context (legacy method)"""
+        if not PLAYWRIGHT_AVAILABLE:
+            raise Exception("Playwright is not installed. Please install it with: pip install playwright")
+            
+        # Create a fresh playwright instance for each request
+        playwright = await async_playwright().start()
+        
+        # Launch browser with optimized settings
+        browser = await playwright.chromium.launch(
+            headless=True,
+            args=[
+                '--no-sandbox',
+                '--disable-dev-shm-usage',
+                '--disable-gpu',
+                '--disable-extensions',
+                '--disable-background-timer-throttling',
+                '--disable-renderer-backgrounding',
+                '--disable-backgrounding-occluded-windows',
+                '--disable-features=TranslateUI',
+                '--disable-ipc-flooding-protection'
+            ]
+        )
+        
+        # Create a new context with optimized settings
+        context = await browser.new_context(
+            viewport={'width': 1920, 'height': 1080},
+            device_scale_factor=2,  # 2x scaling for crisp text rendering
+            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
+        )
+        await context.add_init_script(_PAGE_HELPERS_JS)
+        
+        return playwright, browser, context
     
-    # Final Unicode cleanup to ensure no invisible characters remain
-    filename_base = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', filename_base)  # Remove zero-width chars
-    filename_base = re.sub(r'[^\w\-_.]', '', filename_base)  # Keep only safe filename characters
-    filename_base = filename_base.strip('_.')  # Remove any trailing underscores or dots
+    async def release_browser_context(self, playwright, browser, context):
+        """Hand a pooled browser and its context back, or close a fresh one"""
+        if self.use_pool:
+            if context is not None:
+                await browser_pool.release_context(browser, context)
+            return
+        try:
+            if context:
+                await context.close()
+        finally:
+            if browser:
+                await browser.close()
+            if playwright:
+                await playwright.stop()
+        
+    async def _navigate(self, page, url):
+        """Load url up to its load event, then give late requests and web fonts a bounded grace period"""
+        await page.goto(url, wait_until='load', timeout=NAVIGATION_TIMEOUT_MS)
+        try:
+            await page.wait_for_load_state('networkidle', timeout=NETWORK_IDLE_GRACE_MS)
+            await page.wait_for_function("() => document.fonts.status === 'loaded'", timeout=NETWORK_IDLE_GRACE_MS)
+        except Exception:
+            # Still busy (beacons, polling) - the page has loaded, so carry on
+            pass
     
-    result_filename = f'{filename_base}.{format}'
-    logger.info(f"Generated filename: '{result_filename}' (name_source: {name_source})")
+    async def _evaluate_page_helper(self, page, name, arg=None):
+        """Run one of the _PAGE_HELPERS_JS functions, sending its full source only if the page lacks them"""
+        result = await page.evaluate(f"(arg) => window.__bannerCapture ? window.__bannerCapture.{name}(arg) : null", arg)
+        if result is None:
+            result = await page.evaluate(_PAGE_HELPER_SOURCES[name], arg)
+        return result
     
-    return result_filename
+    async def capture_screenshot(self, url, width=None, height=None, format='png', wait_time=3, skip_transcode=False,
+                                 session=None):
+        """Capture screenshot of the given URL, waiting for a free capture slot first
 
-def clean_filename_for_zip(filename):
-    """Clean filename for ZIP archive consistency"""
-    if not filename:
-        return 'banner.png'
-    
-    # Remove zero-width spaces and other invisible Unicode characters
-    clean_name = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', filename)  # Remove zero-width chars
-    clean_name = re.sub(r'[^\x00-\x7F]', '', clean_name)  # Remove non-ASCII chars
-    
-    # Clean special characters that might cause issues in ZIP files
-    clean_name = re.sub(r'[<>:"/\\|?*]', '_', clean_name)
-    clean_name = re.sub(r'\s+', '_', clean_name)
-    clean_name = re.sub(r'_+', '_', clean_name)  # Remove multiple underscores
-    clean_name = clean_name.strip('_.')  # Remove leading/trailing underscores and dots
+        session: (playwright, browser, context) shared by a batch, which holds the capture slot
+        this runs on; the capture then opens and closes only its own page in that context (optional)
+        """
+        # A recent identical capture needs no slot; callers set filename/index, so each gets its own copy.
+        # Local banner files are always rendered afresh: they are edited and re-captured in the QA loop
+        cache_key = (url, width, height, format, wait_time, skip_transcode)
+        cacheable = CACHE_TTL > 0 and not (isinstance(url, str) and _local_file_target(url))
+        if cacheable:
+            cached = capture_cache.get(cache_key)
+            if cached is not None:
+                logger.info("⚡ Capture cache hit for %s", url)
+                return dict(cached)
+        
+        if session is not None:
+            # The batch already holds the capture slot this runs on
+            result = await self._capture_screenshot(url, width, height, format, wait_time, skip_transcode, session)
+        else:
+            await self.acquire_slot()
+            try:
+                result = await self._capture_screenshot(url, width, height, format, wait_time, skip_transcode)
+            finally:
+                self.release_slot()
+        if cacheable and result.get('success'):
+            capture_cache.set(cache_key, dict(result))
+        return result
     
-    # Ensure we have a valid filename
-    if not clean_name or clean_name == '.':
-        return 'banner.png'
+    async def acquire_slot(self):
+        """Wait for a capture slot, raising ServerBusyError when the queue is already full"""
+        if self.semaphore.locked() and self.queued >= MAX_QUEUED:
+            raise ServerBusyError(f"Capture queue is full ({self.queued} waiting)")
+        
+        self.queued += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
     
-    # Ensure file extension exists
-    if '.' not in clean_name:
-        clean_name += '.png'
+    async def try_acquire_slot(self):
+        """Take a capture slot only if one is free right now; never waits"""
+        if self.semaphore.locked():
+            return False
+        await self.semaphore.acquire()
+        self.active += 1
+        return True
     
-    return clean_name
+    def release_slot(self):
+        """Hand back a slot taken with acquire_slot() or try_acquire_slot()"""
+        self.active -= 1
+        self.semaphore.release()
 
-@app.route('/')
-def index():
-    """Serve the main HTML file"""
-    return send_from_directory('.', 'index.html')
+    async def _capture_screenshot(self, url, width=None, height=None, format='png', wait_time=3, skip_transcode=False,
+                                  session=None):
+        """Capture screenshot of the given URL"""
+        playwright = None
+        browser = None
+        context = None
+        page = None
+        
+        try:
+            # Get a browser context for this request, unless it is part of a batch sharing one
+            if session is None:
+                playwright, browser, context = await self.get_browser_context()
+            else:
+                playwright, browser, context = session
+            
+            # Create a new page
+            page = await context.new_page()
+            
+            # Navigate to the URL first to get actual dimensions
+            logger.info("Navigating to: %s", url)
+            await self._navigate(page, url)
+            
+            # Wait for the element the extraction reads (hoxton data or a banner iframe) rather
+            # than a fixed 2s; pages with neither still get the old 2s to finish dynamic content
+            try:
+                await page.wait_for_function(
+                    "() => document.querySelector('hoxton[data]') || document.querySelector('iframe')",
+                    timeout=2000
+                )
+            except Exception:
+                pass
+            
+            # Hoxton debug info and banner dimensions/metadata in one round-trip; the page source
+            # sample needs the whole DOM serialized, so it is only taken when debug logging is on
+            include_source = logger.isEnabledFor(logging.DEBUG)
+            page_info = await self._evaluate_page_helper(page, 'pageInfo', include_source)
+            banner_info = page_info['bannerInfo']
+            
+            logger.info("Hoxton debug info: %s", page_info['hoxtonDebug'])
+            if include_source:
+                logger.debug("Page source sample around 'hoxton': %s", page_info['pageSourceSample'])
 
-@app.route('/<path:filename>')
-def static_files(filename):
-    """Serve static files (CSS, JS, etc.)"""
-    return send_from_directory('.', filename)
+            # Decode the hoxton data attributes here rather than in the page
+            hoxton_count = len(banner_info.get('hoxtonData') or [])
+            _apply_hoxton_data(banner_info)
+            if hoxton_count:
+                logger.info("Hoxton detection found %s hoxton elements", hoxton_count)
+                if banner_info.get('hoxtonData'):
+                    logger.info("✅ Banner name from hoxton data: %s", banner_info['bannerName'])
+            else:
+                logger.warning("❌ Enhanced hoxton detection found no elements")
 
-@app.route('/test-hoxton', methods=['POST'])
-def test_hoxton():
-    """Test endpoint to debug Hoxton element detection"""
-    try:
-        data = request.get_json()
-        url = data.get('url', '')
-        
-        if not url:
-            return jsonify({'error': 'URL required'}), 400
+            # Check if we need to extract Hoxton data from iframes (if not found in main document)
+            banner_name_debug = banner_info.get('bannerNameDebug', {})
+            iframe_urls = banner_name_debug.get('iframeUrls', [])
+            
+            logger.info("Banner name from JavaScript: '%s'", banner_info.get('bannerName', ''))
+            logger.info("Banner name debug found: '%s'", banner_name_debug.get('found', 'Not available'))
+            logger.info("Iframe URLs detected: %s", iframe_urls)
+            
+            # Skip iframe URL processing if we already found hoxton data
+            if banner_info.get('bannerName') and banner_info.get('hoxtonData'):
+                logger.info("✅ Already found hoxton data, skipping iframe URL processing")
+            elif (not banner_info.get('bannerName') or banner_info.get('bannerName') == '') and iframe_urls:
+                # Resolve relative URLs, then drop duplicates, about:/data:/javascript: frames and
+                # tracker iframes, none of which can carry the banner's hoxton data
+                iframe_urls = list(dict.fromkeys(
+                    absolute for absolute in (urljoin(url, iframe_url) for iframe_url in iframe_urls)
+                    if absolute.startswith(('http://', 'https://')) and not _TRACKER_URL_PATTERN.match(absolute)
+                ))
+                logger.info("No banner name found in main document, trying %s iframe URLs", len(iframe_urls))
+                
+                iframe_slots = asyncio.Semaphore(MAX_IFRAME_PROBES)
+                
+                async def extract_from_iframe(i, absolute_iframe_url):
+                    """Load one iframe URL in its own page and read its hoxton data"""
+                    async with iframe_slots:
+                        logger.info("Trying to extract Hoxton data from iframe %s: %s", i, absolute_iframe_url)
+                        
+                        iframe_page = await context.new_page()
+                        try:
+                            # Don't wait for the network to go quiet; wait for the hoxton element itself
+                            # and give up after 5s on iframes without one
+                            await iframe_page.goto(absolute_iframe_url, wait_until='domcontentloaded', timeout=10000)
+                            try:
+                                await iframe_page.wait_for_selector('hoxton[data]', state='attached', timeout=5000)
+                            except Exception:
+                                pass
+                            
+                            # Try to extract hoxton data from iframe
+                            return _iframe_hoxton_data(await self._evaluate_page_helper(iframe_page, 'iframeHoxton'))
+                        finally:
+                            await iframe_page.close()
+                
+                # Iframe pages open in the capture's own context, which already has the page helpers;
+                # they load concurrently and the first in page order with hoxton data wins, as when
+                # they were tried one after another. Once it is known the rest are cancelled
+                iframe_tasks = [asyncio.ensure_future(extract_from_iframe(i, iframe_url))
+                                for i, iframe_url in enumerate(iframe_urls)]
+                
+                for i, iframe_task in enumerate(iframe_tasks):
+                    try:
+                        iframe_hoxton_data = await iframe_task
+                    except Exception as e:
+                        iframe_hoxton_data = e
+                    if isinstance(iframe_hoxton_data, Exception):
+                        logger.error("Error processing iframe %s (%s): %s", i, iframe_urls[i], iframe_hoxton_data,
+                                     exc_info=iframe_hoxton_data)
+                    elif iframe_hoxton_data.get('success'):
+                        logger.info("Successfully extracted Hoxton data from iframe: %s", iframe_hoxton_data)
+                        
+                        # Update banner_info with iframe data
+                        if iframe_hoxton_data.get('reportingLabel') and iframe_hoxton_data['reportingLabel'] != '{versionName}':
+                            banner_info['bannerName'] = iframe_hoxton_data['reportingLabel']
+                            logger.info("Updated banner name from iframe reportingLabel: %s", banner_info['bannerName'])
+                        elif iframe_hoxton_data.get('name'):
+                            banner_info['bannerName'] = iframe_hoxton_data['name']
+                            logger.info("Updated banner name from iframe name: %s", banner_info['bannerName'])
+                        
+                        # Add hoxton metadata to banner_info
+                        banner_info['hoxtonData'] = iframe_hoxton_data
+                        break  # Found data, ignore later iframes
+                    else:
+                        logger.warning("Failed to extract from iframe %s: %s", i, iframe_hoxton_data.get('error'))
+                
+                # Let cancelled probes close their pages before the context is released
+                for iframe_task in iframe_tasks:
+                    iframe_task.cancel()
+                await asyncio.gather(*iframe_tasks, return_exceptions=True)
+            else:
+                logger.info("Skipping iframe processing - banner name: '%s', iframe URLs: %s", banner_info.get('bannerName'), len(iframe_urls))
+
+            # Use auto-detected dimensions if not specified
+            if width is None:
+                width = banner_info['width']
+            if height is None:
+                height = banner_info['height']
+                
+            logger.info("Detection method: %s", banner_info['detectionMethod'])
+            logger.info("Detected dimensions: %sx%s", banner_info['width'], banner_info['height'])
+            logger.info("Viewport: %sx%s", banner_info['viewportWidth'], banner_info['viewportHeight'])
+            logger.info("Body: %sx%s", banner_info['bodyWidth'], banner_info['bodyHeight'])
+            logger.info("Banner name: %s", banner_info.get('bannerName', 'Not detected'))
+            
+            # Log banner name debug info
+            banner_name_debug = banner_info.get('bannerNameDebug')
+            if banner_name_debug and logger.isEnabledFor(logging.INFO):
+                logger.info("Banner name debug - Found: %s", banner_name_debug.get('found', 'nothing'))
+                for attempt in banner_name_debug.get('attempts', []):
+                    logger.info("  - %s", attempt)
+            
+            logger.info("Final dimensions to use: %sx%s", width, height)
+
+            # Set viewport to exact banner dimensions for pixel-perfect rendering
+            await page.set_viewport_size({'width': width, 'height': height})
+
+            # Add font rendering optimizations for crisp text
+            await page.add_init_script("""
+                // Force font smoothing for better text rendering
+                document.documentElement.style.webkitFontSmoothing = 'antialiased';
+                document.documentElement.style.mozOsxFontSmoothing = 'grayscale';
+                document.documentElement.style.fontSmooth = 'always';
+                document.documentElement.style.textRendering = 'optimizeLegibility';
+            """)
+
+            # Wait for animations and dynamic content to complete
+            # Wait for initial load
+            await asyncio.sleep(2)            # Advanced animation detection with GSAP support (including iframes)
+            logger.info("Detecting animations (GSAP in iframes, CSS, Video)...")
+            
+            # Enhanced animation detection with iframe GSAP Timeline support
+            animation_info = await self._evaluate_page_helper(page, 'animationInfo')
+            
+            logger.info("Animation detection: %s", animation_info)
+            
+            # Extract animation information
+            detected_duration = animation_info.get('maxDuration', 0)
+            has_animations = animation_info.get('animationCount', 0) > 0
+            has_canvas = animation_info.get('hasCanvas', False)
+            has_video = animation_info.get('hasVideo', False)
+            gsap_info = animation_info.get('gsap', {})
+            
+            # GSAP-specific handling for precise end-frame capture
+            if gsap_info.get('found') and gsap_info.get('totalDuration', 0) > 0:
+                gsap_duration = gsap_info['totalDuration']
+                timeline_count = len(gsap_info.get('timelines', []))
+                
+                logger.info("🎬 GSAP detected: %s timelines, total duration: %ss", timeline_count, gsap_duration)
+                
+                # Use the specialized GSAP handler
+                gsap_handled = await self._handle_gsap_timeline(page, max_timeout=30)
+                
+                if gsap_handled:
+                    logger.info("✅ GSAP timeline handled successfully - positioned at end frame")
+                else:
+                    logger.warning("⚠️ GSAP handler failed, using fallback wait")
+                    await asyncio.sleep(min(gsap_duration, 30))
+                    
+            # Fallback to other animation types if no GSAP
+            elif detected_duration > 0:
+                # We detected CSS animation duration - wait for full cycle plus buffer
+                optimal_wait = min(detected_duration + 1, 30)  # Cap at 30 seconds
+                logger.info("🎨 CSS animation duration: %ss, waiting %ss", detected_duration, optimal_wait)
+                await asyncio.sleep(optimal_wait)
+            elif has_canvas or has_video:
+                # Canvas/video content - use frame stability check
+                logger.info("🎥 Canvas/video content detected - using frame stability detection")
+                await self._wait_for_frame_stability(page, timeout=wait_time*1000)
+            elif has_animations:
+                # Has animations but couldn't detect duration - use dynamic checking
+                logger.info("🔄 Animations detected but duration unknown - using dynamic detection")
+                await self._wait_for_animation_completion(page, timeout=wait_time*1000)
+            else:
+                # No animations detected - use standard wait
+                logger.info("⏱️ No animations detected - using standard wait of %ss", wait_time)
+                await asyncio.sleep(wait_time)
+            
+            # Final frame stability check to ensure we capture the end frame
+            await self._ensure_end_frame(page, wait_time)            # Take screenshot with proper format
+            logger.info("Taking screenshot with dimensions: %sx%s, format: %s", width, height, format)
+            
+            # Ensure we're using the correct format
+            screenshot_format = 'png' if format.lower() in ['png'] else 'jpeg'
+            
+            screenshot_bytes = await page.screenshot(
+                type='png',  # Always capture as PNG first for quality
+                full_page=False,  # Only capture viewport
+                clip={'x': 0, 'y': 0, 'width': width, 'height': height}
+            )
+
+            # Convert to JPG with size optimization for compliance, unless the caller
+            # asked for the PNG the browser already produced
+            try:
+                # Check if we need to resize due to device_scale_factor
+                from PIL import Image
+                import io as image_io
+                
+                # Open the captured image to check its actual dimensions
+                temp_image = Image.open(image_io.BytesIO(screenshot_bytes))
+                actual_width, actual_height = temp_image.size
+                
+                # If image is 2x larger due to device_scale_factor, resize it back to target dimensions
+                resized = actual_width == width * 2 and actual_height == height * 2
+                if resized:
+                    logger.info("🔄 Resizing high-DPI capture from %sx%s back to %sx%s", actual_width, actual_height, width, height)
+                    # Resize back to target dimensions using high-quality resampling, off the event loop
+                    resized_image = await asyncio.get_running_loop().run_in_executor(
+                        None, partial(temp_image.resize, (width, height), Image.Resampling.LANCZOS)
+                    )
+                    temp_image.close()
+                    temp_image = resized_image
+                
+                if skip_transcode:
+                    # Re-encode only when resized or PNG optimization is on, and not for small captures
+                    # at the lossless level; Image.open only read the header, so those are never decoded
+                    if resized or PNG_QUALITY_LEVEL >= 2 or (
+                            PNG_QUALITY_LEVEL == 1 and len(screenshot_bytes) > PNG_OPTIMIZE_MIN_KB * 1024):
+                        screenshot_bytes = await asyncio.get_running_loop().run_in_executor(
+                            None, optimize_png, temp_image
+                        )
+                    temp_image.close()
+                    screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
+                    actual_format = NATIVE_SCREENSHOT_FORMAT
+                    logger.info("📷 PNG output: %.1fKB (PNG_QUALITY_LEVEL=%s)", len(screenshot_bytes) / 1024, PNG_QUALITY_LEVEL)
+                else:
+                    # Encode off the event loop so other captures keep rendering; Pillow
+                    # releases the GIL while encoding, so concurrent encodes use every core
+                    loop = asyncio.get_running_loop()
+                    optimized_jpg_data, final_quality, final_size_kb = await loop.run_in_executor(
+                        None, partial(optimize_image_to_jpg, screenshot_bytes, image=temp_image,
+                                      out_buf=image_io.BytesIO())
+                    )
+                    temp_image.close()
+
+                    # Final safety check: Ensure file is absolutely under 39KB
+                    optimized_jpg_data = await loop.run_in_executor(
+                        None, partial(ensure_size_limit, optimized_jpg_data, max_size_kb=39)
+                    )
+                    final_size_kb = len(optimized_jpg_data) / 1024
+                
+                    screenshot_base64 = base64.b64encode(optimized_jpg_data).decode('utf-8')
+                    actual_format = 'jpeg'
+
+                    logger.info("📷 Image optimized: %.1fKB at %s%% quality", final_size_kb, final_quality)             # Add optimization info to banner_info for reporting
+                    banner_info['optimization'] = {
+                        'original_format': 'png',
+                        'final_format': 'jpeg',
+                        'final_quality': final_quality,
+                        'final_size_kb': round(final_size_kb, 1),
+                        'size_limit_kb': 49
+                    }
+                
+            except Exception as e:
+                logger.error("Failed to optimize image: %s", e, exc_info=True)
+                # Fallback to original PNG if optimization fails
+                screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
+                actual_format = 'png'
             
-        logger.info(f"Testing Hoxton detection for: {url}")
-        
-        # Get fresh browser context
-        playwright, browser, context = screenshot_service.get_browser_context()
-        page = context.new_page()
-        
-        try:
-            # Navigate to URL
-            page.goto(url, wait_until='networkidle', timeout=30000)
+            # Convert to base64
+            # screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
             
-            # Wait much longer for custom elements and dynamic content
-            time.sleep(10)
+            # Debug: Log final banner_info before returning
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("🔍 Final banner_info before return:")
+                logger.info("  - bannerName: '%s'", banner_info.get('bannerName', 'NOT SET'))
+                logger.info("  - hoxtonData present: %s", bool(banner_info.get('hoxtonData')))
+                logger.info("  - width: %s", banner_info.get('width'))
+                logger.info("  - height: %s", banner_info.get('height'))
             
-            # Try to wait for hoxton element specifically
-            try:
-                page.wait_for_selector('hoxton', timeout=10000)
-                logger.info("Hoxton element found after waiting!")
-            except:
-                logger.info("Hoxton element not found even after waiting")
+            return {
+                'success': True,
+                'imageData': screenshot_base64,
+                'format': actual_format,
+                'dimensions': {'width': width, 'height': height},
+                'detectedDimensions': banner_info,
+                'url': url
+            }
+            
+        except Exception as e:
+            logger.error("Screenshot capture failed for %s: %s", url, e, exc_info=True)
+            raise Exception(f"Failed to capture screenshot: {str(e)}")
             
-            # Use the SAME logic as the working test endpoint
-            test_result = page.evaluate("""
+        finally:
+            # Clean up resources for this request; a batch's shared context is released by the batch
+            if session is None:
+                await self.release_browser_context(playwright, browser, context)
+            elif page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+    
+    async def _handle_gsap_timeline(self, page, max_timeout=30):
+        """Handle GSAP timeline with precise end-frame positioning (including iframes)"""
+        try:
+            # First detect GSAP timelines in main document and iframes
+            gsap_result = await page.evaluate("""
                 () => {
-                    // Function to extract hoxton data from an element
-                    function extractHoxtonData(el, source) {
-                        const dataAttr = el.getAttribute('data');
-                        let decodedData = null;
-                        let parsedData = null;
+                    const results = { success: false, timelines: [], totalDuration: 0, contexts: [] };
+                    
+                    // Function to get GSAP info from a document
+                    function getGsapInfo(doc, contextName) {
+                        const contextResults = { timelines: [], maxDuration: 0, context: contextName };
+                        
+                        const gsapLib = doc.defaultView?.gsap;
+                        const Creative = doc.defaultView?.Creative;
+                        
+                        // Check Creative.tl pattern (priority)
+                        if (Creative && Creative.tl) {
+                            if (typeof Creative.tl.duration === 'function') {
+                                try {
+                                    const duration = Creative.tl.duration();
+                                    const progress = Creative.tl.progress ? Creative.tl.progress() : 0;
+                                    contextResults.timelines.push({ 
+                                        type: 'Creative.tl', 
+                                        duration, 
+                                        progress,
+                                        context: contextName,
+                                        isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
+                                    });
+                                    contextResults.maxDuration = Math.max(contextResults.maxDuration, duration);
+                                } catch (e) {
+                                    console.log(`Error accessing Creative.tl in ${contextName}:`, e);
+                                }
+                            }
+                        }
                         
-                        if (dataAttr) {
+                        // Check GSAP global timeline
+                        if (gsapLib && gsapLib.globalTimeline) {
                             try {
-                                decodedData = decodeURIComponent(dataAttr);
-                                parsedData = JSON.parse(decodedData);
+                                const duration = gsapLib.globalTimeline.totalDuration();
+                                const progress = gsapLib.globalTimeline.progress();
+                                contextResults.timelines.push({ 
+                                    type: 'global', 
+                                    duration, 
+                                    progress,
+                                    context: contextName,
+                                    isActive: gsapLib.globalTimeline.isActive()
+                                });
+                                contextResults.maxDuration = Math.max(contextResults.maxDuration, duration);
                             } catch (e) {
-                                // ignore parsing errors for now
+                                console.log(`Error accessing globalTimeline in ${contextName}:`, e);
                             }
                         }
                         
-                        return {
-                            source: source,
-                            tagName: el.tagName,
-                            hasDataAttr: el.hasAttribute('data'),
-                            dataLength: dataAttr?.length || 0,
-                            dataPreview: dataAttr?.substring(0, 300) || 'no data',
-                            decodedPreview: decodedData?.substring(0, 300) || 'no decoded data',
-                            parsedName: parsedData?.name || 'no parsed name',
-                            parsedReportingLabel: parsedData?.reportingLabel || 'no parsed reportingLabel',
-                            rawParsedData: parsedData
-                        };
+                        // Check named timelines
+                        const possibleNames = ['tl', 'timeline', 'mainTimeline', 'masterTimeline', 'bannerTimeline'];
+                        for (const name of possibleNames) {
+                            try {
+                                if (doc.defaultView[name] && typeof doc.defaultView[name].totalDuration === 'function') {
+                                    const duration = doc.defaultView[name].totalDuration();
+                                    const progress = doc.defaultView[name].progress();
+                                    contextResults.timelines.push({ 
+                                        type: name, 
+                                        duration, 
+                                        progress,
+                                        context: contextName,
+                                        isActive: doc.defaultView[name].isActive ? doc.defaultView[name].isActive() : false
+                                    });
+                                    contextResults.maxDuration = Math.max(contextResults.maxDuration, duration);
+                                }
+                            } catch (e) {
+                                console.log(`Error accessing ${name} in ${contextName}:`, e);
+                            }
+                        }
+                        
+                        return contextResults;
                     }
                     
-                    // Check main document for hoxton elements
-                    const mainHoxtonEls = document.querySelectorAll('hoxton, HOXTON');
-                    const foundHoxtonElements = [];
-                    
-                    for (const el of mainHoxtonEls) {
-                        foundHoxtonElements.push(extractHoxtonData(el, 'main-document'));
+                    // Check main document
+                    const mainContext = getGsapInfo(document, 'main');
+                    if (mainContext.timelines.length > 0) {
+                        results.success = true;
+                        results.timelines.push(...mainContext.timelines);
+                        results.totalDuration = Math.max(results.totalDuration, mainContext.maxDuration);
+                        results.contexts.push(mainContext);
                     }
                     
-                    // Check all iframes for hoxton elements  
+                    // Check iframes
                     const iframes = document.querySelectorAll('iframe');
-                    const iframeInfo = [];
-                    
                     for (let i = 0; i < iframes.length; i++) {
-                        const iframe = iframes[i];
-                        const info = {
-                            index: i,
-                            src: iframe.src,
-                            accessible: false,
-                            hoxtonElements: []
-                        };
-                        
                         try {
-                            const iframeDoc = iframe.contentDocument || iframe.contentWindow?.document;
+                            const iframeDoc = iframes[i].contentDocument || iframes[i].contentWindow?.document;
                             if (iframeDoc) {
-                                info.accessible = true;
-                                const iframeHoxtonEls = iframeDoc.querySelectorAll('hoxton, HOXTON');
-                                
-                                for (const el of iframeHoxtonEls) {
-                                    const hoxtonData = extractHoxtonData(el, `iframe-${i}`);
-                                    foundHoxtonElements.push(hoxtonData);
-                                    info.hoxtonElements.push(hoxtonData);
+                                const iframeContext = getGsapInfo(iframeDoc, `iframe-${i}`);
+                                if (iframeContext.timelines.length > 0) {
+                                    results.success = true;
+                                    results.timelines.push(...iframeContext.timelines);
+                                    results.totalDuration = Math.max(results.totalDuration, iframeContext.maxDuration);
+                                    results.contexts.push(iframeContext);
                                 }
                             }
                         } catch (e) {
-                            info.error = e.message;
+                            console.log(`Cannot access iframe ${i}:`, e.message);
                         }
-                        
-                        iframeInfo.push(info);
                     }
                     
-                    return {
-                        foundHoxtonElements: foundHoxtonElements,
-                        iframeInfo: iframeInfo,
-                        totalHoxtonFound: foundHoxtonElements.length
-                    };
+                    return results;
                 }
             """)
             
-            # More comprehensive test for Hoxton elements including iframes
-            test_result = page.evaluate("""
+            if not gsap_result.get('success') or not gsap_result.get('timelines'):
+                logger.warning("No GSAP timelines found in main document or iframes")
+                return False
+                
+            total_duration = gsap_result.get('totalDuration', 0)
+            timelines = gsap_result.get('timelines', [])
+            contexts = gsap_result.get('contexts', [])
+            
+            logger.info(f"🎬 GSAP detected across {len(contexts)} contexts: {len(timelines)} timelines, max duration: {total_duration}s")
+            
+            # Log details about each timeline found
+            for timeline in timelines:
+                logger.info(f"   - {timeline['type']} in {timeline['context']}: {timeline['duration']}s (progress: {timeline.get('progress', 0):.2f})")
+            
+            # Calculate the maximum remaining time across all timelines
+            max_remaining_time = 0
+            current_progress = 1.0  # Start with assumption we're at the end
+            
+            for timeline in timelines:
+                timeline_progress = timeline.get('progress', 0)
+                timeline_remaining = timeline['duration'] * (1 - timeline_progress)
+                if timeline_remaining > max_remaining_time:
+                    max_remaining_time = timeline_remaining
+                    current_progress = timeline_progress
+            
+            logger.info(f"📊 Animation state: progress={current_progress:.2f}, remaining={max_remaining_time:.2f}s")
+            
+            # Enhanced waiting strategy with proper end-frame buffer
+            end_frame_buffer = 1.3  # 1.3 seconds for iframe content settling
+            
+            if max_remaining_time > 0.1:  # Animation still running
+                total_wait_time = max_remaining_time + end_frame_buffer
+                logger.info(f"⏳ Waiting for iframe GSAP completion: {max_remaining_time:.2f}s + {end_frame_buffer}s buffer = {total_wait_time:.2f}s")
+                await asyncio.sleep(min(total_wait_time, max_timeout))
+            else:
+                # Animation complete or nearly complete
+                logger.info(f"🎯 GSAP timeline(s) complete, adding {end_frame_buffer}s iframe settling buffer")
+                await asyncio.sleep(end_frame_buffer)
+            
+            # Final verification of timeline states
+            final_verification = await page.evaluate("""
                 () => {
-                    const result = {
-                        pageTitle: document.title,
-                        hoxtonElements: [],
-                        pageContainsHoxton: document.documentElement.outerHTML.includes('hoxton'),
-                        pageContainsReportingLabel: document.documentElement.outerHTML.includes('reportingLabel'),
-                        allElementsWithData: [],
-                        bodyStructure: [],
-                        customElements: [],
-                        iframeAnalysis: [],
-                        rawHTMLSearch: {
-                            hoxtonMatches: [],
-                            reportingLabelMatches: []
-                        }
-                    };
-                    
-                    // Search for hoxton in raw HTML
-                    const fullHTML = document.documentElement.outerHTML;
-                    const hoxtonRegex = /<hoxton[^>]*>/gi;
-                    const hoxtonMatches = fullHTML.match(hoxtonRegex) || [];
-                    result.rawHTMLSearch.hoxtonMatches = hoxtonMatches.slice(0, 5);
-                    
-                    // Search for reportingLabel in raw HTML
-                    const reportingRegex = /reportingLabel[^}]{0,100}/gi;
-                    const reportingMatches = fullHTML.match(reportingRegex) || [];
-                    result.rawHTMLSearch.reportingLabelMatches = reportingMatches.slice(0, 5);
+                    const finalStates = [];
                     
-                    // Function to extract hoxton data from an element
-                    function extractHoxtonData(el, source) {
-                        const dataAttr = el.getAttribute('data');
-                        let decodedData = null;
-                        let parsedData = null;
+                    function checkFinalState(doc, contextName) {
+                        const Creative = doc.defaultView?.Creative;
+                        const gsapLib = doc.defaultView?.gsap;
                         
-                        if (dataAttr) {
+                        if (Creative && Creative.tl && typeof Creative.tl.progress === 'function') {
                             try {
-                                decodedData = decodeURIComponent(dataAttr);
-                                parsedData = JSON.parse(decodedData);
+                                finalStates.push({
+                                    type: 'Creative.tl',
+                                    context: contextName,
+                                    progress: Creative.tl.progress(),
+                                    isActive: Creative.tl.isActive ? Creative.tl.isActive() : false
+                                });
                             } catch (e) {
-                                // ignore parsing errors for now
+                                console.log(`Error checking final state in ${contextName}:`, e);
                             }
                         }
                         
-                        return {
-                            source: source,
-                            tagName: el.tagName,
-                            hasDataAttr: el.hasAttribute('data'),
-                            dataLength: dataAttr?.length || 0,
-                            dataPreview: dataAttr?.substring(0, 300) || 'no data',
-                            decodedPreview: decodedData?.substring(0, 300) || 'no decoded data',
-                            parsedName: parsedData?.name || 'no parsed name',
-                            parsedReportingLabel: parsedData?.reportingLabel || 'no parsed reportingLabel',
-                            outerHTMLPreview: el.outerHTML.substring(0, 500)
-                        };
+                        if (gsapLib && gsapLib.globalTimeline) {
+                            try {
+                                finalStates.push({
+                                    type: 'global',
+                                    context: contextName,
+                                    progress: gsapLib.globalTimeline.progress(),
+                                    isActive: gsapLib.globalTimeline.isActive()
+                                });
+                            } catch (e) {
+                                console.log(`Error checking global timeline in ${contextName}:`, e);
+                            }
+                        }
                     }
                     
-                    // Check main document for hoxton elements
-                    const mainHoxtonEls = document.querySelectorAll('hoxton, HOXTON');
-                    for (const el of mainHoxtonEls) {
-                        result.hoxtonElements.push(extractHoxtonData(el, 'main-document'));
-                    }
+                    // Check main document
+                    checkFinalState(document, 'main');
                     
-                    // Check all iframes for hoxton elements
+                    // Check iframes
                     const iframes = document.querySelectorAll('iframe');
                     for (let i = 0; i < iframes.length; i++) {
-                        const iframe = iframes[i];
-                        const iframeInfo = {
-                            index: i,
-                            src: iframe.src,
-                            id: iframe.id,
-                            className: iframe.className,
-                            accessible: false,
-                            hoxtonElementsFound: 0,
-                            hoxtonElements: [],
-                            bodyStructure: []
-                        };
-                        
                         try {
-                            // Try to access iframe content
-                            const iframeDoc = iframe.contentDocument || iframe.contentWindow?.document;
+                            const iframeDoc = iframes[i].contentDocument || iframes[i].contentWindow?.document;
                             if (iframeDoc) {
-                                iframeInfo.accessible = true;
-                                
-                                // Look for hoxton elements in iframe
-                                const iframeHoxtonEls = iframeDoc.querySelectorAll('hoxton, HOXTON');
-                                iframeInfo.hoxtonElementsFound = iframeHoxtonEls.length;
-                                
-                                for (const el of iframeHoxtonEls) {
-                                    const hoxtonData = extractHoxtonData(el, `iframe-${i}`);
-                                    result.hoxtonElements.push(hoxtonData);
-                                    iframeInfo.hoxtonElements.push(hoxtonData);
-                                }
-                                
-                                // Get iframe body structure
-                                if (iframeDoc.body) {
-                                    const iframeBodyChildren = Array.from(iframeDoc.body.children);
-                                    for (let j = 0; j < Math.min(10, iframeBodyChildren.length); j++) {
-                                        const el = iframeBodyChildren[j];
-                                        iframeInfo.bodyStructure.push({
-                                            index: j,
-                                            tagName: el.tagName,
-                                            className: el.className,
-                                            id: el.id,
-                                            hasDataAttr: el.hasAttribute('data'),
-                                            dataLength: el.getAttribute('data')?.length || 0,
-                                            isHoxton: el.tagName && el.tagName.toLowerCase() === 'hoxton'
-                                        });
-                                    }
-                                }
+                                checkFinalState(iframeDoc, `iframe-${i}`);
                             }
                         } catch (e) {
-                            iframeInfo.error = e.message;
+                            console.log(`Cannot verify iframe ${i}:`, e.message);
                         }
-                        
-                        result.iframeAnalysis.push(iframeInfo);
                     }
                     
-                    // Get main document body structure
-                    const bodyChildren = Array.from(document.body.children);
-                    for (let i = 0; i < Math.min(15, bodyChildren.length); i++) {
-                        const el = bodyChildren[i];
-                        result.bodyStructure.push({
-                            index: i,
-                            tagName: el.tagName,
-                            className: el.className,
-                            id: el.id,
-                            hasDataAttr: el.hasAttribute('data'),
-                            dataLength: el.getAttribute('data')?.length || 0,
-                            outerHTMLPreview: el.outerHTML.substring(0, 300),
-                            isHoxton: el.tagName && el.tagName.toLowerCase() === 'hoxton',
-                            isIframe: el.tagName && el.tagName.toLowerCase() === 'iframe'
-                        });
+                    return finalStates;
+                }
+            """)
+            
+            logger.info("✅ Final iframe GSAP states: %s", final_verification)
+            return True
+                
+        except Exception as e:
+            logger.error("Error handling iframe GSAP timeline: %s", e, exc_info=True)
+            return False
+
+    async def _wait_for_frame_stability(self, page, timeout=5000, stability_time=500):
+        """Wait for frames to be stable (no changes for a certain period)"""
+        import time
+        
+        try:
+            # Take initial screenshot hash
+            initial_screenshot = await page.screenshot()
+            initial_hash = hash(initial_screenshot)
+            
+            last_change_time = time.time()
+            start_time = time.time()
+            
+            while (time.time() - start_time) * 1000 < timeout:
+                await asyncio.sleep(0.1)  # Check every 100ms
+                
+                # Take new screenshot and compare
+                current_screenshot = await page.screenshot()
+                current_hash = hash(current_screenshot)
+                
+                if current_hash != initial_hash:
+                    # Frame changed, reset timer
+                    last_change_time = time.time()
+                    initial_hash = current_hash
+                else:
+                    # Frame hasn't changed
+                    if (time.time() - last_change_time) * 1000 >= stability_time:
+                        logger.info(f"Frame stability achieved after {(time.time() - start_time) * 1000:.0f}ms")
+                        return True
+            
+            logger.warning(f"Frame stability timeout after {timeout}ms")
+            return False
+        except Exception as e:
+            logger.warning(f"Error checking frame stability: {e}")
+            return False
+    
+    async def _wait_for_animation_completion(self, page, timeout=30000):
+        """Wait for CSS animations and transitions to complete"""
+        try:
+            # Get initial animation state
+            initial_state = await page.evaluate("""
+                () => {
+                    let activeAnimations = 0;
+                    let maxDuration = 0;
+                    
+                    // CSS animations and transitions in effect, without resolving every element's style
+                    for (const animation of document.getAnimations()) {
+                        const timing = animation.effect ? animation.effect.getTiming() : {};
+                        const duration = typeof timing.duration === 'number' ? timing.duration : 0;
+                        if (duration > 0) {
+                            activeAnimations++;
+                            maxDuration = Math.max(maxDuration, duration);
+                        }
                     }
                     
-                    return result;
+                    return { activeAnimations, maxDuration };
                 }
             """)
             
-            # Process the hoxton detection results
-            logger.info(f"Hoxton detection results: {test_result}")
+            if initial_state['activeAnimations'] == 0:
+                logger.info("No animations detected")
+                return True
+            
+            animation_timeout = min(initial_state['maxDuration'] + 2000, timeout)
+            logger.info(f"Detected {initial_state['activeAnimations']} animations, max duration: {initial_state['maxDuration']}ms, waiting {animation_timeout}ms")
             
-            hoxton_banner_name = None
-            hoxton_metadata = None
+            # Wait up to the calculated time; the browser polls the condition itself each frame, so this
+            # returns as soon as the last animation finishes instead of always sleeping the full time
+            try:
+                await page.wait_for_function(
+                    "() => !document.getAnimations().some(animation => animation.playState === 'running')",
+                    timeout=animation_timeout
+                )
+                logger.info("All animations completed successfully")
+            except Exception:
+                # Count what is still running (e.g. infinite loops) for the log
+                final_state = await page.evaluate("""
+                    () => {
+                        // Check if animations are still running
+                        const stillAnimating = document.getAnimations()
+                            .filter(animation => animation.playState === 'running').length;
+                        
+                        return { stillAnimating };
+                    }
+                """)
+                logger.warning(f"Still {final_state['stillAnimating']} animations running after timeout")
             
-            if test_result['totalHoxtonFound'] > 0:
-                logger.info(f"Found {test_result['totalHoxtonFound']} hoxton elements!")
-                
-                # Use the first hoxton element with good data
-                for hoxton_el in test_result['foundHoxtonElements']:
-                    logger.info(f"Processing hoxton element from {hoxton_el['source']}")
-                    logger.info(f"  - Parsed name: {hoxton_el.get('parsedName')}")
-                    logger.info(f"  - Parsed reportingLabel: {hoxton_el.get('parsedReportingLabel')}")
-                    
-                    # Try reportingLabel first (but skip {versionName})
-                    if (hoxton_el.get('parsedReportingLabel') and 
-                        hoxton_el['parsedReportingLabel'] != 'no parsed reportingLabel' and
-                        hoxton_el['parsedReportingLabel'] != '{versionName}'):
-                        hoxton_banner_name = hoxton_el['parsedReportingLabel']
-                        hoxton_metadata = hoxton_el.get('rawParsedData')
-                        logger.info(f"Using reportingLabel: {hoxton_banner_name}")
-                        break
-                    
-                    # Try name field
-                    elif (hoxton_el.get('parsedName') and 
-                          hoxton_el['parsedName'] != 'no parsed name'):
-                        hoxton_banner_name = hoxton_el['parsedName']
-                        hoxton_metadata = hoxton_el.get('rawParsedData')
-                        logger.info(f"Using name: {hoxton_banner_name}")
-                        break
-            else:
-                logger.warning("No hoxton elements found in enhanced detection!")
-                
-            return jsonify({
-                'success': True,
-                'url': url,
-                'test_result': test_result,
-                'extracted_banner_name': hoxton_banner_name,
-                'hoxton_metadata': hoxton_metadata
-            })
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Error waiting for animation completion: {e}")
+            return False
+    
+    async def _ensure_end_frame(self, page, wait_time=3):
+        """Ensure we capture the end frame of any animation with proper settling"""
+        try:
+            # Step 1: Check for animations and wait for them
+            animation_completed = await self._wait_for_animation_completion(page)
+            
+            # Step 2: Wait for frame stability 
+            frame_stable = await self._wait_for_frame_stability(page)
+            
+            # Step 3: Enhanced buffer time for end-frame settling (1-1.5 seconds)
+            end_frame_buffer = max(wait_time, 1.2)  # Minimum 1.2 seconds buffer
+            logger.info(f"⏱️ Adding {end_frame_buffer:.1f}s end-frame settling buffer")
+            await asyncio.sleep(end_frame_buffer)
+            
+            # Step 4: Final frame stability verification
+            final_stable = await self._wait_for_frame_stability(page, timeout=2000, stability_time=300)
+            
+            success = animation_completed and frame_stable and final_stable
+            logger.info(f"🎯 End frame capture ready: animations={animation_completed}, stable={frame_stable}, final_check={final_stable}")
+            
+            return success
+            
+        except Exception as e:
+            logger.error("Error ensuring end frame: %s", e, exc_info=True)
+            # Fall back to conservative wait time
+            conservative_wait = max(wait_time, 1.5)
+            logger.info(f"🛡️ Fallback: using {conservative_wait}s conservative wait")
+            await asyncio.sleep(conservative_wait)
+            return False
+
+    async def inspect_hoxton(self, url):
+        """Load a page and collect detailed Hoxton element diagnostics"""
+        # Get fresh browser context
+        playwright, browser, context = await self.get_browser_context()
+        page = await context.new_page()
+        
+        try:
+            # Navigate to URL
+            await self._navigate(page, url)
+            
+            # Wait for a hoxton element in the page or a same-origin iframe; returns as soon as one exists,
+            # and gives late-rendering custom elements the same 20s the old fixed sleep plus wait allowed
+            try:
+                await page.wait_for_function(_HOXTON_PRESENT_JS, timeout=20000)
+                logger.info("Hoxton element found after waiting!")
+            except Exception:
+                logger.info("Hoxton element not found even after waiting")
             
+            # One pass collects both the element list the endpoint reads and the wider page analysis
+            test_result = await page.evaluate(_HOXTON_INSPECT_JS)
+            for element in test_result['hoxtonElements']:
+                _describe_hoxton_element(element)
+            for iframe_info in test_result['iframeAnalysis']:
+                for element in iframe_info['hoxtonElements']:
+                    _describe_hoxton_element(element)
+            
+            # The element summary test_hoxton reads to pick a banner name
+            test_result['foundHoxtonElements'] = test_result['hoxtonElements']
+            test_result['totalHoxtonFound'] = len(test_result['hoxtonElements'])
+            test_result['iframeInfo'] = test_result['iframeAnalysis']
+
+            return test_result
+
         finally:
             try:
-                context.close()
-                browser.close()
-                playwright.stop()
+                await self.release_browser_context(playwright, browser, context)
             except:
                 pass
-                
-    except Exception as e:
-        logger.error(f"Error in test-hoxton: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-
-@app.before_request
-def log_request_info():
-    log_to_file(f"🌐 HTTP Request: {request.method} {request.path}")
-    print(f"🌐 HTTP Request: {request.method} {request.path}", flush=True)
-    if request.method == 'POST':
-        log_to_file(f"📦 POST Data: {request.get_data()}")
-        print(f"📦 POST Data: {request.get_data()}", flush=True)
-
-@app.route('/test', methods=['GET'])
-def test_endpoint():
-    """Simple test endpoint"""
-    print("🧪 TEST ENDPOINT CALLED! (using print)")
-    logger.info("🧪 TEST ENDPOINT CALLED! (using logger)")
-    return jsonify({"status": "success", "message": "Server is working!"})
 
-@app.route('/check-hoxton-data', methods=['POST'])
-def check_hoxton_data():
-    """Endpoint to check Hoxton data extraction with comprehensive logging"""
-    log_to_file("=" * 50)
-    log_to_file("🔍 CHECK HOXTON DATA ENDPOINT CALLED!")
-    log_to_file("=" * 50)
-    print("=" * 50, flush=True)
-    print("🔍 CHECK HOXTON DATA ENDPOINT CALLED!", flush=True)
-    print("=" * 50, flush=True)
-    logger.info("🔍 CHECK HOXTON DATA ENDPOINT CALLED!")
-    
-    try:
-        data = request.get_json()
-        log_to_file(f"📥 Request data: {data}")
-        print(f"📥 Request data: {data}", flush=True)
-        
-        if not data or 'url' not in data:
-            log_to_file("❌ No URL provided in request")
-            print("❌ No URL provided in request", flush=True)
-            return jsonify({'error': 'URL is required'}), 400
+    async def extract_banner_name(self, url):
+        """Load a page and run the banner name extraction used by /check-hoxton-data"""
+        # Pooled browser context, like the other diagnostic endpoints, instead of a Chromium launch per request
+        log_to_file("🚀 Getting browser context...", echo=True)
+        playwright, browser, context = await self.get_browser_context()
+        page = await context.new_page()
         
-        url = data['url']
-        log_to_file(f"🌐 Processing URL: {url}")
-        print(f"🌐 Processing URL: {url}", flush=True)
-        
-        # Initialize Playwright
-        log_to_file("🚀 Starting Playwright...")
-        print("🚀 Starting Playwright...", flush=True)
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
-            
-            log_to_file(f"📖 Loading page: {url}")
-            print(f"📖 Loading page: {url}", flush=True)
-            page.goto(url, wait_until='networkidle', timeout=30000)
-            
-            log_to_file("🔍 Extracting banner name...")
-            print("🔍 Extracting banner name...", flush=True)
+        try:
+            log_to_file(f"📖 Loading page: {url}", echo=True)
+            await self._navigate(page, url)
+            
+            log_to_file("🔍 Extracting banner name...", echo=True)
             # Use the same JavaScript evaluation as in the capture endpoint
-            banner_name_result = page.evaluate("""
+            banner_name_result = await page.evaluate("""
                 (() => {
                     function extractBannerName() {
                         const debug = { attempts: [], found: null };
@@ -2237,10 +2595,8 @@ def check_hoxton_data():
                             try {
                                 debug.attempts.push(`Searching in ${source} document`);
                                 
-                                // Look for Hoxton elements
-                                const hoxtonElements = Array.from(doc.querySelectorAll('*')).filter(el => 
-                                    el.tagName && el.tagName.toLowerCase().includes('hoxton')
-                                );
+                                // Look for Hoxton elements by tag, as the capture does, instead of walking every element
+                                const hoxtonElements = doc.querySelectorAll('hoxton');
                                 
                                 debug.attempts.push(`Found ${hoxtonElements.length} Hoxton elements in ${source}`);
                                 
@@ -2331,20 +2687,587 @@ def check_hoxton_data():
                 })()
             """)
             
-            log_to_file(f"📊 Banner name extraction result: {banner_name_result}")
-            print(f"📊 Banner name extraction result: {banner_name_result}", flush=True)
+            log_to_file(f"📊 Banner name extraction result: {banner_name_result}", echo=True)
+            
+            if banner_name_result and banner_name_result.get('result'):
+                log_to_file(f"✅ Successfully extracted banner name: {banner_name_result['result']}", echo=True)
+            else:
+                log_to_file(f"❌ No banner name found. Debug info: {banner_name_result.get('debug', {})}", echo=True)
+            
+            log_to_file("🔚 Request complete!", echo=True)
+        finally:
+            try:
+                await self.release_browser_context(playwright, browser, context)
+            except:
+                pass
+
+        return banner_name_result
+
+    async def scan_preview(self, preview_url):
+        """Scan a preview page for banner iframes, containers and links"""
+        playwright = None
+        browser = None
+        context = None
+        page = None
+        
+        try:
+            # Get fresh browser context for this request
+            playwright, browser, context = await self.get_browser_context()
+            page = await context.new_page()
+            
+            logger.info(f"Scanning preview page: {preview_url}")
+            await self._navigate(page, preview_url)
+            
+            # Give late-rendering preview pages up to 3s to show a banner candidate, returning as soon as one exists
+            try:
+                await page.wait_for_selector(_PREVIEW_CANDIDATES_SELECTOR, state='attached', timeout=3000)
+            except Exception:
+                logger.info("No banner candidates on %s after waiting", preview_url)
+            
+            # Extract banner information from the preview page
+            banner_info = await self._evaluate_page_helper(page, 'scanPreview', _PREVIEW_CANDIDATES_SELECTOR)
+            
+            return banner_info
+            
+        finally:
+            # Clean up resources
+            await self.release_browser_context(playwright, browser, context)
+
+    async def detect_dimensions(self, url):
+        """Detect banner dimensions without taking a screenshot"""
+        playwright = None
+        browser = None
+        context = None
+        page = None
+        
+        try:
+            # Get fresh browser context for this request
+            playwright, browser, context = await self.get_browser_context()
+            page = await context.new_page()
+            
+            # Navigate to the URL; layout needs stylesheets but not images, media or fonts
+            logger.info(f"Debug: Navigating to: {url}")
+            await page.route('**/*', _layout_only_route)
+            await self._navigate(page, url)
+            
+            # Get dimensions using the same logic as screenshot capture
+            actual_dimensions = await self._evaluate_page_helper(page, 'debugDimensions')
+            
+            if actual_dimensions.get('detectionMethod') == 'viewport/body fallback':
+                # No container measured without those resources; measure again at full fidelity
+                logger.info("Debug: No banner container found on the layout-only pass, reloading with all resources")
+                await page.unroute('**/*', _layout_only_route)
+                await self._navigate(page, url)
+                actual_dimensions = await self._evaluate_page_helper(page, 'debugDimensions')
+            
+            return actual_dimensions
+            
+        finally:
+            # Clean up resources
+            await self.release_browser_context(playwright, browser, context)
+
+    def start_warm_up(self):
+        """Warm the browser pool in the background; /ready answers 503 until it is done"""
+        if not PLAYWRIGHT_AVAILABLE:
+            self.warmup_error = 'playwright unavailable'
+            return
+        asyncio.run_coroutine_threadsafe(self._warm_up(), get_event_loop())
+    
+    async def _warm_up(self):
+        started = time.time()
+        try:
+            await asyncio.wait_for(browser_pool.warm_up(), timeout=WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.warmup_error = 'warm-up timed out'
+            logger.error(f"❌ Browser pool warm-up exceeded {WARMUP_TIMEOUT}s; worker stays unready")
+            return
+        except Exception as e:
+            self.warmup_error = 'warm-up failed'
+            logger.error(f"❌ Browser pool warm-up failed: {str(e)}", exc_info=True)
+            return
+        self.warm = True
+        logger.info(f"🔥 Warmed {browser_pool.launched} pooled browsers in {time.time() - started:.2f}s")
+    
+    def cleanup(self):
+        """Close the pooled browsers on shutdown, if the Playwright loop ever started"""
+        if _event_loop is None or not _event_loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(browser_pool.cleanup(), _event_loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Browser pool cleanup failed: {str(e)}")
+
+# Global screenshot service instance
+screenshot_service = ScreenshotService()
+
+def _graceful_shutdown(signum, frame):
+    """Close pooled browsers on SIGTERM/SIGINT, then exit (atexit cleanup is a no-op by then)"""
+    print("\n🛑 Server stopping, closing browsers...")
+    try:
+        screenshot_service.cleanup()
+    except Exception:
+        pass
+    sys.exit(0)
+
+# Registered at import so every exit path closes Chromium; gunicorn workers
+# install their own signal handlers, so gunicorn.conf.py covers them via worker_exit
+atexit.register(screenshot_service.cleanup)
+if threading.current_thread() is threading.main_thread():
+    for _signal in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(_signal, _graceful_shutdown)
+
+# Filename cleanup patterns, compiled once for the per-banner naming path
+_IMAGE_EXTENSION_RE = re.compile(r'\.(png|jpg|jpeg|gif|svg|webp)$', re.IGNORECASE)
+# Characters Windows and ZIP tools reject in names, mapped to '_' in one str.translate pass
+_RESERVED_FILENAME_CHARS = str.maketrans(dict.fromkeys('<>:"/\\|?*', '_'))
+_SEPARATOR_RUN_RE = re.compile(r'[\s_]+')
+_UNDERSCORE_RUN_RE = re.compile(r'_+')
+# Anything clean_filename_for_zip would rewrite inside an ASCII name: reserved characters, whitespace, underscore runs
+_ZIP_NAME_REWRITE_RE = re.compile(r'[<>:"/\\|?*\s]|__')
+_UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w\-_.]')
+# Platform, ad type and domain values too generic to add to a filename
+_GENERIC_PLATFORMS = frozenset({'web', 'html5'})
+_GENERIC_AD_TYPES = frozenset({'banner', 'display'})
+_GENERIC_DOMAINS = frozenset({'banner', 'hoxton'})
+
+def _ascii_fold(text):
+    """ASCII form of text: compatibility forms (full-width Latin, ligatures) folded and accents dropped from their
+    letters, so composed and decomposed spellings give the same name; other non-ASCII, including zero-width and
+    invisible characters, is removed"""
+    if text.isascii():
+        return text
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+# How each name source is described in the filename log
+_NAME_SOURCE_LABELS = {
+    'hoxton_reportingLabel': 'Hoxton reportingLabel',
+    'hoxton_name': 'Hoxton name',
+    'banner_name': 'extracted banner name',
+}
+
+def generate_banner_filename(banner_info, url, format='png', index=None):
+    """Generate a descriptive filename based on banner metadata"""
+    # Debug logging, skipped entirely when INFO is filtered out
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("🎯 FILENAME GENERATION DEBUG:")
+        logger.info("  - banner_info keys: %s", list(banner_info.keys()) if banner_info else 'None')
+        logger.info("  - bannerName: '%s'", banner_info.get('bannerName', 'NOT SET'))
+        logger.info("  - hoxtonData: %s", banner_info.get('hoxtonData', 'NOT SET'))
+    
+    # Extract Hoxton metadata if available
+    hoxton_data = banner_info.get('hoxtonData', {})
+    logger.info("  - hoxton_data extracted: %s", hoxton_data)
+    
+    # Only these fields feed the name, so repeat captures of a banner reuse the cached result
+    filename, name_source, banner_name, clean_name = _build_banner_filename(
+        hoxton_data.get('reportingLabel', ''), hoxton_data.get('name', ''), banner_info.get('bannerName', ''),
+        hoxton_data.get('platform', ''), hoxton_data.get('adType', ''),
+        banner_info.get('width', 0), banner_info.get('height', 0), banner_info.get('hostname', ''),
+        format, index
+    )
+    if name_source:
+        logger.info("Using %s: '%s'", _NAME_SOURCE_LABELS[name_source], banner_name)
+        logger.info("Cleaned banner name: '%s' (from %s)", clean_name, name_source)
+    else:
+        logger.info("No banner name found, using fallback naming")
+    
+    if filename is None:
+        # Fallback only if we have no name at all; never cached, the timestamp changes
+        timestamp = _fallback_timestamp(int(time.time()))
+        filename = f'banner_{timestamp}.{format}'
+    
+    logger.info("Generated filename: '%s' (name_source: %s)", filename, name_source)
+    return filename
+
+@lru_cache(maxsize=1)
+def _fallback_timestamp(second):
+    """Local time of an epoch second as used in fallback filenames; a batch formats each second once"""
+    return datetime.fromtimestamp(second).strftime('%Y%m%d_%H%M%S')
+
+@lru_cache(maxsize=512)
+def _build_banner_filename(reporting_label, hoxton_name, extracted_name, platform, ad_type, width, height, hostname,
+                           format, index):
+    """(filename, name source, chosen name, cleaned name) for generate_banner_filename; the filename is None
+    if nothing names the banner. Logging stays with the caller, which runs on cache hits too"""
+    # Priority order for naming:
+    # 1. Hoxton reportingLabel (if not a placeholder)
+    # 2. Hoxton name 
+    # 3. Regular bannerName
+    # 4. Fallback to generic name
+    
+    banner_name = ''
+    name_source = ''
+    
+    # Check Hoxton reportingLabel first
+    if reporting_label and reporting_label != '{versionName}' and reporting_label.strip():
+        banner_name = reporting_label.strip()
+        name_source = 'hoxton_reportingLabel'
+    
+    # Check Hoxton name if no reportingLabel
+    elif hoxton_name.strip():
+        banner_name = hoxton_name.strip()
+        name_source = 'hoxton_name'
+    
+    # Fallback to regular banner name
+    elif extracted_name.strip():
+        banner_name = extracted_name.strip()
+        name_source = 'banner_name'
+    
+    # Clean banner name for filename use
+    if banner_name:
+        # Remove file extensions if present
+        banner_name = _IMAGE_EXTENSION_RE.sub('', banner_name)
+        
+        clean_name = _ascii_fold(banner_name)
+        
+        # Clean special characters, then collapse whitespace/underscore runs to one underscore
+        clean_name = clean_name.translate(_RESERVED_FILENAME_CHARS)
+        clean_name = _SEPARATOR_RUN_RE.sub('_', clean_name)
+        clean_name = clean_name.strip('_')  # Remove leading/trailing underscores
+        clean_name = clean_name[:60]  # Limit length but allow longer for descriptive names
+    else:
+        clean_name = ''
+    
+    # Get domain/platform info
+    if hostname:
+        domain = hostname.replace('www.', '').split('.')[0]
+    else:
+        domain = 'banner'
+    
+    # Build filename parts intelligently; later parts are skipped when the name already mentions them
+    parts = []
+    clean_name_lower = clean_name.lower()
+    
+    # Always start with the main name if we have one
+    if clean_name:
+        parts.append(clean_name)
+    
+    # Add dimensions if reasonable and not already in name
+    if width > 0 and height > 0:
+        dimension_str = f'{width}x{height}'
+        if not clean_name or dimension_str not in clean_name:
+            parts.append(dimension_str)
+    
+    # Add platform info if meaningful and not redundant
+    if platform and platform not in _GENERIC_PLATFORMS and (not clean_name or platform.lower() not in clean_name_lower):
+        parts.append(platform.lower())
+    
+    # Add ad type if meaningful and not redundant
+    if ad_type and ad_type not in _GENERIC_AD_TYPES and (not clean_name or ad_type.lower() not in clean_name_lower):
+        parts.append(ad_type.lower())
+    
+    # Add domain if it's helpful and not already included
+    if domain and domain not in _GENERIC_DOMAINS and (not clean_name or domain.lower() not in clean_name_lower):
+        parts.append(domain)
+    
+    # Add index if provided (for batch processing)
+    if index is not None:
+        parts.append(f'{index+1:02d}')
+    
+    # Don't add timestamp - use clean names only
+    # This gives us readable filenames like: 123_Payworld_Display_Think_IAB_market_300x600.png
+    
+    # Combine parts; with none, the caller falls back to a timestamped name
+    if not parts:
+        return None, name_source, banner_name, clean_name
+    filename_base = '_'.join(parts)
+    
+    # Final cleanup; the safe-character pass also drops zero-width and other invisible characters,
+    # and the closing strip covers underscores left at either end by the collapse
+    filename_base = _UNDERSCORE_RUN_RE.sub('_', filename_base)  # Remove multiple underscores
+    filename_base = _UNSAFE_FILENAME_CHARS_RE.sub('', filename_base)  # Keep only safe filename characters
+    filename_base = filename_base.strip('_.')  # Remove any leading/trailing underscores or dots
+    
+    return f'{filename_base}.{format}', name_source, banner_name, clean_name
+
+def clean_filename_for_zip(filename):
+    """Clean filename for ZIP archive consistency"""
+    if not filename:
+        return 'banner.png'
+    
+    # Generated names are already clean; return them without rebuilding the string
+    if (filename.isascii() and filename[0] not in '_.' and filename[-1] not in '_.'
+            and not _ZIP_NAME_REWRITE_RE.search(filename)):
+        return filename if '.' in filename else filename + '.png'
+    
+    clean_name = _ascii_fold(filename)
+    
+    # Clean special characters that might cause issues in ZIP files, then collapse separator runs
+    clean_name = clean_name.translate(_RESERVED_FILENAME_CHARS)
+    clean_name = _SEPARATOR_RUN_RE.sub('_', clean_name)
+    clean_name = clean_name.strip('_.')  # Remove leading/trailing underscores and dots
+    
+    # Ensure we have a valid filename
+    if not clean_name or clean_name == '.':
+        return 'banner.png'
+    
+    # Ensure file extension exists
+    if '.' not in clean_name:
+        clean_name += '.png'
+    
+    return clean_name
+
+class ResponseCache:
+    """Small in-process TTL cache of capture results keyed by capture settings"""
+    def __init__(self, ttl, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}  # key -> (expires_at, result); insertion order doubles as age
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            return entry[1]
+    
+    def set(self, key, result):
+        with self.lock:
+            self.entries.pop(key, None)
+            while len(self.entries) >= self.max_entries:
+                # Evict the oldest entry
+                del self.entries[next(iter(self.entries))]
+            self.entries[key] = (time.monotonic() + self.ttl, result)
+
+# Successful capture results of remote URLs by capture settings, so batch items and /capture bodies that
+# differ only in JSON layout or filename reuse a recent render
+capture_cache = ResponseCache(CACHE_TTL, CACHE_MAX_ENTRIES)
+
+class RateLimiter:
+    """Per-client request counter over a fixed one-minute window"""
+    def __init__(self, limit_per_minute):
+        self.limit = limit_per_minute
+        self.window_start = time.monotonic()
+        self.counts = {}
+        self.lock = threading.Lock()
+    
+    def retry_after(self, key):
+        """Count a request for key; return seconds until it may retry, or 0 if allowed"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start = now
+                self.counts.clear()
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if self.counts[key] > self.limit:
+                return int(60 - (now - self.window_start)) + 1
+            return 0
+
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE)
+
+class ErrorCode(IntEnum):
+    """Stable codes for failed requests; exception details stay in the logs"""
+    HOXTON_TEST_FAILED = 1001
+    HOXTON_CHECK_FAILED = 1002
+    CAPTURE_FAILED = 1003
+    SCAN_PREVIEW_FAILED = 1004
+    DEBUG_DIMENSIONS_FAILED = 1005
+    BATCH_CAPTURE_FAILED = 1006
+    ZIP_DOWNLOAD_FAILED = 1007
+
+ERROR_MESSAGES = {
+    ErrorCode.HOXTON_TEST_FAILED: 'Hoxton test failed',
+    ErrorCode.HOXTON_CHECK_FAILED: 'Hoxton data check failed',
+    ErrorCode.CAPTURE_FAILED: 'Screenshot capture failed',
+    ErrorCode.SCAN_PREVIEW_FAILED: 'Preview page scan failed',
+    ErrorCode.DEBUG_DIMENSIONS_FAILED: 'Dimension detection failed',
+    ErrorCode.BATCH_CAPTURE_FAILED: 'Batch capture failed',
+    ErrorCode.ZIP_DOWNLOAD_FAILED: 'ZIP download failed'
+}
+
+# Error bodies never change, so serialize them once
+_ERROR_BODIES = {
+    code: json.dumps({'error': message, 'error_code': int(code)}).encode()
+    for code, message in ERROR_MESSAGES.items()
+}
+
+def error_response(code, status=500):
+    """Pre-serialized JSON error response for a stable error code"""
+    return Response(_ERROR_BODIES[code], status=status, mimetype='application/json')
+
+def too_many_requests(message, retry_after):
+    """429 JSON response telling the client when to come back"""
+    response = jsonify({'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def rate_limited(view):
+    """Reject clients that exceed RATE_LIMIT_PER_MINUTE on browser-bound endpoints"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if RATE_LIMIT_PER_MINUTE > 0:
+            retry_after = rate_limiter.retry_after(request.remote_addr)
+            if retry_after:
+                logger.warning(f"🚦 Rate limit hit for {request.remote_addr} on {request.path}")
+                return too_many_requests('Rate limit exceeded, please retry later', retry_after)
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def compress_response(response):
+    """gzip JSON and text responses for clients that accept it"""
+    if (response.mimetype not in _COMPRESS_MIMETYPES
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+    
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    
+    response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    
+    # The compressed body is a different representation, so it needs its own ETag
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-gzip', weak)
+    return response
+
+def _send_static(filename):
+    """Serve a file from the app directory, letting nginx send it when STATIC_ACCEL_PREFIX is set"""
+    if not STATIC_ACCEL_PREFIX:
+        # gunicorn streams this through wsgi.file_wrapper, which uses sendfile(2) itself
+        return send_from_directory('.', filename)
+    path = safe_join('.', filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = STATIC_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+    return response
+
+@app.route('/')
+def index():
+    """Serve the main HTML file"""
+    return _send_static('index.html')
+
+@app.route('/<path:filename>')
+def static_files(filename):
+    """Serve static files (CSS, JS, etc.)"""
+    return _send_static(filename)
+
+@app.route('/test-hoxton', methods=['POST'])
+@rate_limited
+def test_hoxton():
+    """Test endpoint to debug Hoxton element detection"""
+    try:
+        data = request.get_json()
+        url = data.get('url', '')
+        
+        if not url:
+            return jsonify({'error': 'URL required'}), 400
             
-            if banner_name_result and banner_name_result.get('result'):
-                log_to_file(f"✅ Successfully extracted banner name: {banner_name_result['result']}")
-                print(f"✅ Successfully extracted banner name: {banner_name_result['result']}", flush=True)
-            else:
-                log_to_file(f"❌ No banner name found. Debug info: {banner_name_result.get('debug', {})}")
-                print(f"❌ No banner name found. Debug info: {banner_name_result.get('debug', {})}", flush=True)
+        logger.info("Testing Hoxton detection for: %s", url)
+        
+        test_result = run_async(screenshot_service.inspect_hoxton(url))
+        
+        # Process the hoxton detection results; the full result is large, so only format it when INFO is on
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Hoxton detection results: %s", test_result)
+        
+        hoxton_banner_name = None
+        hoxton_metadata = None
+        
+        if test_result['totalHoxtonFound'] > 0:
+            logger.info("Found %s hoxton elements!", test_result['totalHoxtonFound'])
             
-            browser.close()
-            log_to_file("🔚 Browser closed, request complete!")
-            print("🔚 Browser closed, request complete!", flush=True)
+            # Use the first hoxton element with good data
+            for hoxton_el in test_result['foundHoxtonElements']:
+                logger.info("Processing hoxton element from %s", hoxton_el['source'])
+                logger.info("  - Parsed name: %s", hoxton_el.get('parsedName'))
+                logger.info("  - Parsed reportingLabel: %s", hoxton_el.get('parsedReportingLabel'))
+                
+                # Try reportingLabel first (but skip {versionName})
+                if (hoxton_el.get('parsedReportingLabel') and 
+                    hoxton_el['parsedReportingLabel'] != 'no parsed reportingLabel' and
+                    hoxton_el['parsedReportingLabel'] != '{versionName}'):
+                    hoxton_banner_name = hoxton_el['parsedReportingLabel']
+                    hoxton_metadata = hoxton_el.get('rawParsedData')
+                    logger.info("Using reportingLabel: %s", hoxton_banner_name)
+                    break
+                
+                # Try name field
+                elif (hoxton_el.get('parsedName') and 
+                      hoxton_el['parsedName'] != 'no parsed name'):
+                    hoxton_banner_name = hoxton_el['parsedName']
+                    hoxton_metadata = hoxton_el.get('rawParsedData')
+                    logger.info("Using name: %s", hoxton_banner_name)
+                    break
+        else:
+            logger.warning("No hoxton elements found in enhanced detection!")
             
+        return jsonify({
+            'success': True,
+            'url': url,
+            'test_result': test_result,
+            'extracted_banner_name': hoxton_banner_name,
+            'hoxton_metadata': hoxton_metadata
+        })
+        
+    except Exception as e:
+        logger.error("Error in test-hoxton: %s", e, exc_info=True)
+        return error_response(ErrorCode.HOXTON_TEST_FAILED)
+
+
+@app.before_request
+def log_request_info():
+    # Honour an upstream proxy's id so log lines can be correlated end to end
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+    _request_id.set(g.request_id)
+    log_to_file(f"🌐 HTTP Request: {request.method} {request.path}", echo=True)
+    if request.method == 'POST':
+        length = request.content_length
+        if not request.is_json or length is None or length > _LOG_BODY_MAX_BYTES:
+            log_to_file(f"📦 POST {length if length is not None else '?'}B ({request.mimetype or 'no content type'})", echo=True)
+            return
+        # get_data() caches the small JSON body for the handler; only a bounded preview is formatted and written
+        body = request.get_data()
+        post_data = f"📦 POST Data: {body[:_LOG_BODY_PREVIEW_BYTES]!r}"
+        if len(body) > _LOG_BODY_PREVIEW_BYTES:
+            post_data += f" ... ({len(body)} bytes)"
+        log_to_file(post_data, echo=True)
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '-')
+    return response
+
+@app.route('/test', methods=['GET'])
+def test_endpoint():
+    """Simple test endpoint"""
+    print("🧪 TEST ENDPOINT CALLED! (using print)")
+    logger.info("🧪 TEST ENDPOINT CALLED! (using logger)")
+    return jsonify({"status": "success", "message": "Server is working!"})
+
+@app.route('/check-hoxton-data', methods=['POST'])
+@rate_limited
+def check_hoxton_data():
+    """Endpoint to check Hoxton data extraction with comprehensive logging"""
+    log_to_file("=" * 50)
+    log_to_file("🔍 CHECK HOXTON DATA ENDPOINT CALLED!", echo=True)
+    log_to_file("=" * 50)
+    
+    try:
+        data = request.get_json()
+        log_to_file(f"📥 Request data: {data}", echo=True)
+        
+        if not data or 'url' not in data:
+            log_to_file("❌ No URL provided in request", echo=True)
+            return jsonify({'error': 'URL is required'}), 400
+        
+        url = data['url']
+        log_to_file(f"🌐 Processing URL: {url}", echo=True)
+        
+        banner_name_result = run_async(screenshot_service.extract_banner_name(url))
+        
         return jsonify({
             'status': 'success',
             'extraction_result': banner_name_result,
@@ -2354,20 +3277,29 @@ def check_hoxton_data():
     except Exception as e:
         error_msg = f"Error checking Hoxton data: {str(e)}"
         log_to_file(f"❌ {error_msg}")
-        print(f"❌ {error_msg}", flush=True)
-        logger.error(error_msg)
-        return jsonify({'error': error_msg}), 500
+        logger.error("%s", error_msg, exc_info=True)
+        return error_response(ErrorCode.HOXTON_CHECK_FAILED)
+
+@lru_cache(maxsize=1024)
+def _local_file_target(url):
+    """Return (file URL, local path) when url is a file:/// URL or a Windows path, else None"""
+    if url.startswith('file:///'):
+        # Platform-correct path from the file URL (handles /C:/... and %20 escapes)
+        return url, url2pathname(urlsplit(url).path)
+    if len(url) > 3 and url[1:3] == ':\\':
+        # A Windows path like C:\path\to\file is already the path to check
+        return 'file:///' + url.replace('\\', '/'), url
+    return None
 
 @app.route('/capture', methods=['POST'])
+@rate_limited
 def capture_screenshot():
     """API endpoint to capture screenshot"""
-    print("🚀 CAPTURE ENDPOINT CALLED! (using print)")
-    logger.info("🚀 CAPTURE ENDPOINT CALLED!")
+    logger.debug("🚀 CAPTURE ENDPOINT CALLED!")
     
     try:
         data = request.get_json()
-        print(f"📥 Request data: {data}")
-        logger.info(f"📥 Request data: {data}")
+        logger.debug("📥 Request data: %s", data)
         
         if not data or 'url' not in data:
             logger.error("❌ No URL provided in request")
@@ -2379,78 +3311,79 @@ def capture_screenshot():
         format = data.get('format', 'png')
         wait_time = data.get('waitTime', 3)
         
-        logger.info(f"🎯 Processing URL: {url}")
-        logger.info(f"⚙️ Settings - Width: {width}, Height: {height}, Format: {format}, Wait: {wait_time}")
+        logger.info("🎯 Processing URL: %s", url)
+        logger.info("⚙️ Settings - Width: %s, Height: %s, Format: %s, Wait: %s", width, height, format, wait_time)
         
-        # Don't generate filename yet - wait for banner_info
+        # A caller-supplied filename wins; otherwise it is generated from banner_info after capture
+        user_filename = data.get('filename')
         
         # Validate URL or local file path
         try:
-            # Check if it's a local file path
-            if url.startswith('file:///') or (len(url) > 3 and url[1:3] == ':\\'):
-                # Convert Windows path to file URL if needed
-                if not url.startswith('file:///'):
-                    # Handle Windows path like C:\path\to\file
-                    url = 'file:///' + url.replace('\\', '/')
-                
-                # Validate that the file exists
-                file_path = url.replace('file:///', '').replace('/', '\\')
+            local_target = _local_file_target(url)
+            if local_target:
+                url, file_path = local_target
+                # Checked on every request: a file created or removed since must be seen
                 if not os.path.exists(file_path):
                     return jsonify({'error': f'Local file not found: {file_path}'}), 400
-                    
-            else:
-                # Validate regular URL
-                parsed_url = urlparse(url)
-                if not parsed_url.scheme or not parsed_url.netloc:
-                    return jsonify({'error': 'Invalid URL format. Use http://, https://, or local file path'}), 400
+            elif not _URL_WITH_HOST_RE.match(url):
+                return jsonify({'error': 'Invalid URL format. Use http://, https://, or local file path'}), 400
         except Exception:
             return jsonify({'error': 'Invalid URL format'}), 400
         
         # Validate dimensions (only if provided - None means auto-detect)
-        if width is not None and not (100 <= width <= 3000):
+        if width is not None and not (_MIN_DIM <= width <= _MAX_DIM):
             return jsonify({'error': 'Invalid width. Width must be between 100 and 3000 pixels'}), 400
-        if height is not None and not (100 <= height <= 3000):
+        if height is not None and not (_MIN_DIM <= height <= _MAX_DIM):
             return jsonify({'error': 'Invalid height. Height must be between 100 and 3000 pixels'}), 400
         
         # Validate format
-        if format not in ['png', 'jpg', 'jpeg', 'webp']:
+        if format not in _ALLOWED_FORMATS:
             return jsonify({'error': 'Invalid format. Supported formats: png, jpg, jpeg, webp'}), 400
         
+        # The browser already produces PNG, so only other formats need a re-encode
+        skip_transcode = format == NATIVE_SCREENSHOT_FORMAT
+        
         # Validate wait time
-        if not (1 <= wait_time <= 30):
+        if not (_MIN_WAIT <= wait_time <= _MAX_WAIT):
             return jsonify({'error': 'Invalid wait time. Must be between 1 and 30 seconds'}), 400
         
         # Capture screenshot
-        logger.info(f"📸 About to call screenshot_service.capture_screenshot()")
-        logger.info(f"📸 Parameters: url={url}, width={width}, height={height}, format={format}, wait_time={wait_time}")
-        
         try:
-            result = screenshot_service.capture_screenshot(url, width, height, format, wait_time)
-            logger.info(f"✅ Screenshot service returned result with keys: {result.keys() if result else 'None'}")
-            
-            # Generate descriptive filename using banner info
-            banner_info = result.get('detectedDimensions', {})
-            logger.info(f"🏷️ About to generate filename with banner_info keys: {banner_info.keys() if banner_info else 'None'}")
+            result = run_async(screenshot_service.capture_screenshot(url, width, height, format, wait_time, skip_transcode))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("✅ Screenshot service returned result with keys: %s", list(result) if result else None)
             
-            # Use the actual format returned (should be 'jpeg' after optimization)
-            actual_format = result.get('format', 'jpeg')
-            file_extension = 'jpg' if actual_format == 'jpeg' else actual_format
-            
-            filename = data.get('filename') or generate_banner_filename(banner_info, url, file_extension)
+            if user_filename:
+                filename = user_filename
+            else:
+                # Generate descriptive filename using banner info
+                banner_info = result.get('detectedDimensions', {})
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("🏷️ About to generate filename with banner_info keys: %s", list(banner_info) if banner_info else None)
+                
+                # Use the actual format returned (should be 'jpeg' after optimization)
+                actual_format = result.get('format', 'jpeg')
+                file_extension = 'jpg' if actual_format == 'jpeg' else actual_format
+                
+                filename = generate_banner_filename(banner_info, url, file_extension)
             result['filename'] = filename
             
-            logger.info(f"✅ Final result filename: {filename}")
+            logger.info("✅ Final result filename: %s", filename)
             return jsonify(result)
             
+        except ServerBusyError as e:
+            logger.warning("🚦 Shedding /capture: %s", e)
+            return too_many_requests('Server busy, please retry shortly', 5)
         except Exception as e:
-            logger.error(f"Error capturing screenshot: {str(e)}")
-            return jsonify({'error': str(e)}), 500
+            logger.error("Error capturing screenshot: %s", e, exc_info=True)
+            return error_response(ErrorCode.CAPTURE_FAILED)
     
     except Exception as e:
-        logger.error(f"Error in capture_screenshot: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in capture_screenshot: %s", e, exc_info=True)
+        return error_response(ErrorCode.CAPTURE_FAILED)
 
 @app.route('/scan-preview', methods=['POST'])
+@rate_limited
 def scan_preview():
     """Scan a preview page for multiple banners and extract their URLs"""
     try:
@@ -2462,150 +3395,26 @@ def scan_preview():
         preview_url = data['url']
         
         # Validate URL
-        try:
-            parsed_url = urlparse(preview_url)
-            if not parsed_url.scheme or not parsed_url.netloc:
-                return jsonify({'error': 'Invalid preview URL format'}), 400
-        except Exception:
+        if not isinstance(preview_url, str) or not _URL_WITH_HOST_RE.match(preview_url):
             return jsonify({'error': 'Invalid preview URL format'}), 400
         
         # Use screenshot service to scan the preview page
-        playwright = None
-        browser = None
-        context = None
-        page = None
+        banner_info = run_async(screenshot_service.scan_preview(preview_url))
+        
+        return jsonify({
+            'success': True,
+            'previewUrl': preview_url,
+            'pageTitle': banner_info['pageTitle'],
+            'totalBanners': banner_info['totalFound'],
+            'banners': banner_info['banners']
+        })
         
-        try:
-            # Get fresh browser context for this request
-            playwright, browser, context = screenshot_service.get_browser_context()
-            page = context.new_page()
-            
-            logger.info(f"Scanning preview page: {preview_url}")
-            page.goto(preview_url, wait_until='networkidle', timeout=30000)
-            
-            # Wait for page to load completely
-            import time
-            time.sleep(3)
-            
-            # Extract banner information from the preview page
-            banner_info = page.evaluate("""
-                () => {
-                    const banners = [];
-                    
-                    // Look for iframes (common in preview pages)
-                    const iframes = document.querySelectorAll('iframe');
-                    iframes.forEach((iframe, index) => {
-                        const src = iframe.src;
-                        const rect = iframe.getBoundingClientRect();
-                        
-                        if (src && rect.width > 0 && rect.height > 0) {
-                            banners.push({
-                                type: 'iframe',
-                                url: src,
-                                width: Math.ceil(rect.width),
-                                height: Math.ceil(rect.height),
-                                index: index + 1,
-                                title: iframe.title || `Banner ${index + 1}`,
-                                id: iframe.id || `iframe-${index + 1}`
-                            });
-                        }
-                    });
-                    
-                    // Look for embedded banner containers
-                    const containers = document.querySelectorAll('[data-banner-url], [data-src], .banner-container, .ad-container');
-                    containers.forEach((container, index) => {
-                        const bannerUrl = container.getAttribute('data-banner-url') || 
-                                        container.getAttribute('data-src') ||
-                                        container.querySelector('a')?.href;
-                        const rect = container.getBoundingClientRect();
-                        
-                        if (bannerUrl && rect.width > 0 && rect.height > 0) {
-                            banners.push({
-                                type: 'container',
-                                url: bannerUrl,
-                                width: Math.ceil(rect.width),
-                                height: Math.ceil(rect.height),
-                                index: iframes.length + index + 1,
-                                title: container.getAttribute('title') || `Container Banner ${index + 1}`,
-                                id: container.id || `container-${index + 1}`
-                            });
-                        }
-                    });
-                    
-                    // Look for links that might point to banners
-                    const links = document.querySelectorAll('a[href*="banner"], a[href*="creative"], a[href*="ad"], a[href*=".html"]');
-                    links.forEach((link, index) => {
-                        const href = link.href;
-                        const text = link.textContent.trim();
-                        const rect = link.getBoundingClientRect();
-                        
-                        // Only include if it looks like a banner link
-                        if (href && (href.includes('banner') || href.includes('creative') || href.includes('ad') || text.toLowerCase().includes('banner'))) {
-                            banners.push({
-                                type: 'link',
-                                url: href,
-                                width: 0, // Unknown, will auto-detect
-                                height: 0, // Unknown, will auto-detect
-                                index: iframes.length + containers.length + index + 1,
-                                title: text || `Link Banner ${index + 1}`,
-                                id: link.id || `link-${index + 1}`
-                            });
-                        }
-                    });
-                    
-                    // Look for preview thumbnails with data attributes
-                    const thumbnails = document.querySelectorAll('[data-preview-url], .preview-item, .banner-preview');
-                    thumbnails.forEach((thumb, index) => {
-                        const previewUrl = thumb.getAttribute('data-preview-url') ||
-                                         thumb.querySelector('a')?.href;
-                        const rect = thumb.getBoundingClientRect();
-                        
-                        if (previewUrl) {
-                            banners.push({
-                                type: 'preview',
-                                url: previewUrl,
-                                width: Math.ceil(rect.width) || 0,
-                                height: Math.ceil(rect.height) || 0,
-                                index: iframes.length + containers.length + links.length + index + 1,
-                                title: thumb.getAttribute('alt') || thumb.textContent?.trim() || `Preview ${index + 1}`,
-                                id: thumb.id || `preview-${index + 1}`
-                            });
-                        }
-                    });
-                    
-                    return {
-                        totalFound: banners.length,
-                        banners: banners,
-                        pageTitle: document.title,
-                        pageUrl: window.location.href
-                    };
-                }
-            """)
-            
-            return jsonify({
-                'success': True,
-                'previewUrl': preview_url,
-                'pageTitle': banner_info['pageTitle'],
-                'totalBanners': banner_info['totalFound'],
-                'banners': banner_info['banners']
-            })
-            
-        finally:
-            # Clean up resources
-            if page:
-                page.close()
-            if context:
-                context.close()
-            if browser:
-                browser.close()
-            if playwright:
-                playwright.stop()
-            
     except Exception as e:
-        logger.error(f"Error in scan_preview: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in scan_preview: %s", e, exc_info=True)
+        return error_response(ErrorCode.SCAN_PREVIEW_FAILED)
 
 @app.route('/debug-dimensions', methods=['POST'])
+@rate_limited
 def debug_dimensions():
     """Debug endpoint to check detected dimensions without taking screenshot"""
     try:
@@ -2618,190 +3427,123 @@ def debug_dimensions():
         
         # Validate URL or local file path
         try:
-            # Check if it's a local file path
-            if url.startswith('file:///') or (len(url) > 3 and url[1:3] == ':\\'):
-                # Convert Windows path to file URL if needed
-                if not url.startswith('file:///'):
-                    # Handle Windows path like C:\path\to\file
-                    url = 'file:///' + url.replace('\\', '/')
-                
-                # Validate that the file exists
-                file_path = url.replace('file:///', '').replace('/', '\\')
+            local_target = _local_file_target(url)
+            if local_target:
+                url, file_path = local_target
+                # Checked on every request: a file created or removed since must be seen
                 if not os.path.exists(file_path):
                     return jsonify({'error': f'Local file not found: {file_path}'}), 400
-                    
-            else:
-                # Validate regular URL
-                parsed_url = urlparse(url)
-                if not parsed_url.scheme or not parsed_url.netloc:
-                    return jsonify({'error': 'Invalid URL format. Use http://, https://, or local file path'}), 400
+            elif not _URL_WITH_HOST_RE.match(url):
+                return jsonify({'error': 'Invalid URL format. Use http://, https://, or local file path'}), 400
         except Exception:
             return jsonify({'error': 'Invalid URL format'}), 400
         
         # Use screenshot service to detect dimensions
-        playwright = None
-        browser = None
-        context = None
-        page = None
+        actual_dimensions = run_async(screenshot_service.detect_dimensions(url))
+        
+        return jsonify({
+            'success': True,
+            'url': url,
+            'detectedDimensions': actual_dimensions,
+            'recommendedWidth': actual_dimensions['width'],
+            'recommendedHeight': actual_dimensions['height']
+        })
         
-        try:
-            # Get fresh browser context for this request
-            playwright, browser, context = screenshot_service.get_browser_context()
-            page = context.new_page()
-            
-            # Navigate to the URL
-            logger.info(f"Debug: Navigating to: {url}")
-            page.goto(url, wait_until='networkidle', timeout=30000)
-            
-            # Get dimensions using the same logic as screenshot capture
-            actual_dimensions = page.evaluate("""
-                () => {
-                    // Try to find the banner container or body dimensions
-                    const body = document.body;
-                    const html = document.documentElement;
-                    
-                    // Look for common banner container selectors in order of priority
-                    const containers = [
-                        '#mainHolder', '#container', '#main', '#banner-container',
-                        // Hoxton-specific selectors
-                        '.creative-container', '.banner-frame', '.ad-frame', 
-                        '[data-creative]', '[data-banner]', '.hoxton-banner',
-                        // General selectors
-                        'canvas', '.banner', '#banner', '.ad', '#ad', 
-                        '.creative', '#creative', '.container', 'main',
-                        'div[style*="width"]', 'div[style*="height"]',
-                        '.banner-wrap', '.ad-wrap', '.creative-wrap',
-                        // Frame/iframe content
-                        'body > div:first-child', 'body > *:first-child'
-                    ];
-                    
-                    let bannerWidth = 0;
-                    let bannerHeight = 0;
-                    let detectionMethod = 'fallback';
-                    let foundElements = [];
-                    
-                    // Special handling for Hoxton or other banner sharing platforms
-                    const isHoxtonOrSimilar = window.location.hostname.includes('hoxton') || 
-                                            document.querySelector('.creative-container, .banner-frame, [data-creative]');
-                    
-                    // Try to find a container with explicit dimensions
-                    for (const selector of containers) {
-                        const elements = document.querySelectorAll(selector);
-                        for (const element of elements) {
-                            const rect = element.getBoundingClientRect();
-                            const computedStyle = window.getComputedStyle(element);
-                            
-                            foundElements.push({
-                                selector: selector,
-                                width: rect.width,
-                                height: rect.height,
-                                cssWidth: computedStyle.width,
-                                cssHeight: computedStyle.height,
-                                tagName: element.tagName,
-                                id: element.id || 'no-id',
-                                className: element.className || 'no-class'
-                            });
-                            
-                            // Check if element has explicit width/height
-                            if (rect.width > 0 && rect.height > 0) {
-                                // For banner-specific containers, prioritize them highly
-                                if (selector.includes('mainHolder') || selector.includes('container') || 
-                                    selector.includes('banner') || selector.includes('creative') || 
-                                    selector.includes('ad')) {
-                                    bannerWidth = Math.ceil(rect.width);
-                                    bannerHeight = Math.ceil(rect.height);
-                                    detectionMethod = `${selector} (banner container priority)`;
-                                    break;
-                                }
-                                
-                                // Prefer elements with explicit CSS dimensions
-                                const cssWidth = computedStyle.width;
-                                const cssHeight = computedStyle.height;
-                                
-                                if ((cssWidth && cssWidth !== 'auto') || (cssHeight && cssHeight !== 'auto')) {
-                                    bannerWidth = Math.ceil(rect.width);
-                                    bannerHeight = Math.ceil(rect.height);
-                                    detectionMethod = `${selector} (CSS dimensions)`;
-                                    break;
-                                }
-                                
-                                // If no CSS dimensions but has reasonable banner size, use it
-                                if (rect.width < 2000 && rect.height < 2000 && 
-                                    rect.width > 50 && rect.height > 50) {
-                                    bannerWidth = Math.ceil(rect.width);
-                                    bannerHeight = Math.ceil(rect.height);
-                                    detectionMethod = `${selector} (computed size)`;
-                                    break;
-                                }
-                            }
-                        }
-                        if (bannerWidth > 0 && bannerHeight > 0) break;
-                    }
-                    
-                    // Fallback to body/viewport dimensions if no container found
-                    if (bannerWidth === 0 || bannerHeight === 0) {
-                        const viewportWidth = window.innerWidth;
-                        const viewportHeight = window.innerHeight;
-                        const bodyRect = body.getBoundingClientRect();
-                        const htmlRect = html.getBoundingClientRect();
-                        
-                        // Use the smallest reasonable dimensions
-                        bannerWidth = Math.min(viewportWidth, bodyRect.width || viewportWidth, htmlRect.width || viewportWidth);
-                        bannerHeight = Math.min(viewportHeight, bodyRect.height || viewportHeight, htmlRect.height || viewportHeight);
-                        
-                        // Clamp to reasonable banner sizes
-                        bannerWidth = Math.max(100, Math.min(bannerWidth, 2000));
-                        bannerHeight = Math.max(100, Math.min(bannerHeight, 2000));
-                        
-                        detectionMethod = 'viewport/body fallback';
-                    }
-                    
-                    return {
-                        width: bannerWidth,
-                        height: bannerHeight,
-                        detectionMethod: detectionMethod,
-                        viewportWidth: window.innerWidth,
-                        viewportHeight: window.innerHeight,
-                        bodyWidth: body.getBoundingClientRect().width,
-                        bodyHeight: body.getBoundingClientRect().height,
-                        foundElements: foundElements
-                    };
-                }
-            """)
-            
-            return jsonify({
-                'success': True,
-                'url': url,
-                'detectedDimensions': actual_dimensions,
-                'recommendedWidth': actual_dimensions['width'],
-                'recommendedHeight': actual_dimensions['height']
-            })
-            
-        finally:
-            # Clean up resources
-            if page:
-                page.close()
-            if context:
-                context.close()
-            if browser:
-                browser.close()
-            if playwright:
-                playwright.stop()
-            
     except Exception as e:
-        logger.error(f"Error in debug_dimensions: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in debug_dimensions: %s", e, exc_info=True)
+        return error_response(ErrorCode.DEBUG_DIMENSIONS_FAILED)
+
+# Everything but the timestamp is fixed for the life of the process, so serialize it once
+_HEALTH_PREFIX = json.dumps({'status': 'healthy', 'playwright_available': PLAYWRIGHT_AVAILABLE})[:-1].encode()
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'playwright_available': PLAYWRIGHT_AVAILABLE,
-        'timestamp': datetime.now().isoformat()
-    })
+    # Queue depth lets autoscalers see backpressure before requests get shed
+    body = (_HEALTH_PREFIX
+            + b', "active_captures": ' + str(screenshot_service.active).encode()
+            + b', "queued_captures": ' + str(screenshot_service.queued).encode()
+            + b', "timestamp": "' + datetime.now().isoformat().encode() + b'"}')
+    return Response(body, mimetype='application/json', headers={'Cache-Control': 'no-store'})
+
+@app.route('/ready')
+def readiness_check():
+    """Readiness probe: 503 until this worker's browser pool has been warmed"""
+    if screenshot_service.warm:
+        return jsonify({'status': 'ready'})
+    status = screenshot_service.warmup_error or 'warming'
+    return jsonify({'status': status}), 503
+
+async def _capture_batch_item(i, url_data, settings, session):
+    """Capture a single entry of a batch request, returning a result or error dict"""
+    if isinstance(url_data, str):
+        url = url_data
+        url_settings = settings
+    else:
+        url = url_data.get('url')
+        url_settings = {**settings, **url_data.get('settings', {})}
+    
+    try:
+        width = url_settings.get('width', 1200)
+        height = url_settings.get('height', 630)
+        format = url_settings.get('format', 'png')
+        wait_time = url_settings.get('waitTime', 3)
+        
+        skip_transcode = format == NATIVE_SCREENSHOT_FORMAT
+        
+        # Capture screenshot first to get banner info
+        result = await screenshot_service.capture_screenshot(url, width, height, format, wait_time, skip_transcode,
+                                                             session=session)
+        
+        # Generate descriptive filename using banner info, named after the format actually returned
+        banner_info = result.get('detectedDimensions', {})
+        actual_format = result.get('format', 'jpeg')
+        file_extension = 'jpg' if actual_format == 'jpeg' else actual_format
+        filename = generate_banner_filename(banner_info, url, file_extension, i)
+        result['filename'] = filename
+        result['index'] = i
+        return result
+        
+    except Exception as e:
+        logger.error("Error capturing %s: %s", url, e, exc_info=True)
+        return {
+            'success': False,
+            'error': ERROR_MESSAGES[ErrorCode.CAPTURE_FAILED],
+            'error_code': int(ErrorCode.CAPTURE_FAILED),
+            'url': url,
+            'index': i
+        }
+
+async def _capture_batch(urls, settings):
+    """Capture every URL of a batch concurrently, preserving request order"""
+    # Take resources in the same order as a single capture - a capture slot, then the browser -
+    # and only take more slots while holding the browser if they are free right away. A batch
+    # never waits for a slot while holding a browser, so batches and singles cannot deadlock.
+    await screenshot_service.acquire_slot()
+    slots = 1
+    try:
+        # One browser context serves the whole batch, each URL just opens a page in it, so a
+        # batch holds a single pooled browser (or launches one, without the pool)
+        session = await screenshot_service.get_browser_context(pages=len(urls))
+        try:
+            while slots < len(urls) and await screenshot_service.try_acquire_slot():
+                slots += 1
+            # The batch's URLs share the slots it holds
+            batch_slots = asyncio.Semaphore(slots)
+            
+            async def capture_item(i, url_data):
+                async with batch_slots:
+                    return await _capture_batch_item(i, url_data, settings, session)
+            
+            return await asyncio.gather(*(capture_item(i, url_data) for i, url_data in enumerate(urls)))
+        finally:
+            await screenshot_service.release_browser_context(*session)
+    finally:
+        for _ in range(slots):
+            screenshot_service.release_slot()
 
 @app.route('/batch-capture', methods=['POST'])
+@rate_limited
 def batch_capture():
     """API endpoint to capture multiple screenshots"""
     try:
@@ -2819,110 +3561,123 @@ def batch_capture():
         if len(urls) > 20:  # Limit batch size
             return jsonify({'error': 'Maximum 20 URLs allowed per batch'}), 400
         
-        results = []
+        # Shed the whole batch up front rather than failing part of it
+        if not screenshot_service.has_capacity(len(urls)):
+            logger.warning(f"🚦 Shedding /batch-capture of {len(urls)} URLs: capture queue full")
+            return too_many_requests('Server busy, please retry shortly', 5)
         
-        # Process each URL
-        for i, url_data in enumerate(urls):
-            if isinstance(url_data, str):
-                url = url_data
-                url_settings = settings
-            else:
-                url = url_data.get('url')
-                url_settings = {**settings, **url_data.get('settings', {})}
-            
-            try:
-                width = url_settings.get('width', 1200)
-                height = url_settings.get('height', 630)
-                format = url_settings.get('format', 'png')
-                wait_time = url_settings.get('waitTime', 3)
-                
-                # Capture screenshot first to get banner info
-                result = screenshot_service.capture_screenshot(url, width, height, format, wait_time)
-                
-                # Generate descriptive filename using banner info
-                banner_info = result.get('detectedDimensions', {})
-                filename = generate_banner_filename(banner_info, url, format, i)
-                result['filename'] = filename
-                result['index'] = i
-                results.append(result)
-                
-            except Exception as e:
-                logger.error(f"Error capturing {url}: {str(e)}")
-                results.append({
-                    'success': False,
-                    'error': str(e),
-                    'url': url,
-                    'index': i
-                })
+        # Capture all URLs concurrently on the capture slots the batch can get
+        try:
+            results = run_async(_capture_batch(urls, settings))
+        except ServerBusyError as e:
+            logger.warning("🚦 Shedding /batch-capture: %s", e)
+            return too_many_requests('Server busy, please retry shortly', 5)
+        
+        successful = len([r for r in results if r.get('success')])
         
         return jsonify({
             'success': True,
             'results': results,
             'total': len(urls),
-            'successful': len([r for r in results if r.get('success')])
+            'successful': successful
         })
         
     except Exception as e:
-        logger.error(f"Error in batch_capture: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error("Error in batch_capture: %s", e, exc_info=True)
+        return error_response(ErrorCode.BATCH_CAPTURE_FAILED)
+
 
+class _ZipStreamWriter(io.RawIOBase):
+    """Unseekable sink that collects ZIP bytes until the response generator drains them"""
+    def __init__(self):
+        self.chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+# Image formats are already compressed; deflating them again only burns CPU
+_STORED_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.webp', '.gif'})
+
+def _json_zip_entries(images):
+    """Yield (index, filename, loader) for base64 data-URL images posted as JSON"""
+    for i, image_data in enumerate(images):
+        if 'data' not in image_data or 'filename' not in image_data:
+            continue
+        yield i, image_data['filename'], lambda data=image_data['data']: base64.b64decode(data.split(',')[1])
+
+def _upload_zip_entries(uploads):
+    """Yield (index, filename, loader) for (filename, bytes) pairs read from multipart file parts"""
+    for i, (filename, image_bytes) in enumerate(uploads):
+        yield i, filename, lambda data=image_bytes: data
+
+def _stream_zip(entries):
+    """Yield a ZIP archive of the given image entries one entry at a time"""
+    sink = _ZipStreamWriter()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for i, filename, load_bytes in entries:
+            try:
+                image_bytes = load_bytes()
+                original_filename = filename or f'banner_{i+1}.png'
+                
+                # Clean filename for ZIP consistency
+                cleaned_filename = clean_filename_for_zip(original_filename)
+                
+                extension = os.path.splitext(cleaned_filename)[1].lower()
+                compress_type = zipfile.ZIP_STORED if extension in _STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                zip_file.writestr(cleaned_filename, image_bytes, compress_type=compress_type)
+            except Exception as e:
+                logging.error("Failed to add image %s to ZIP: %s", i, e, exc_info=True)
+                continue
+            
+            yield sink.drain()
+    
+    # Central directory is written when the archive closes
+    yield sink.drain()
 
 @app.route('/download-zip', methods=['POST'])
 def download_zip():
     """Create a ZIP file from multiple images"""
     try:
         # Log all request details for debugging
-        logging.info(f"🔍 ZIP Download Request Received:")
-        logging.info(f"   - Method: {request.method}")
-        logging.info(f"   - Content-Type: {request.content_type}")
-        logging.info(f"   - User-Agent: {request.headers.get('User-Agent', 'Unknown')}")
-        
-        data = request.get_json()
-        if not data or 'images' not in data:
-            return jsonify({'error': 'No images provided'}), 400
+        logging.info("🔍 ZIP Download Request Received:")
+        logging.info("   - Method: %s", request.method)
+        logging.info("   - Content-Type: %s", request.content_type)
+        logging.info("   - User-Agent: %s", request.headers.get('User-Agent', 'Unknown'))
+        
+        if request.mimetype == 'multipart/form-data':
+            # Raw file parts go straight into the archive with no base64 decode. They are read here
+            # because Flask closes uploaded files once the view returns, before the stream runs.
+            images = [(upload.filename, upload.read()) for upload in request.files.getlist('images')]
+            entries = _upload_zip_entries(images)
+        else:
+            data = request.get_json()
+            if not data or 'images' not in data:
+                return jsonify({'error': 'No images provided'}), 400
+            images = data['images']
+            entries = _json_zip_entries(images)
         
-        images = data['images']
         if not images:
             return jsonify({'error': 'Empty images list'}), 400
         
-        logging.info(f"   - Number of images: {len(images)}")
-        
-        # Create a BytesIO object to store the ZIP in memory
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for i, image_data in enumerate(images):
-                if 'data' not in image_data or 'filename' not in image_data:
-                    continue
-                
-                # Decode base64 image data
-                try:
-                    image_bytes = base64.b64decode(image_data['data'].split(',')[1])
-                    original_filename = image_data['filename'] or f'banner_{i+1}.png'
-                    
-                    # Clean filename for ZIP consistency
-                    cleaned_filename = clean_filename_for_zip(original_filename)
-                    
-                    zip_file.writestr(cleaned_filename, image_bytes)
-                except Exception as e:
-                    logging.error(f"Failed to add image {i} to ZIP: {str(e)}")
-                    continue
-        
-        zip_buffer.seek(0)
+        logging.info("   - Number of images: %s", len(images))
         
         # Generate simple backup filename without timestamp
         zip_filename = 'backup.zip'
         
         # Log the filename being used
-        logging.info(f"📦 ZIP Download - Generated filename: {zip_filename}")
-        
-        # Create response with explicit headers using multiple methods to ensure compatibility
-        response = send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=zip_filename,
-            mimetype='application/zip'
-        )
+        logging.info("📦 ZIP Download - Generated filename: %s", zip_filename)
+        
+        # Stream the archive so bytes go out as each image is added instead of after the whole ZIP is built
+        response = Response(_stream_zip(entries), mimetype='application/zip')
         
         # Try multiple header formats for maximum browser compatibility
         response.headers['Content-Disposition'] = f'attachment; filename="{zip_filename}"; filename*=UTF-8\'\'{zip_filename}'
@@ -2931,13 +3686,14 @@ def download_zip():
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         
-        logging.info(f"📦 Response headers set: {dict(response.headers)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logging.debug("📦 Response headers set: %s", dict(response.headers))
         
         return response
         
     except Exception as e:
-        logging.error(f"ZIP download error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logging.error("ZIP download error: %s", e, exc_info=True)
+        return error_response(ErrorCode.ZIP_DOWNLOAD_FAILED)
 
 
 if __name__ == '__main__':
@@ -2958,16 +3714,35 @@ if __name__ == '__main__':
     print("🔧 Health Check: http://localhost:5000/health")
     print("=" * 50)
 
-    try:
-        # Use Railway's PORT environment variable, fallback to 5000 for local development
-        port = int(os.environ.get('PORT', 5000))
-        print(f"🚀 Starting server on port {port}")
-        app.run(host='0.0.0.0', port=port, debug=True)
-    except KeyboardInterrupt:
-        print("\n🛑 Server stopped by user")
-    finally:
-        # Cleanup
-        try:
-            screenshot_service.cleanup()
-        except:
-            pass
\ No newline at end of file
+    # Use Railway's PORT environment variable, fallback to 5000 for local development
+    port = int(os.environ.get('PORT', 5000))
+
+    if shutil.which('gunicorn'):
+        # Hand the process over to gunicorn; threaded workers let captures run side by side
+        workers = int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1))
+        threads = int(os.environ.get('GUNICORN_THREADS', 8))
+        # Behind a local reverse proxy a UNIX socket skips the loopback TCP stack
+        if os.environ.get('USE_UDS') == '1':
+            bind = f"unix:{os.environ.get('UDS_PATH', '/tmp/banner.sock')}"
+        else:
+            bind = f'0.0.0.0:{port}'
+        print(f"🚀 Starting gunicorn on {bind} with {workers} workers x {threads} threads")
+        os.execvp('gunicorn', [
+            'gunicorn',
+            '-w', str(workers),
+            '-k', 'gthread',
+            '--threads', str(threads),
+            '-b', bind,
+            '--timeout', '120',
+            'wsgi:application'
+        ])
+
+    # gunicorn is unavailable (e.g. on Windows) - fall back to the threaded Flask server
+    print(f"🚀 Starting server on port {port}")
+    screenshot_service.start_warm_up()
+    from werkzeug.serving import BaseWSGIServer
+    BaseWSGIServer.request_queue_size = int(os.environ.get('LISTEN_BACKLOG', 2048))
+    # No in-process reloader: it double-imports the app and fights the browser pool lifecycle.
+    # For auto-restart in development use: watchmedo auto-restart -d . -p '*.py' -- python app.py
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True,
+            use_reloader=False, use_debugger=False)
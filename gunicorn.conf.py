@@ -0,0 +1,32 @@
+"""gunicorn settings, loaded automatically from the working directory"""
+import os
+
+# Queue bursts of connections instead of dropping SYNs; the kernel clamps this to net.core.somaxconn
+backlog = int(os.environ.get('LISTEN_BACKLOG', 2048))
+
+# Keep idle connections open so pollers skip the TCP/TLS handshake on every request
+keepalive = 30
+worker_connections = 1000
+
+# Import the app once in the master and share its pages copy-on-write with the workers.
+# Nothing at import time starts threads, event loops or browsers, so this is fork-safe.
+preload_app = True
+
+if os.environ.get('USE_UDS') == '1':
+    # Socket file becomes srw-rw---- so only the proxy's group can connect
+    umask = 0o117
+    user = os.environ.get('GUNICORN_USER')
+    group = os.environ.get('GUNICORN_GROUP')
+
+
+def post_fork(server, worker):
+    """Start the worker's own Playwright event loop and warm its browser pool; threads never survive the fork"""
+    from app import get_event_loop, screenshot_service
+    get_event_loop()
+    screenshot_service.start_warm_up()
+
+
+def worker_exit(server, worker):
+    """Close the worker's pooled browsers so no Chromium processes outlive it"""
+    from app import screenshot_service
+    screenshot_service.cleanup()
@@ -1024,19 +1024,19 @@ ${result.test_result.hoxtonElements.length === 0 ?
         try {
             this.showNotification('Preparing ZIP download...', 'info');
             
-            // Prepare images for ZIP
-            const images = completedItems.map(item => ({
-                data: `data:${item.format === 'png' ? 'image/png' : 'image/jpeg'};base64,${item.imageData}`,
-                filename: this.cleanFilename(item.filename || `banner_${Math.random().toString(36).substr(2, 9)}.${item.format || 'png'}`)
-            }));
+            // Prepare images for ZIP as raw file parts (no base64 inflation on the wire)
+            const formData = new FormData();
+            completedItems.forEach(item => {
+                const bytes = Uint8Array.from(atob(item.imageData), c => c.charCodeAt(0));
+                const type = item.format === 'png' ? 'image/png' : 'image/jpeg';
+                const filename = this.cleanFilename(item.filename || `banner_${Math.random().toString(36).substr(2, 9)}.${item.format || 'png'}`);
+                formData.append('images', new Blob([bytes], { type }), filename);
+            });
 
-            // Send to backend for ZIP creation
+            // Send to backend for ZIP creation; the browser sets the multipart boundary header
             const response = await fetch('/download-zip', {
                 method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ images })
+                body: formData
             });
 
             if (!response.ok) {
@@ -0,0 +1,10 @@
+#!/bin/bash
+# Shared headless Chromium for all gunicorn workers.
+# Start this first, then run the app with CDP_ENDPOINT=http://127.0.0.1:9222
+exec "${CHROMIUM_BIN:-chromium}" \
+    --headless=new \
+    --remote-debugging-address=127.0.0.1 \
+    --remote-debugging-port="${CDP_PORT:-9222}" \
+    --no-sandbox \
+    --disable-dev-shm-usage \
+    --disable-gpu
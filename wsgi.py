@@ -0,0 +1,2 @@
+"""WSGI entry point for production servers (gunicorn wsgi:application)"""
+from app import app as application